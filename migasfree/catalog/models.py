@@ -5,12 +5,13 @@ import os
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.db import models
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
 from markdownx.models import MarkdownxField
 
+from ..server.cache import CompiledCache
 from ..server.models import Project, Attribute, MigasLink
 from ..server.utils import to_list
 
@@ -242,39 +243,21 @@ class Policy(models.Model, MigasLink):
         return _packages
 
     @staticmethod
-    def get_packages(computer):
-        to_install = []
-        to_remove = []
-
-        for policy in Policy.objects.filter(enabled=True):
-            if policy.belongs_excluding(
-                    computer,
-                    policy.included_attributes.all(),
-                    policy.excluded_attributes.all()
-            ):
-                for group in PolicyGroup.objects.filter(
-                        policy=policy
-                ).order_by('priority'):
-                    if policy.belongs_excluding(
-                            computer,
-                            group.included_attributes.all(),
-                            group.excluded_attributes.all()
-                    ):
-                        for pkgs in group.applications.filter(
-                                packages_by_project__project__id=computer.project.id
-                        ).values_list(
-                            'packages_by_project__packages_to_install',
-                            flat=True
-                        ):
-                            to_install.extend(to_list(pkgs))
-
-                        if policy.exclusive:
-                            to_remove.extend(
-                                policy.get_packages_to_remove(group, computer.project.id)
-                            )
-                        break
+    def get_packages(computer, attributes=None):
+        """
+        :param attributes: sync attribute ids of computer (optional)
+        :return: (packages to install, packages to remove)
+        """
+        if attributes is None:
+            attributes = computer.sync_attributes.values_list('id', flat=True)
+
+        return compiled_policies.get().get_packages(
+            computer.project_id, set(attributes)
+        )
 
-        return to_install, to_remove
+    @staticmethod
+    def compile(key=None):
+        return CompiledPolicies()
 
     class Meta:
         app_label = 'catalog'
@@ -328,6 +311,142 @@ class PolicyGroup(models.Model, MigasLink):
         ordering = ['policy__name', 'priority']
 
 
+class CompiledRule(object):
+    """
+    Included/excluded attributes (attribute 1 = All Systems)
+    """
+    def __init__(self, included, excluded):
+        self.included = frozenset(included)
+        self.excluded = frozenset(excluded)
+        self.all_included = 1 in self.included
+        self.all_excluded = 1 in self.excluded
+
+    def belongs(self, attributes):
+        if self.all_excluded or not self.excluded.isdisjoint(attributes):
+            return False
+
+        return self.all_included or not self.included.isdisjoint(attributes)
+
+
+class CompiledPolicies(object):
+    """
+    Enabled policies with their groups (by priority) and, for each group,
+    the packages to install by project
+    """
+    def __init__(self):
+        policies = list(
+            Policy.objects.filter(enabled=True).values_list('id', 'exclusive')
+        )
+        groups = list(PolicyGroup.objects.filter(
+            policy__enabled=True
+        ).order_by('policy_id', 'priority').values_list('id', 'policy_id'))
+        group_ids = [pk for pk, _policy_id in groups]
+
+        policy_included = self._relation(Policy.included_attributes.through, 'policy_id')
+        policy_excluded = self._relation(Policy.excluded_attributes.through, 'policy_id')
+        group_included = self._relation(
+            PolicyGroup.included_attributes.through, 'policygroup_id', group_ids
+        )
+        group_excluded = self._relation(
+            PolicyGroup.excluded_attributes.through, 'policygroup_id', group_ids
+        )
+
+        packages = {}  # application_id: {project_id: [packages]}
+        for application_id, project_id, pkgs in PackagesByProject.objects.values_list(
+            'application_id', 'project_id', 'packages_to_install'
+        ):
+            packages.setdefault(application_id, {})[project_id] = to_list(pkgs)
+
+        group_packages = {}  # group_id: {project_id: [packages]}
+        for group_id, application_id in PolicyGroup.applications.through.objects.filter(
+            policygroup_id__in=group_ids
+        ).order_by('id').values_list('policygroup_id', 'application_id'):
+            target = group_packages.setdefault(group_id, {})
+            for project_id, pkgs in packages.get(application_id, {}).items():
+                target.setdefault(project_id, []).extend(pkgs)
+
+        policy_groups = {}
+        for pk, policy_id in groups:
+            policy_groups.setdefault(policy_id, []).append((
+                CompiledRule(group_included.get(pk, []), group_excluded.get(pk, [])),
+                group_packages.get(pk, {})
+            ))
+
+        # [(rule, exclusive, [(rule, {project_id: [packages]}), ...]), ...]
+        self.policies = [
+            (
+                CompiledRule(policy_included.get(pk, []), policy_excluded.get(pk, [])),
+                exclusive,
+                policy_groups.get(pk, [])
+            ) for pk, exclusive in policies
+        ]
+
+        # attributes of the rules (the rest do not change packages)
+        attributes = set()
+        for rule, _exclusive, groups in self.policies:
+            attributes.update(rule.included, rule.excluded)
+            for group_rule, _packages in groups:
+                attributes.update(group_rule.included, group_rule.excluded)
+        self.attributes = frozenset(attributes)
+
+    @staticmethod
+    def _relation(model, field, ids=None):
+        queryset = model.objects.all()
+        if ids is not None:
+            queryset = queryset.filter(**{'{}__in'.format(field): ids})
+
+        ret = {}
+        for pk, attribute_id in queryset.values_list(field, 'attribute_id'):
+            ret.setdefault(pk, []).append(attribute_id)
+
+        return ret
+
+    def get_packages(self, project_id, attributes):
+        to_install = []
+        to_remove = []
+
+        for rule, exclusive, groups in self.policies:
+            if not rule.belongs(attributes):
+                continue
+
+            for index, (group_rule, packages) in enumerate(groups):
+                if group_rule.belongs(attributes):
+                    to_install.extend(packages.get(project_id, []))
+
+                    if exclusive:
+                        for other, (_rule, other_packages) in enumerate(groups):
+                            if other != index:
+                                to_remove.extend(other_packages.get(project_id, []))
+                    break
+
+        return to_install, to_remove
+
+
+compiled_policies = CompiledCache('policies', Policy.compile)
+
+
+@receiver(post_save, sender=Policy)
+@receiver(post_delete, sender=Policy)
+@receiver(post_save, sender=PolicyGroup)
+@receiver(post_delete, sender=PolicyGroup)
+@receiver(post_save, sender=PackagesByProject)
+@receiver(post_delete, sender=PackagesByProject)
+@receiver(post_delete, sender=Application)
+@receiver(post_delete, sender=Attribute)
+def invalidate_policies(sender, **kwargs):
+    compiled_policies.invalidate()
+
+
+@receiver(m2m_changed, sender=Policy.included_attributes.through)
+@receiver(m2m_changed, sender=Policy.excluded_attributes.through)
+@receiver(m2m_changed, sender=PolicyGroup.included_attributes.through)
+@receiver(m2m_changed, sender=PolicyGroup.excluded_attributes.through)
+@receiver(m2m_changed, sender=PolicyGroup.applications.through)
+def invalidate_policies_relations(sender, action, **kwargs):
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        compiled_policies.invalidate()
+
+
 @receiver(pre_save, sender=Application)
 def pre_save_application(sender, instance, **kwargs):
     if not instance.pk and not hasattr(instance, _UNSAVED_IMAGEFIELD):
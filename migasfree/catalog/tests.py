@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import unittest
+
+from django.test import TransactionTestCase
+
+from ..server.fixtures import create_initial_data, sequence_reset
+from ..server.models import Attribute, Computer, Platform, Pms, Project, Property
+from ..server.utils import to_list
+from .models import Application, PackagesByProject, Policy, PolicyGroup
+
+
+def legacy_get_packages(computer):
+    """
+    Policy.get_packages before compiling policies (one query per rule)
+    """
+    to_install = []
+    to_remove = []
+
+    for policy in Policy.objects.filter(enabled=True):
+        if policy.belongs_excluding(
+                computer,
+                policy.included_attributes.all(),
+                policy.excluded_attributes.all()
+        ):
+            for group in PolicyGroup.objects.filter(
+                    policy=policy
+            ).order_by('priority'):
+                if policy.belongs_excluding(
+                        computer,
+                        group.included_attributes.all(),
+                        group.excluded_attributes.all()
+                ):
+                    for pkgs in group.applications.filter(
+                            packages_by_project__project__id=computer.project.id
+                    ).values_list(
+                        'packages_by_project__packages_to_install',
+                        flat=True
+                    ):
+                        to_install.extend(to_list(pkgs))
+
+                    if policy.exclusive:
+                        to_remove.extend(
+                            policy.get_packages_to_remove(group, computer.project.id)
+                        )
+                    break
+
+    return to_install, to_remove
+
+
+class PolicyTestCase(TransactionTestCase):
+    POLICIES = 50
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        create_initial_data()
+        sequence_reset()
+
+        project = Project.objects.create(
+            'UBUNTU',
+            Pms.objects.get(name='apt-get'),
+            Platform.objects.create('Linux')
+        )
+        self.computer = Computer.objects.create(
+            'PC1', project, '11223344-5566-7788-9900-AABBCCDDEEFF'
+        )
+
+        property_att = Property.objects.create(
+            name='TEST', prefix='TST', kind='N', sort='client'
+        )
+        attributes = [
+            Attribute.objects.create(property_att, 'value{}'.format(i))
+            for i in range(10)
+        ]
+        self.computer.sync_attributes.add(*attributes[:5])
+
+        for i in range(self.POLICIES):
+            policy = Policy.objects.create(
+                name='policy{}'.format(i), exclusive=bool(i % 2)
+            )
+            policy.included_attributes.add(attributes[i % 10])
+            if i % 7 == 0:
+                policy.excluded_attributes.add(attributes[(i + 1) % 10])
+
+            for priority in range(2):
+                application = Application.objects.create(
+                    name='app{}-{}'.format(i, priority)
+                )
+                PackagesByProject.objects.create(
+                    application, project, 'pkg{}-{} common{}'.format(i, priority, i)
+                )
+
+                group = PolicyGroup.objects.create(policy=policy, priority=priority)
+                group.included_attributes.add(attributes[(i + priority) % 10])
+                group.applications.add(application)
+
+    def test_get_packages(self):
+        attributes = list(self.computer.sync_attributes.values_list('id', flat=True))
+        packages = Policy.get_packages(self.computer, attributes)  # compiles policies
+        self.assertEqual(packages, legacy_get_packages(self.computer))
+        self.assertIn('pkg2-0', packages[0])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Policy.get_packages(self.computer, attributes), packages)
+
+        policy = Policy.objects.get(name='policy2')
+        policy.enabled = False
+        policy.save()  # compiled again on next use
+        packages = Policy.get_packages(self.computer, attributes)
+        self.assertEqual(packages, legacy_get_packages(self.computer))
+        self.assertNotIn('pkg2-0', packages[0])
+
+
+@unittest.skipUnless(
+    os.environ.get('MIGASFREE_BENCHMARK'),
+    'set MIGASFREE_BENCHMARK=1 to run benchmarks'
+)
+class PolicyBenchmarkTestCase(PolicyTestCase):
+    POLICIES = int(os.environ.get('MIGASFREE_BENCHMARK_POLICIES', 500))
+
+    def test_benchmark(self):
+        start = time.time()
+        expected = legacy_get_packages(self.computer)
+        legacy_time = time.time() - start
+
+        attributes = list(self.computer.sync_attributes.values_list('id', flat=True))
+        Policy.get_packages(self.computer, attributes)  # compiles policies
+
+        start = time.time()
+        with self.assertNumQueries(0):
+            result = Policy.get_packages(self.computer, attributes)
+        compiled_time = time.time() - start
+
+        self.assertEqual(result, expected)
+        self.assertLess(compiled_time, legacy_time)
+        print(
+            '\n{} policies: legacy {:.4f}s, compiled {:.4f}s'.format(
+                self.POLICIES, legacy_time, compiled_time
+            )
+        )
@@ -18,14 +18,15 @@ from .migasfree import MigasAdmin, MigasCheckAdmin, MigasFields
 
 from ..filters import (
     ProductiveFilterSpec, UserFaultFilter,
-    SoftwareInventoryFilter, SyncEndDateFilter, ProjectFilterAdmin, PlatformFilterAdmin
+    SoftwareInventoryFilter, SoftwarePackageFilter, SyncEndDateFilter,
+    ProjectFilterAdmin, PlatformFilterAdmin
 )
 from ..forms import ComputerForm, FaultDefinitionForm
 from ..resources import ComputerResource
 from ..models import (
     AutoCheckError, Computer, Error, Fault, FaultDefinition, Message,
     Migration, Notification, StatusLog, Synchronization, User, DeviceLogical,
-    HwNode, Attribute,
+    HwNode, Attribute, UploadJob,
 )
 
 
@@ -60,6 +61,7 @@ class ComputerAdmin(AjaxSelectAdmin, MigasAdmin):
         ('status', ProductiveFilterSpec),
         'machine',
         SoftwareInventoryFilter,
+        SoftwarePackageFilter,
         SyncEndDateFilter,
     )
     search_fields = settings.MIGASFREE_COMPUTER_SEARCH_FIELDS + (
@@ -75,8 +77,10 @@ class ComputerAdmin(AjaxSelectAdmin, MigasAdmin):
         'ip_address',
         'forwarded_ip_address',
         'software_inventory',
-        'software_history',
+        'get_software_history',
         'hw_link',
+        'hardware_digest',
+        'last_hardware_change',
         'machine',
         'cpu',
         'ram',
@@ -132,12 +136,14 @@ class ComputerAdmin(AjaxSelectAdmin, MigasAdmin):
         }),
         (_('Software'), {
             'classes': ('collapse',),
-            'fields': ('software_inventory', 'software_history',)
+            'fields': ('software_inventory', 'get_software_history',)
         }),
         (_('Hardware'), {
             'classes': ('collapse',),
             'fields': (
                 'last_hardware_capture',
+                'last_hardware_change',
+                'hardware_digest',
                 'hw_link',
                 'uuid',
                 'machine',
@@ -606,3 +612,51 @@ class HwNodeAdmin(MigasAdmin):  # TODO to hardware.py
     computer_link = MigasFields.link(
         model=HwNode, name='computer', order='computer__name'
     )
+
+
+@admin.register(UploadJob)
+class UploadJobAdmin(MigasAdmin):
+    list_display = (
+        'created_at', 'computer_link', 'command', 'status',
+        'attempts', 'next_attempt_at', 'lag',
+    )
+    list_display_links = ('created_at',)
+    list_select_related = ('computer',)
+    list_filter = ('status', 'command', 'created_at')
+    ordering = ('id',)
+    search_fields = add_computer_search_fields(['command'])
+    readonly_fields = (
+        'computer_link', 'command', 'status', 'attempts',
+        'next_attempt_at', 'error', 'created_at',
+    )
+    exclude = ('computer', 'payload')
+    actions = ['retry']
+
+    computer_link = MigasFields.link(
+        model=UploadJob, name='computer', order='computer__name'
+    )
+
+    def changelist_view(self, request, extra_context=None):
+        stats = UploadJob.objects.stats()
+        messages.info(
+            request,
+            _('Queue depth: %(depth)d, lag: %(lag)d seconds, failed: %(failed)d') % stats
+        )
+
+        return super(UploadJobAdmin, self).changelist_view(request, extra_context)
+
+    def retry(self, request, queryset):
+        queryset.update(
+            status=UploadJob.STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=None
+        )
+
+        messages.success(request, _('Jobs queued again'))
+
+        return redirect(request.get_full_path())
+
+    retry.short_description = _("Retry")
+
+    def has_add_permission(self, request):
+        return False
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.core.exceptions import PermissionDenied
 from django.http import HttpResponseRedirect
 from django.shortcuts import redirect, render
@@ -18,7 +18,7 @@ from ..models import (
     Attribute, AttributeSet, ClientProperty, ClientAttribute, Computer,
     Notification, Package, Platform, Pms, Property, Query, Deployment, InternalSource, ExternalSource, Schedule,
     ScheduleDelay, Store, ServerAttribute, ServerProperty, UserProfile, Project,
-    Domain, Scope,
+    Domain, Scope, RepositoryBuild,
 )
 
 from ..forms import (
@@ -37,8 +37,9 @@ from ..resources import AttributeResource
 
 from ..utils import compare_list_values
 from ..tasks import (
-    create_repository_metadata,
-    remove_repository_metadata
+    remove_repository_metadata,
+    request_repository_metadata,
+    rollback_repository_metadata
 )
 
 
@@ -359,7 +360,7 @@ class DeploymentAdmin(AjaxSelectAdmin, MigasAdmin):
     list_filter = ('enabled', ('project', ProjectFilterAdmin), DomainFilter, 'source')
     search_fields = ('name', 'available_packages__name')
     list_select_related = ('project',)
-    actions = ['regenerate_metadata']
+    actions = ['regenerate_metadata', 'rollback_metadata']
     readonly_fields = ('timeline',)
 
     fieldsets = (
@@ -421,10 +422,20 @@ class DeploymentAdmin(AjaxSelectAdmin, MigasAdmin):
 
         for deploy in objects:
             if deploy.source == Deployment.SOURCE_INTERNAL:
-                create_repository_metadata(deploy, request=request)
+                request_repository_metadata(deploy, request=request)
 
     regenerate_metadata.short_description = _("Regenerate metadata")
 
+    def rollback_metadata(self, request, objects):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+
+        for deploy in objects:
+            if deploy.source == Deployment.SOURCE_INTERNAL:
+                rollback_repository_metadata(deploy, request=request)
+
+    rollback_metadata.short_description = _("Roll back metadata")
+
     def save_model(self, request, obj, form, change):
         is_new = (obj.pk is None)
         has_name_changed = form.initial.get('name') != obj.name
@@ -448,7 +459,11 @@ class DeploymentAdmin(AjaxSelectAdmin, MigasAdmin):
                         packages_after
                     ) is False) or has_name_changed
         ):
-            create_repository_metadata(obj, packages_after, request)
+            # renamed repositories are built now (old one is removed)
+            request_repository_metadata(
+                obj, packages_after, request,
+                wait=has_name_changed and not is_new
+            )
 
             # delete old repository by name change
             if has_name_changed and not is_new:
@@ -641,6 +656,40 @@ class ExternalSourceAdmin(DeploymentAdmin):
     my_enabled = MigasFields.boolean(model=ExternalSource, name='enabled')
 
 
+@admin.register(RepositoryBuild)
+class RepositoryBuildAdmin(MigasAdmin):
+    list_display = (
+        'requested_at', 'deployment_link', 'status', 'requests',
+        'not_before', 'started_at', 'duration',
+    )
+    list_display_links = ('requested_at',)
+    list_select_related = ('deployment',)
+    list_filter = ('status', ('deployment__project', ProjectFilterAdmin), 'requested_at')
+    ordering = ('-id',)
+    search_fields = ('deployment__name',)
+    readonly_fields = (
+        'deployment_link', 'status', 'requests', 'requested_at',
+        'not_before', 'started_at', 'finished_at', 'output',
+    )
+    exclude = ('deployment',)
+
+    deployment_link = MigasFields.link(
+        model=RepositoryBuild, name='deployment', order='deployment__name'
+    )
+
+    def changelist_view(self, request, extra_context=None):
+        messages.info(
+            request,
+            _('Running builds: %(running)d, pending: %(pending)d')
+            % RepositoryBuild.objects.stats()
+        )
+
+        return super(RepositoryBuildAdmin, self).changelist_view(request, extra_context)
+
+    def has_add_permission(self, request):
+        return False
+
+
 class ScheduleDelayLine(MigasTabularInline):
     model = ScheduleDelay
     fields = ('delay', 'attributes', 'computers', 'duration')
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import os
-import inspect
+import json
+import hashlib
 
 from datetime import datetime, timedelta
 from six import iteritems
@@ -13,20 +14,27 @@ from django.conf import settings
 from django.urls import reverse
 from django.utils.translation import ugettext as _
 
-from migasfree.catalog.models import Policy
+from migasfree.catalog.models import Policy, compiled_policies
 
 from .models import (
     Attribute, AttributeSet, Computer, BasicAttribute,
-    Error, Fault, FaultDefinition, HwNode, Message,
+    Error, Fault, FaultDefinition, Message,
     Migration, Notification, Package, Pms, Platform, Property,
     Deployment, Store, ServerAttribute, Synchronization, User,
-    Project, Domain,
+    Project, Domain, UploadJob, PackageDigest, StatsCounter,
 )
+from .cache import get_version, response_cache
+from .commands import (
+    commands, AUTH_PROJECT_KEYS, AUTH_PACKAGER_KEYS, AUTH_CREDENTIALS,
+)
+from .models.deployment import deployment_index
+from .models.fault_definition import fault_definition_attributes
+from .models.package_digest import data_digests
 from .secure import get_keys_to_client, get_keys_to_packager
-from .views import load_hw
-from .tasks import create_repository_metadata
+from .views import save_hw
+from .tasks import request_repository_metadata
 from .utils import (
-    uuid_change_format, get_client_ip,
+    get_client_ip, digest_data,
     list_difference, list_common, to_list,
     remove_duplicates_preserving_order,
 )
@@ -75,90 +83,67 @@ def get_computer(name, uuid):
     Returns a computer object (or None if not found)
     """
     logger.debug('name: %s, uuid: %s' % (name, uuid))
-    computer = None
 
-    try:
-        computer = Computer.objects.get(uuid=uuid)
-        logger.debug('computer found by uuid')
+    computer = Computer.objects.resolve(name, uuid)
+    if computer is None:
+        logger.debug('computer not found!!!')
 
-        return computer
-    except Computer.DoesNotExist:
-        pass
+    return computer
 
-    try:  # search with endian format changed
-        computer = Computer.objects.get(uuid=uuid_change_format(uuid))
-        logger.debug('computer found by uuid (endian format changed)')
 
-        return computer
-    except Computer.DoesNotExist:
-        pass
+def apply_computer_hardware(computer, hw_data):
+    if isinstance(hw_data, list):
+        hw_data = hw_data[0]
 
-    computer = Computer.objects.filter(mac_address__icontains=uuid[-12:])
-    if computer.count() == 1 and uuid[0:8] == '0'*8:
-        logger.debug('computer found by mac_address (in uuid format)')
+    digest = digest_data(hw_data)
+    if digest == computer.hardware_digest:  # hardware not changed
+        StatsCounter.objects.incr('hardware.digest.hit')
+        computer.update_last_hardware_capture()
 
-        return computer.first()
+        return
 
-    computer = None  # reset result to continue searching
+    StatsCounter.objects.incr('hardware.digest.miss')
+    nodes = save_hw(computer, hw_data)
+    computer.update_last_hardware_capture()
+    computer.update_hardware_resume(nodes)
+    computer.update_hardware_digest(digest)
 
-    # DEPRECATED This Block. Only for compatibility with client <= 2
-    message = 'computer found by name. compatibility mode'
-    if len(uuid.split("-")) == 5:  # search for uuid (client >= 3)
-        try:
-            computer = Computer.objects.get(uuid=name)
-            logger.debug(message)
 
-            return computer
-        except Computer.DoesNotExist:
-            pass
-    else:
-        try:
-            # search for name (client <= 2)
-            computer = Computer.objects.get(name=name, uuid=name)
-            logger.debug(message)
+def apply_computer_software_base_diff(computer, data):
+    computer.update_software_inventory(data)
 
-            return computer
-        except Computer.DoesNotExist:
-            try:
-                computer = Computer.objects.get(name=name)
-                logger.debug(message)
-
-                return computer
-            except (
-                Computer.DoesNotExist,
-                Computer.MultipleObjectsReturned
-            ):
-                pass
 
-    if computer is None:
-        logger.debug('computer not found!!!')
+def apply_computer_software_history(computer, data):
+    computer.update_software_history(data)
 
-    return computer
 
+def apply_computer_errors(computer, data):
+    Error.objects.create(computer, computer.project, data)
 
-def upload_computer_hardware(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
 
-    hw_data = data[cmd]
-    if isinstance(hw_data, list):
-        hw_data = hw_data[0]
+# uploads that can be applied asynchronously (see UploadJob)
+UPLOADS = {
+    'upload_computer_hardware': apply_computer_hardware,
+    'upload_computer_software_base_diff': apply_computer_software_base_diff,
+    'upload_computer_software_history': apply_computer_software_history,
+    'upload_computer_errors': apply_computer_errors,
+}
 
-    try:
-        HwNode.objects.filter(computer=computer).delete()
-        load_hw(computer, hw_data, None, 1)
-        computer.update_last_hardware_capture()
-        computer.update_hardware_resume()
-        ret = return_message(cmd, errmfs.ok())
-    except IndexError:
-        ret = return_message(cmd, errmfs.error(errmfs.GENERIC))
 
-    return ret
+def apply_upload(computer, cmd, data):
+    UPLOADS[cmd](computer, data)
 
 
-def upload_computer_software_base_diff(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+def upload(computer, cmd, data):
+    """
+    Applies the upload now or queues it (MIGASFREE_ASYNC_UPLOADS)
+    """
     try:
-        computer.update_software_inventory(data[cmd])
+        if settings.MIGASFREE_ASYNC_UPLOADS:
+            UploadJob.objects.enqueue(computer, cmd, data[cmd])
+        else:
+            apply_upload(computer, cmd, data[cmd])
+
         ret = return_message(cmd, errmfs.ok())
     except IndexError:
         ret = return_message(cmd, errmfs.error(errmfs.GENERIC))
@@ -166,26 +151,32 @@ def upload_computer_software_base_diff(request, name, uuid, computer, data):
     return ret
 
 
+@commands.register(AUTH_PROJECT_KEYS)
+def upload_computer_hardware(request, name, uuid, computer, data):
+    return upload(computer, 'upload_computer_hardware', data)
+
+
+@commands.register(AUTH_PROJECT_KEYS)
+def upload_computer_software_base_diff(request, name, uuid, computer, data):
+    return upload(computer, 'upload_computer_software_base_diff', data)
+
+
+@commands.register(AUTH_PROJECT_KEYS)
 def upload_computer_software_base(request, name, uuid, computer, data):
     """ DEPRECATED endpoint for migasfree-client >= 4.14 """
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'upload_computer_software_base'
     return return_message(cmd, errmfs.ok())
 
 
+@commands.register(AUTH_PROJECT_KEYS)
 def upload_computer_software_history(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
-    try:
-        computer.update_software_history(data[cmd])
-        ret = return_message(cmd, errmfs.ok())
-    except IndexError:
-        ret = return_message(cmd, errmfs.error(errmfs.GENERIC))
-
-    return ret
+    return upload(computer, 'upload_computer_software_history', data)
 
 
+@commands.register(AUTH_PROJECT_KEYS)
 def get_computer_software(request, name, uuid, computer, data):
     """ DEPRECATED endpoint for migasfree-client >= 4.14 """
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'get_computer_software'
 
     return return_message(
         cmd,
@@ -193,20 +184,14 @@ def get_computer_software(request, name, uuid, computer, data):
     )
 
 
+@commands.register(AUTH_PROJECT_KEYS)
 def upload_computer_errors(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
-    try:
-        Error.objects.create(computer, computer.project, data[cmd])
-
-        ret = return_message(cmd, errmfs.ok())
-    except IndexError:
-        ret = return_message(cmd, errmfs.error(errmfs.GENERIC))
-
-    return ret
+    return upload(computer, 'upload_computer_errors', data)
 
 
+@commands.register(AUTH_PROJECT_KEYS)
 def upload_computer_message(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'upload_computer_message'
 
     if not computer:
         return return_message(cmd, errmfs.error(errmfs.COMPUTER_NOT_FOUND))
@@ -234,6 +219,7 @@ def return_message(cmd, data):
     return {'{}.return'.format(cmd): data}
 
 
+@commands.register(AUTH_PROJECT_KEYS)
 def get_properties(request, name, uuid, computer, data):
     """
     First call of client requesting to server what it must do.
@@ -259,11 +245,78 @@ def get_properties(request, name, uuid, computer, data):
     """
 
     return return_message(
-        str(inspect.getframeinfo(inspect.currentframe()).function),
+        'get_properties',
         {"properties": Property.enabled_client_properties()}
     )
 
 
+def sync_response_key(computer, tags, sync_attributes):
+    """
+    Fingerprint of everything the deterministic part of upload_computer_info
+    response depends on (None if the response cache is disabled): only
+    the attributes used by deployments, policies and fault definitions
+    and the schedule slots of the matching delays, so it is shared by
+    computers with different CID, IP, USR, ... attributes
+    """
+    if not settings.MIGASFREE_RESPONSE_CACHE_TIMEOUT:
+        return None
+
+    index = deployment_index.get(computer.project_id)
+    policies = compiled_policies.get()
+    relevant = index.attributes | policies.attributes | fault_definition_attributes.get()
+    all_attributes = set(tags) | set(sync_attributes)
+
+    fingerprint = json.dumps([
+        computer.project_id,
+        sorted(set(tags) & relevant),
+        sorted(set(sync_attributes) & relevant),
+        str(index.date),
+        index.schedule_slots(computer.id, all_attributes),
+        [
+            get_version(name) for name in [
+                'deployments',
+                'deployments:{}'.format(computer.project_id),
+                'policies',
+                'fault_definitions',
+            ]
+        ],
+    ])
+
+    return 'migasfree:sync_response:{}'.format(
+        hashlib.sha1(fingerprint.encode()).hexdigest()
+    )
+
+
+def sync_response(computer, all_attributes, sync_attributes):
+    """
+    Faults, repositories and packages of upload_computer_info response
+    """
+    lst_deploys = []
+    lst_pkg_to_remove = []
+    lst_pkg_to_install = []
+
+    # deployments
+    for d in Deployment.available(computer, all_attributes):
+        lst_deploys.append({'name': d.deployment.name, 'source_template': d.source_template})
+        lst_pkg_to_remove.extend(d.packages_to_remove)
+        lst_pkg_to_install.extend(d.packages_to_install)
+
+    # policies
+    policy_pkg_to_install, policy_pkg_to_remove = Policy.get_packages(computer, sync_attributes)
+    lst_pkg_to_install.extend(policy_pkg_to_install)
+    lst_pkg_to_remove.extend(policy_pkg_to_remove)
+
+    return {
+        "faultsdef": FaultDefinition.enabled_for_attributes(all_attributes),
+        "repositories": lst_deploys,
+        "packages": {
+            "remove": remove_duplicates_preserving_order(lst_pkg_to_remove),
+            "install": remove_duplicates_preserving_order(lst_pkg_to_install)
+        },
+    }
+
+
+@commands.register(AUTH_PROJECT_KEYS)
 def upload_computer_info(request, name, uuid, computer, data):
     """
     Process the file request.json and returns a JSON with:
@@ -317,7 +370,7 @@ def upload_computer_info(request, name, uuid, computer, data):
             }
     """
 
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'upload_computer_info'
 
     computer_info = data.get(cmd).get("computer")
     platform_name = computer_info.get('platform', 'unknown')
@@ -405,67 +458,81 @@ def upload_computer_info(request, name, uuid, computer, data):
         user.update_fullname(user_fullname)
 
         computer.update_sync_user(user)
-        computer.sync_attributes.clear()
-
-        computer.sync_attributes.add(
-            *BasicAttribute.process(
-                id=computer.id,
-                ip_address=ip_address,
-                project=computer.project.name,
-                platform=computer.project.platform.name,
-                user=user.name,
-                description=computer.get_cid_description()
-            )
+
+        # target sync attributes are computed in memory
+        # and only the differences are saved at the end
+        sync_attributes = BasicAttribute.process(
+            id=computer.id,
+            ip_address=ip_address,
+            project=computer.project.name,
+            platform=computer.project.platform.name,
+            user=user.name,
+            description=computer.get_cid_description()
         )
 
         # client attributes
+        client_properties = {
+            item.prefix: item for item in Property.objects.filter(
+                prefix__in=list(client_attributes.keys())
+            )
+        }
+        client_items = []
         for prefix, value in iteritems(client_attributes):
-            client_property = Property.objects.get(prefix=prefix)
+            if prefix not in client_properties:
+                raise Property.DoesNotExist(prefix)
+
+            client_property = client_properties[prefix]
             if client_property.sort == 'client':
-                computer.sync_attributes.add(
-                    *Attribute.process_kind_property(client_property, value)
+                client_items.extend(
+                    (client_property, item)
+                    for item in Attribute.kind_property_values(client_property, value)
                 )
 
-        # Domain attribute
-        computer.sync_attributes.add(*Domain.process(computer.get_all_attributes()))
-
         # Tags (server attributes) (not running on clients!!!)
-        for tag in computer.tags.filter(property_att__enabled=True):
-            computer.sync_attributes.add(
-                *Attribute.process_kind_property(tag.property_att, tag.value)
-            )
+        tags = list(computer.tags.select_related('property_att'))
+        tag_items = []
+        for tag in tags:
+            if tag.property_att.enabled:
+                tag_items.extend(
+                    (tag.property_att, item)
+                    for item in Attribute.kind_property_values(tag.property_att, tag.value)
+                )
+        tags = [tag.id for tag in tags]
 
-        # AttributeSets
-        computer.sync_attributes.add(*AttributeSet.process(computer.get_all_attributes()))
+        # all of them resolved at once
+        attributes = [
+            obj.id for obj in Attribute.objects.resolve(client_items + tag_items)
+        ]
 
-        fault_definitions = FaultDefinition.enabled_for_attributes(computer.get_all_attributes())
+        sync_attributes.extend(attributes[:len(client_items)])
 
-        lst_deploys = []
-        lst_pkg_to_remove = []
-        lst_pkg_to_install = []
+        # Domain attribute
+        sync_attributes.extend(Domain.process(tags + sync_attributes))
 
-        # deployments
-        deploys = Deployment.available_deployments(computer, computer.get_all_attributes())
-        for d in deploys:
-            lst_deploys.append({'name': d.name, 'source_template': d.get_source_template()})
+        # Tags
+        sync_attributes.extend(attributes[len(client_items):])
 
-            if d.packages_to_remove:
-                for p in to_list(d.packages_to_remove):
-                    if p != "":
-                        lst_pkg_to_remove.append(p)
-            if d.packages_to_install:
-                for p in to_list(d.packages_to_install):
-                    if p != "":
-                        lst_pkg_to_install.append(p)
+        # AttributeSets
+        sync_attributes.extend(AttributeSet.process(tags + sync_attributes))
 
-        # policies
-        policy_pkg_to_install, policy_pkg_to_remove = Policy.get_packages(computer)
-        lst_pkg_to_install.extend(policy_pkg_to_install)
-        lst_pkg_to_remove.extend(policy_pkg_to_remove)
+        added, removed = computer.update_sync_attributes(sync_attributes)
+        logger.debug('sync attributes added: %s, removed: %s' % (added, removed))
+
+        all_attributes = tags + remove_duplicates_preserving_order(sync_attributes)
+
+        # faults, deployments and policies (shared by computers with same fingerprint)
+        key = sync_response_key(computer, tags, sync_attributes)
+        response = response_cache().get(key) if key else None
+        if response is None:
+            response = sync_response(computer, all_attributes, sync_attributes)
+            if key:
+                response_cache().set(
+                    key, response, settings.MIGASFREE_RESPONSE_CACHE_TIMEOUT
+                )
 
         # devices
         logical_devices = []
-        for device in computer.logical_devices(computer.get_all_attributes()):
+        for device in computer.logical_devices(all_attributes):
             logical_devices.append(device.as_dict(computer.project))
 
         default_logical_device = 0
@@ -483,12 +550,9 @@ def upload_computer_info(request, name, uuid, computer, data):
 
         # Finally, JSON creation
         data = {
-            "faultsdef": fault_definitions,
-            "repositories": lst_deploys,
-            "packages": {
-                "remove": remove_duplicates_preserving_order(lst_pkg_to_remove),
-                "install": remove_duplicates_preserving_order(lst_pkg_to_install)
-            },
+            "faultsdef": response["faultsdef"],
+            "repositories": response["repositories"],
+            "packages": response["packages"],
             "devices": {
                 "logical": logical_devices,
                 "default": default_logical_device,
@@ -504,6 +568,7 @@ def upload_computer_info(request, name, uuid, computer, data):
     return ret
 
 
+@commands.register(AUTH_PROJECT_KEYS)
 def upload_computer_faults(request, name, uuid, computer, data):
     """
     INPUT:
@@ -513,7 +578,7 @@ def upload_computer_faults(request, name, uuid, computer, data):
         }
     """
 
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'upload_computer_faults'
     faults = data.get(cmd).get("faults")
 
     try:
@@ -536,16 +601,18 @@ def upload_computer_faults(request, name, uuid, computer, data):
     return ret
 
 
+@commands.register(AUTH_PROJECT_KEYS)
 def upload_devices_changes(request, name, uuid, computer, data):
     """ DEPRECATED endpoint for migasfree-client >= 4.13 """
     logger.debug('upload_devices_changes data: %s' % data)
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'upload_devices_changes'
 
     return return_message(cmd, errmfs.ok())
 
 
+@commands.register(AUTH_CREDENTIALS)
 def register_computer(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'register_computer'
 
     user = auth.authenticate(
         username=data.get('username'),
@@ -638,8 +705,9 @@ def register_computer(request, name, uuid, computer, data):
         )
 
 
+@commands.register(AUTH_CREDENTIALS)
 def get_key_packager(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'get_key_packager'
     user = auth.authenticate(
         username=data['username'],
         password=data['password']
@@ -654,8 +722,9 @@ def get_key_packager(request, name, uuid, computer, data):
     return return_message(cmd, get_keys_to_packager())
 
 
+@commands.register(AUTH_PACKAGER_KEYS)
 def upload_server_package(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'upload_server_package'
 
     project_name = data.get('version', data.get('project'))
 
@@ -674,7 +743,8 @@ def upload_server_package(request, name, uuid, computer, data):
         name=data['store'], project=project
     )
 
-    save_request_file(f, filename)
+    digests = save_request_file(f, filename)
+    PackageDigest.objects.store(filename, digests)
 
     # we add the package
     if not data['source']:
@@ -687,8 +757,9 @@ def upload_server_package(request, name, uuid, computer, data):
     return return_message(cmd, errmfs.ok())
 
 
+@commands.register(AUTH_PACKAGER_KEYS)
 def upload_server_set(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'upload_server_set'
 
     project_name = data.get('version', data.get('project'))
 
@@ -716,7 +787,7 @@ def upload_server_set(request, name, uuid, computer, data):
     )
     package.create_dir()
 
-    save_request_file(f, filename)
+    digests = save_request_file(f, filename)
 
     # if exists path, move it
     if "path" in data and data["path"] != "":
@@ -731,12 +802,16 @@ def upload_server_set(request, name, uuid, computer, data):
         except OSError:
             pass
         os.rename(filename, dst)
+        filename = dst
+
+    PackageDigest.objects.store(filename, digests)
 
     return return_message(cmd, errmfs.ok())
 
 
+@commands.register(AUTH_PROJECT_KEYS)
 def get_computer_tags(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'get_computer_tags'
 
     available_tags = {}
     selected_tags = []
@@ -787,8 +862,9 @@ def get_computer_tags(request, name, uuid, computer, data):
     return return_message(cmd, ret)
 
 
+@commands.register(AUTH_PROJECT_KEYS)
 def set_computer_tags(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'set_computer_tags'
     all_id = Attribute.objects.get(pk=1).id  # All Systems attribute is the first one
 
     try:
@@ -955,13 +1031,14 @@ def create_repositories_package(package_name, project_name):
         project = Project.objects.get(name=project_name)
         package = Package.objects.get(name=package_name, project=project)
         for deploy in Deployment.objects.filter(available_packages__id=package.id):
-            create_repository_metadata(deploy)
+            request_repository_metadata(deploy)
     except ObjectDoesNotExist:
         pass
 
 
+@commands.register(AUTH_PACKAGER_KEYS)
 def create_repositories_of_packageset(request, name, uuid, computer, data):
-    cmd = str(inspect.getframeinfo(inspect.currentframe()).function)
+    cmd = 'create_repositories_of_packageset'
 
     project_name = data.get('version', data.get('project'))
 
@@ -978,10 +1055,16 @@ def create_repositories_of_packageset(request, name, uuid, computer, data):
 
 
 def save_request_file(archive, target):
-    fp = open(target, 'wb+')
-    for chunk in archive.chunks():
-        fp.write(chunk)
-    fp.close()
+    """
+    Returns the digests of the file (computed while it is written)
+    """
+    def chunks():
+        with open(target, 'wb+') as fp:
+            for chunk in archive.chunks():
+                fp.write(chunk)
+                yield chunk
+
+    digests = data_digests(chunks())
 
     try:
         # https://docs.djangoproject.com/en/dev/topics/http/file-uploads/
@@ -991,3 +1074,5 @@ def save_request_file(archive, target):
         os.remove(archive.temporary_file_path())
     except (OSError, AttributeError):
         pass
+
+    return digests
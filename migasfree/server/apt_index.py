@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+"""
+APT repository indexer (Pms.BUILD_MODE_APT)
+
+Writes the same Packages, Packages.gz and Release files as the apt-get
+createrepo script (dpkg-scanpackages -m + md5sum/sha*sum) in one pass:
+control stanzas and digests of the .deb files are read from PackageDigest
+(computed when they are uploaded).
+"""
+
+import gzip
+import io
+import os
+import shlex
+import subprocess
+import tarfile
+import time
+
+from django.conf import settings
+
+from .models import PackageDigest
+from .models.package_digest import file_digests
+from .utils import run_in_server, version_key
+
+ARCHITECTURES = ['i386', 'amd64', 'source']
+COMPONENT = 'PKGS'
+
+# field order of dpkg-scanpackages (unknown fields are kept at the end)
+FIELDS_ORDER = [
+    'Package', 'Package-Type', 'Source', 'Version', 'Built-Using',
+    'Kernel-Version', 'Built-For-Profiles', 'Auto-Built-Package',
+    'Architecture', 'Subarchitecture', 'Installer-Menu-Item',
+    'Build-Essential', 'Essential', 'Protected', 'Origin', 'Bugs',
+    'Maintainer', 'Installed-Size',
+    'Pre-Depends', 'Depends', 'Recommends', 'Suggests', 'Enhances',
+    'Conflicts', 'Breaks', 'Replaces', 'Provides',
+    'Filename', 'Size', 'MD5sum', 'SHA1', 'SHA256',
+    'Section', 'Priority', 'Multi-Arch', 'Homepage', 'Description',
+    'Tag', 'Task',
+]
+
+RELEASE_HASHES = [
+    ('MD5Sum', 'md5'),
+    ('SHA1', 'sha1'),
+    ('SHA256', 'sha256'),
+    ('SHA512', 'sha512'),
+]
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+MONTHS = [
+    'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+    'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'
+]
+
+SIGNATURE_FILES = ['InRelease', 'Release.gpg']
+
+AR_MAGIC = b'!<arch>\n'
+AR_HEADER_SIZE = 60
+
+
+class PackageError(Exception):
+    pass
+
+
+def read_control(filename):
+    """
+    Returns the control file (text) of a .deb package
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(AR_MAGIC)) != AR_MAGIC:
+            raise PackageError('{}: not a debian package'.format(filename))
+
+        while True:
+            header = f.read(AR_HEADER_SIZE)
+            if len(header) < AR_HEADER_SIZE:
+                break
+
+            name = header[:16].decode('ascii').strip().rstrip('/')
+            size = int(header[48:58].decode('ascii').strip())
+
+            if name.startswith('control.tar'):
+                try:
+                    with tarfile.open(fileobj=io.BytesIO(f.read(size)), mode='r:*') as tar:
+                        for member in tar.getmembers():
+                            if member.name in ['./control', 'control']:
+                                return tar.extractfile(member).read().decode('utf-8')
+                except tarfile.TarError:  # compression not supported (zstd)
+                    return dpkg_control(filename)
+
+                break
+
+            f.seek(size + size % 2, os.SEEK_CUR)  # members are 2-byte aligned
+
+    raise PackageError('{}: control file not found'.format(filename))
+
+
+def dpkg_control(filename):
+    process = subprocess.Popen(
+        ['dpkg-deb', '--info', filename, 'control'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    out, err = process.communicate()
+    if process.returncode != 0:
+        raise PackageError('{}: {}'.format(filename, err.decode('utf-8', 'replace')))
+
+    return out.decode('utf-8')
+
+
+def parse_control(text):
+    """
+    :return: [(field, value), ...] (value keeps continuation lines)
+    """
+    fields = []
+    for line in text.rstrip('\n').split('\n'):
+        if line[:1] in [' ', '\t'] and fields:
+            fields[-1] = (fields[-1][0], '{}\n{}'.format(fields[-1][1], line))
+        elif ':' in line:
+            field, value = line.split(':', 1)
+            fields.append((field.strip(), value.strip()))
+
+    return fields
+
+
+def stanza(digest, filename):
+    fields = dict(digest.get_headers())
+    fields.update({
+        'Filename': filename,
+        'Size': str(digest.size),
+        'MD5sum': digest.md5,
+        'SHA1': digest.sha1,
+        'SHA256': digest.sha256,
+    })
+
+    order = [item for item in FIELDS_ORDER if item in fields] + [
+        field for field, _ in digest.get_headers() if field not in FIELDS_ORDER
+    ]
+
+    return ''.join('{}: {}\n'.format(field, fields[field]) for field in order)
+
+
+def package_files(base, pkgs_path):
+    """
+    .deb files in pkgs_path and its subdirectories, relative to base
+    (symlinks of package sets are followed, like dpkg-scanpackages)
+    """
+    visited = set()
+    for root, dirs, names in os.walk(os.path.join(base, pkgs_path), followlinks=True):
+        visited.add(os.path.realpath(root))
+        dirs[:] = sorted(
+            item for item in dirs
+            if os.path.realpath(os.path.join(root, item)) not in visited  # symlink loops
+        )
+        for name in sorted(names):
+            if name.endswith('.deb'):
+                yield os.path.relpath(os.path.join(root, name), base)
+
+
+def packages_index(base, pkgs_path):
+    """
+    Packages file content of the packages in pkgs_path
+    (filenames relative to base, like dpkg-scanpackages)
+    """
+    filenames = list(package_files(base, pkgs_path))
+    digests, errors = PackageDigest.objects.get_many(
+        os.path.join(base, filename) for filename in filenames
+    )
+
+    entries = []
+    for filename in filenames:
+        digest = digests.get(os.path.join(base, filename))
+        if digest is None:  # not readable (in errors)
+            continue
+
+        if digest.headers is None:
+            errors.append('{}: control file not found'.format(filename))
+            continue
+
+        fields = dict(digest.get_headers())
+        entries.append((
+            (fields.get('Package', ''), version_key(fields.get('Version')), filename),
+            stanza(digest, filename)
+        ))
+
+    entries.sort(key=lambda item: item[0])
+
+    return ''.join(
+        '{}\n'.format(item[1]) for item in entries
+    ).encode('utf-8'), errors
+
+
+def gzip_data(data):
+    out = io.BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', compresslevel=9, fileobj=out, mtime=0) as f:
+        f.write(data)
+
+    return out.getvalue()
+
+
+def write_file(filename, data):
+    tmp = '{}.tmp'.format(filename)
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.rename(tmp, filename)
+
+
+def release_date():
+    now = time.gmtime()
+
+    return '{}, {:02d} {} {} UTC'.format(
+        WEEKDAYS[now.tm_wday], now.tm_mday, MONTHS[now.tm_mon - 1],
+        time.strftime('%Y %H:%M:%S', now)
+    )
+
+
+def release(path, name):
+    """
+    Release file content of the distribution in path
+    (hashes of the regular files in it, like the createrepo script)
+    """
+    files = []
+    for root, _, names in os.walk(path):
+        for item in names:
+            filename = os.path.join(root, item)
+            relative = os.path.relpath(filename, path)
+            if os.path.isfile(filename) and not os.path.islink(filename) \
+                    and relative not in ['Release'] + SIGNATURE_FILES:
+                files.append(relative)
+    files.sort()
+
+    hashes = {
+        filename: file_digests(os.path.join(path, filename)) for filename in files
+    }
+
+    lines = [
+        'Architectures: {}'.format(' '.join(ARCHITECTURES)),
+        'Codename: {}'.format(name),
+        'Components: {}'.format(COMPONENT),
+        'Date: {}'.format(release_date()),
+        'Label: migasfree {} repository'.format(name),
+        'Origin: migasfree',
+        'Suite: {}'.format(name),
+    ]
+    for title, algorithm in RELEASE_HASHES:
+        lines.append('{}:'.format(title))
+        for filename in files:
+            lines.append(' {} {:>16} {}'.format(
+                hashes[filename][algorithm],
+                os.path.getsize(os.path.join(path, filename)),
+                filename
+            ))
+
+    return '\n'.join(lines + ['']).encode('utf-8')
+
+
+def remove_signatures(path):
+    """
+    Removes the signatures of a previous Release (gpg does not overwrite
+    files without a tty)
+    """
+    for name in SIGNATURE_FILES:
+        filename = os.path.join(path, name)
+        if os.path.lexists(filename):
+            os.remove(filename)
+
+
+def sign_release(path):
+    remove_signatures(path)
+
+    gpg = 'cd {} && gpg --batch --yes -u migasfree-repository --homedir {}'.format(
+        shlex.quote(path),
+        shlex.quote(os.path.join(settings.MIGASFREE_KEYS_DIR, '.gnupg'))
+    )
+    errors = []
+    for args in [
+        '--clearsign -o InRelease Release',
+        '-abs -o Release.gpg Release',
+    ]:
+        result = run_in_server('{} {}'.format(gpg, args), name='gpg')
+        if result['returncode'] != 0:
+            errors.append(result['err'].decode('utf-8', 'replace'))
+
+    return errors
+
+
+def build(path, name):
+    """
+    Creates the metadata of the repository 'name' in path
+    (path is the dists directory: %PATH% in createrepo)
+    :return: error messages ('' if none)
+    """
+    base = os.path.dirname(path)
+    dist_path = os.path.join(path, name)
+    pkgs_path = os.path.join(os.path.basename(path), name, COMPONENT)
+
+    packages, errors = packages_index(base, pkgs_path)
+    packages_gz = gzip_data(packages)
+
+    for arch in ARCHITECTURES:
+        arch_path = os.path.join(dist_path, COMPONENT, 'binary-{}'.format(arch))
+        if not os.path.exists(arch_path):
+            os.makedirs(arch_path)
+
+        write_file(os.path.join(arch_path, 'Packages'), packages)
+        write_file(os.path.join(arch_path, 'Packages.gz'), packages_gz)
+
+    write_file(os.path.join(dist_path, 'Release'), release(dist_path, name))
+    errors.extend(sign_release(dist_path))
+
+    return '\n'.join(errors)
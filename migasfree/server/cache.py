@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+Process-local cache of compiled structures
+
+Each structure (and each key of it) has a version counter in the
+database (CacheVersion), shared by all server processes whatever the
+cache backend is. Signals bump the version and the structure is rebuilt
+by every process on next use. MIGASFREE_COMPILED_CACHE_TIMEOUT limits
+how often versions are checked.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+
+def get_version(name):
+    from .models import CacheVersion
+
+    version = CacheVersion.objects.filter(name=name).values_list('version', flat=True).first()
+    if version is None:
+        version = CacheVersion.objects.get_or_create(
+            name=name, defaults={'version': int(time.time() * 1000)}
+        )[0].version
+
+    return version
+
+
+def bump_version(name):
+    from .models import CacheVersion
+
+    if not CacheVersion.objects.filter(name=name).update(version=F('version') + 1):
+        get_version(name)
+
+
+def invalidate_version(name):
+    """
+    Bumps the version when the transaction is committed
+    """
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def response_cache():
+    """
+    Cache of deterministic parts of client API responses
+    (alias MIGASFREE_RESPONSE_CACHE in CACHES)
+    """
+    return caches[settings.MIGASFREE_RESPONSE_CACHE]
+
+
+class CompiledCache(object):
+    def __init__(self, name, build, expired=None):
+        """
+        :param name: name of the version counter
+        :param build: function that returns the compiled structure
+                      (receives the key used in get)
+        :param expired: optional function that receives a compiled
+                        structure and returns True if it must be rebuilt
+        """
+        self.name = name
+        self.build = build
+        self.expired = expired
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+        self._items = {}  # key: (version, checked_at, value)
+
+    def _version_name(self, key):
+        return self.name if key is None else '{}:{}'.format(self.name, key)
+
+    def get(self, key=None):
+        now = time.time()
+        timeout = settings.MIGASFREE_COMPILED_CACHE_TIMEOUT
+
+        if now - self._checked_at >= timeout:
+            version = get_version(self.name)
+            with self._lock:
+                if version != self._version:
+                    self._items = {}
+                    self._version = version
+                self._checked_at = now
+
+        items = self._items
+        item = items.get(key)
+        if item is not None and now - item[1] < timeout \
+                and not (self.expired and self.expired(item[2])):
+            return item[2]
+
+        version = get_version(self._version_name(key)) if key is not None else None
+        if item is None or item[0] != version \
+                or (self.expired and self.expired(item[2])):
+            item = (version, now, self.build(key))
+        else:
+            item = (version, now, item[2])
+
+        with self._lock:
+            if items is self._items:
+                self._items[key] = item
+
+        return item[2]
+
+    def clear(self, key=None):
+        with self._lock:
+            if key is None:
+                self._items = {}
+                self._checked_at = 0
+            else:
+                self._items.pop(key, None)
+
+    def invalidate(self, key=None):
+        """
+        Clears the structure (or one key of it) now in this process
+        and when the transaction is committed in all processes
+        """
+        def bump():
+            bump_version(self._version_name(key))
+            self.clear(key)
+
+        self.clear(key)
+        transaction.on_commit(bump)
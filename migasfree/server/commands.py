@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""
+Registry of client API commands (see views.client_api.api)
+"""
+
+from .metrics import metrics, LATENCY_BUCKETS, SIZE_BUCKETS
+
+# USING "VERSION" (PROJECT) KEYS PAIR
+AUTH_PROJECT_KEYS = 'project'
+
+# USING "PACKAGER" KEYS PAIR
+AUTH_PACKAGER_KEYS = 'packager'
+
+# USING USERNAME AND PASSWORD ONLY (WITHOUT KEYS PAIR)
+AUTH_CREDENTIALS = 'credentials'
+
+AUTH_MODES = (AUTH_PROJECT_KEYS, AUTH_PACKAGER_KEYS, AUTH_CREDENTIALS)
+
+
+class Command(object):
+    def __init__(self, name, handler, auth):
+        if auth not in AUTH_MODES:
+            raise ValueError(auth)
+
+        self.name = name
+        self.handler = handler
+        self.auth = auth
+
+    def __call__(self, request, name, uuid, computer, data):
+        return self.handler(request, name, uuid, computer, data)
+
+    def metric(self, item):
+        return 'api.{}.{}'.format(self.name, item)
+
+    def record(self, elapsed, request_size, response_size):
+        metrics.incr(self.metric('calls'))
+        metrics.observe(self.metric('latency'), elapsed, LATENCY_BUCKETS)
+        metrics.observe(self.metric('request_size'), request_size, SIZE_BUCKETS)
+        metrics.observe(self.metric('response_size'), response_size, SIZE_BUCKETS)
+
+    def stats(self):
+        return {
+            'auth': self.auth,
+            'calls': metrics.counter(self.metric('calls')),
+            'latency': metrics.histogram(self.metric('latency')),
+            'request_size': metrics.histogram(self.metric('request_size')),
+            'response_size': metrics.histogram(self.metric('response_size')),
+        }
+
+    def __str__(self):
+        return self.name
+
+
+class CommandRegistry(object):
+    def __init__(self):
+        self._commands = {}
+
+    def register(self, auth, name=None):
+        """
+        Decorator: registers a handler as a command with an auth mode
+        The command name is the name of the function (by default)
+        """
+        def decorator(handler):
+            command = Command(name or handler.__name__, handler, auth)
+            self._commands[command.name] = command
+
+            return handler
+
+        return decorator
+
+    def get(self, name):
+        return self._commands.get(name)
+
+    def names(self, auth):
+        return tuple(
+            sorted(name for name, item in self._commands.items() if item.auth == auth)
+        )
+
+    def stats(self):
+        return {name: item.stats() for name, item in self._commands.items()}
+
+
+commands = CommandRegistry()
@@ -4,7 +4,7 @@ import django_filters
 
 from datetime import datetime, timedelta
 
-from django.db.models import Q
+from django.db.models import Q, Exists, OuterRef
 from django.contrib.admin import SimpleListFilter, RelatedFieldListFilter, ListFilter
 from django.contrib.admin.filters import ChoicesFieldListFilter
 from django.core.exceptions import ImproperlyConfigured
@@ -17,7 +17,9 @@ from .models import (
     Fault, Notification, Migration,
     HwNode, Synchronization, StatusLog,
     Device, DeviceDriver, ScheduleDelay, Platform,
+    SoftwareInventory,
 )
+from .models.software_inventory import parse_search
 
 
 class ProductiveFilterSpec(ChoicesFieldListFilter):
@@ -132,11 +134,11 @@ class SoftwareInventoryFilter(SimpleListFilter):
 
     def queryset(self, request, queryset):
         if self.value():
-            return queryset.filter(
-                Q(software_inventory__isnull=True)
-                | Q(software_inventory__startswith='-')
-                | Q(software_inventory='-')
-            )
+            return queryset.annotate(
+                has_software=Exists(
+                    SoftwareInventory.objects.filter(computer=OuterRef('pk'))
+                )
+            ).filter(has_software=False)
         else:
             return queryset
 
@@ -433,3 +435,21 @@ class ModelFilter(SingleTextInputFilter):
     def queryset(self, request, queryset):
         if self.value():
             return queryset.filter(model__name__icontains=self.value())
+
+
+class SoftwarePackageFilter(SingleTextInputFilter):
+    title = _('Software Package')
+    parameter_name = 'package'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            try:
+                name, versions = parse_search(self.value())
+            except ValueError:
+                return queryset.none()
+
+            return queryset.filter(
+                id__in=SoftwareInventory.objects.search(name, **versions)
+            )
+
+        return queryset
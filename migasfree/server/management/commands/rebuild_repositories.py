@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from ...models import Deployment, Project, RepositoryBuild
+from ...tasks import run_repository_builds
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the metadata of the repositories of a project (or all of them)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project', action='append', default=[],
+            help='project name (all projects if omitted, may be repeated)'
+        )
+        parser.add_argument(
+            '--processes', type=int, default=settings.MIGASFREE_REPOSITORY_BUILD_PROCESSES,
+            help='builds of different deployments run at the same time'
+        )
+
+    def handle(self, *args, **options):
+        deployments = Deployment.objects.filter(
+            source=Deployment.SOURCE_INTERNAL
+        ).select_related('project')
+        if options['project']:
+            projects = Project.objects.filter(name__in=options['project'])
+            missing = set(options['project']) - set(projects.values_list('name', flat=True))
+            if missing:
+                raise CommandError('Unknown projects: {}'.format(', '.join(sorted(missing))))
+
+            deployments = deployments.filter(project__in=projects)
+
+        # largest repositories first (shortest total time)
+        deployments = deployments.annotate(
+            packages=Count('available_packages')
+        ).order_by('-packages', 'id')
+
+        build_ids = [
+            RepositoryBuild.objects.request(deploy, immediate=True).id
+            for deploy in deployments
+        ]
+        total = len(build_ids)
+        self.stdout.write('Building {} repositories ({} processes)'.format(
+            total, max(options['processes'], 1)
+        ))
+
+        start = time.time()
+        done = 0
+        failed = []
+        build_time = 0
+        for build_id, name, status, seconds in run_repository_builds(
+            build_ids, max(options['processes'], 1)
+        ):
+            done += 1
+            build_time += seconds
+            if status == RepositoryBuild.STATUS_FAILED:
+                failed.append(name)
+
+            self.stdout.write('[{}/{}] {}: {} ({:.1f}s)'.format(
+                done, total, name, dict(RepositoryBuild.STATUS_CHOICES)[status], seconds
+            ))
+
+        wall_time = time.time() - start
+        self.stdout.write(
+            'Built {} repositories in {:.1f}s (build time {:.1f}s, {:.1f}x)'.format(
+                done, wall_time, build_time, build_time / wall_time if wall_time else 0
+            )
+        )
+        if done < total:
+            self.stdout.write('{} builds were taken by repository_worker'.format(total - done))
+        if failed:
+            self.stderr.write('Failed: {}'.format(', '.join(failed)))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...models import RepositoryBuild
+from ...tasks import run_repository_builds
+
+logger = logging.getLogger('migasfree')
+
+
+def process_builds(batch, processes):
+    """
+    Runs the pending builds whose quiet period is over
+    Returns the number of finished builds
+    """
+    finished = 0
+
+    build_ids = list(RepositoryBuild.objects.ready().values_list('id', flat=True)[:batch])
+    for build_id, name, status, seconds in run_repository_builds(build_ids, processes):
+        if status == RepositoryBuild.STATUS_FAILED:
+            logger.error('repository build %s (%s) failed', build_id, name)
+
+        finished += 1
+
+    return finished
+
+
+class Command(BaseCommand):
+    help = 'Builds queued repository metadata (MIGASFREE_ASYNC_REPOSITORY_BUILDS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.MIGASFREE_REPOSITORY_BUILD_PROCESSES,
+            help='builds of different deployments run at the same time'
+        )
+        parser.add_argument(
+            '--batch', type=int, default=10,
+            help='builds fetched in each iteration'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=1,
+            help='seconds to wait when no build is ready'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='exit when no build is ready'
+        )
+
+    def handle(self, *args, **options):
+        stale = RepositoryBuild.objects.reset_stale()
+        if stale:
+            self.stdout.write('{} interrupted builds marked as failed'.format(stale))
+
+        self.stdout.write('Queue: {}'.format(RepositoryBuild.objects.stats()))
+
+        while True:
+            finished = process_builds(options['batch'], max(options['processes'], 1))
+            if finished:
+                logger.debug('repository worker: %d builds finished', finished)
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['sleep'])
+
+        self.stdout.write('Queue: {}'.format(RepositoryBuild.objects.stats()))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from itertools import groupby
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ...models import Computer, HwNode
+
+logger = logging.getLogger('migasfree')
+
+
+def update_batch(ids):
+    """
+    Recomputes the hardware resume of a batch of computers
+    (nodes of the whole batch are loaded in one query)
+    Returns the number of updated computers
+    """
+    computers = Computer.objects.in_bulk(ids)
+    nodes = HwNode.objects.filter(
+        computer_id__in=ids
+    ).order_by('computer_id', 'id')
+
+    updated = 0
+    for computer_id, items in groupby(nodes.iterator(), lambda x: x.computer_id):
+        try:
+            computers[computer_id].update_hardware_resume(list(items))
+            updated += 1
+        except Exception:
+            logger.exception('hardware resume of computer %s', computer_id)
+
+    return updated
+
+
+def work(ids):
+    connections.close_all()  # each process opens its own connection
+
+    return update_batch(ids)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the hardware resume of all computers with hardware'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='number of worker processes'
+        )
+        parser.add_argument(
+            '--batch', type=int, default=500,
+            help='computers processed in each batch'
+        )
+
+    def handle(self, *args, **options):
+        processes = max(options['processes'], 1)
+        batch = max(options['batch'], 1)
+
+        ids = list(
+            HwNode.objects.filter(parent=None).order_by(
+                'computer_id'
+            ).values_list('computer_id', flat=True).distinct()
+        )
+        batches = [ids[i:i + batch] for i in range(0, len(ids), batch)]
+
+        if processes == 1:
+            updated = sum(update_batch(item) for item in batches)
+        else:
+            connections.close_all()
+            pool = Pool(processes)
+            try:
+                updated = sum(pool.imap_unordered(work, batches))
+            finally:
+                pool.close()
+                pool.join()
+
+        self.stdout.write('{} of {} computers updated'.format(updated, len(ids)))
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+
+from multiprocessing import Process
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from ...api import apply_upload
+from ...models import UploadJob
+
+logger = logging.getLogger('migasfree')
+
+
+def process_jobs(partition, partitions, batch):
+    """
+    Applies a batch of ready jobs of a partition (computer_id % partitions)
+    Jobs of a computer are applied in order: if one of them must wait
+    (or fails), the following ones wait too
+    Returns the number of applied jobs
+    """
+    applied = 0
+    blocked = set()
+
+    for job in UploadJob.objects.ready(partition, partitions).select_related(
+        'computer', 'computer__project'
+    )[:batch]:
+        if job.computer_id in blocked:
+            continue
+
+        try:
+            with transaction.atomic():
+                locked = list(UploadJob.objects.select_for_update(
+                    skip_locked=True
+                ).filter(pk=job.pk, status=UploadJob.STATUS_PENDING))
+                if not locked:  # taken by another worker
+                    blocked.add(job.computer_id)
+                    continue
+
+                apply_upload(job.computer, job.command, job.get_payload())
+                job.delete()
+
+            applied += 1
+        except Exception as e:
+            logger.exception('upload job %s (%s)', job.id, job)
+            job.retry_later(str(e))
+            blocked.add(job.computer_id)
+
+    return applied
+
+
+def work(partition, partitions, batch, sleep, once):
+    connections.close_all()  # each process opens its own connection
+
+    while True:
+        applied = process_jobs(partition, partitions, batch)
+        if applied:
+            logger.debug(
+                'upload worker %d/%d: %d jobs applied', partition, partitions, applied
+            )
+        elif once:
+            break
+        else:
+            time.sleep(sleep)
+
+
+class Command(BaseCommand):
+    help = 'Applies queued client uploads (MIGASFREE_ASYNC_UPLOADS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='number of worker processes (jobs are partitioned by computer)'
+        )
+        parser.add_argument(
+            '--batch', type=int, default=100,
+            help='jobs fetched in each iteration'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=1,
+            help='seconds to wait when the queue is empty'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='exit when the queue is empty'
+        )
+
+    def handle(self, *args, **options):
+        processes = max(options['processes'], 1)
+        self.stdout.write('Queue: {}'.format(UploadJob.objects.stats()))
+
+        if processes == 1:
+            work(0, 1, options['batch'], options['sleep'], options['once'])
+        else:
+            connections.close_all()
+            pool = [
+                Process(
+                    target=work,
+                    args=(i, processes, options['batch'], options['sleep'], options['once'])
+                ) for i in range(processes)
+            ]
+            for item in pool:
+                item.start()
+            for item in pool:
+                item.join()
+
+        self.stdout.write('Queue: {}'.format(UploadJob.objects.stats()))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-process counters and histograms (per server process)
+"""
+
+import threading
+
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)  # bytes
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800)  # seconds
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        buckets = {}
+        for i, limit in enumerate(self.buckets):
+            buckets['<={}'.format(limit)] = self.counts[i]
+        buckets['+Inf'] = self.counts[-1]
+
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'avg': self.sum / self.count if self.count else 0,
+            'buckets': buckets,
+        }
+
+
+class Metrics(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(buckets)
+            self._histograms[name].observe(value)
+
+    def counter(self, name):
+        return self._counters.get(name, 0)
+
+    def histogram(self, name):
+        with self._lock:
+            if name in self._histograms:
+                return self._histograms[name].as_dict()
+
+        return None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'histograms': {
+                    name: item.as_dict() for name, item in self._histograms.items()
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+
+metrics = Metrics()
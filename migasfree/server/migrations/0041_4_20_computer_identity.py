@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+MAC_LENGTH = 12
+
+
+def populate_mac_addresses(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+
+    Computer = apps.get_model('server', 'Computer')
+    MacAddress = apps.get_model('server', 'MacAddress')
+
+    computers = Computer.objects.using(db_alias).exclude(
+        mac_address__isnull=True
+    ).exclude(mac_address='').values_list('id', 'mac_address').order_by('id')
+
+    last_id = 0
+    while True:
+        batch = list(computers.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+
+        objs = []
+        for computer_id, mac_address in batch:
+            value = mac_address.upper().replace(':', '')
+            tokens = set(
+                value[i:i + MAC_LENGTH]
+                for i in range(0, len(value) - MAC_LENGTH + 1, MAC_LENGTH)
+            )
+            objs.extend(
+                MacAddress(computer_id=computer_id, value=token)
+                for token in tokens
+            )
+
+        MacAddress.objects.using(db_alias).bulk_create(objs)
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0040_4_19_query_fixtures'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='computer',
+            name='name',
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                max_length=50,
+                null=True,
+                verbose_name='name'
+            ),
+        ),
+        migrations.CreateModel(
+            name='MacAddress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(db_index=True, max_length=12, verbose_name='MAC address')),
+                ('computer', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='mac_addresses',
+                    to='server.Computer',
+                    verbose_name='computer'
+                )),
+            ],
+            options={
+                'verbose_name': 'MAC Address',
+                'verbose_name_plural': 'MAC Addresses',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='macaddress',
+            unique_together=set([('computer', 'value')]),
+        ),
+        migrations.RunPython(
+            populate_mac_addresses,
+            migrations.RunPython.noop
+        ),
+    ]
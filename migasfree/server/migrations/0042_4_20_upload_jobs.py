@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0041_4_20_computer_identity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('command', models.CharField(max_length=50, verbose_name='command')),
+                ('payload', models.TextField(verbose_name='payload')),
+                ('status', models.CharField(
+                    choices=[('P', 'Pending'), ('F', 'Failed')],
+                    db_index=True,
+                    default='P',
+                    max_length=1,
+                    verbose_name='status'
+                )),
+                ('attempts', models.IntegerField(default=0, verbose_name='attempts')),
+                ('next_attempt_at', models.DateTimeField(blank=True, null=True, verbose_name='next attempt')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date')),
+                ('computer', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    to='server.Computer',
+                    verbose_name='computer'
+                )),
+            ],
+            options={
+                'verbose_name': 'Upload Job',
+                'verbose_name_plural': 'Upload Jobs',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0042_4_20_upload_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='computer',
+            name='hardware_digest',
+            field=models.CharField(
+                blank=True,
+                help_text='SHA-256 of the last accepted hardware capture',
+                max_length=64,
+                null=True,
+                verbose_name='hardware digest'
+            ),
+        ),
+        migrations.AddField(
+            model_name='computer',
+            name='last_hardware_change',
+            field=models.DateTimeField(
+                blank=True,
+                null=True,
+                verbose_name='last hardware change'
+            ),
+        ),
+    ]
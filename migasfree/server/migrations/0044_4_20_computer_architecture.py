@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0043_4_20_hardware_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='computer',
+            name='architecture',
+            field=models.SmallIntegerField(
+                blank=True,
+                help_text='bits',
+                null=True,
+                verbose_name='architecture'
+            ),
+        ),
+    ]
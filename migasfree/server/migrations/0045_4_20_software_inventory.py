@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def parse_inventory(pkgs):
+    ret = set()
+    for line in (pkgs or '').splitlines():
+        line = line.strip()
+        if line.startswith('+'):
+            line = line[1:]
+        elif line.startswith('-'):
+            continue
+
+        if not line:
+            continue
+
+        parts = line.rsplit('_', 2)
+        ret.add((
+            parts[0][:255],
+            parts[1][:255] if len(parts) > 1 else '',
+            parts[2][:20] if len(parts) > 2 else ''
+        ))
+
+    return ret
+
+
+def populate_software_inventory(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+
+    Computer = apps.get_model('server', 'Computer')
+    SoftwareName = apps.get_model('server', 'SoftwareName')
+    SoftwareVersion = apps.get_model('server', 'SoftwareVersion')
+    SoftwareInventory = apps.get_model('server', 'SoftwareInventory')
+
+    computers = Computer.objects.using(db_alias).exclude(
+        software_inventory__isnull=True
+    ).exclude(software_inventory='').values_list(
+        'id', 'software_inventory'
+    ).order_by('id')
+
+    names = {}  # name: id
+    versions = {}  # (version, architecture): id
+
+    last_id = 0
+    while True:
+        batch = list(computers.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+
+        inventories = [
+            (computer_id, parse_inventory(pkgs)) for computer_id, pkgs in batch
+        ]
+
+        new_names = set(
+            item[0] for _, items in inventories for item in items
+        ) - set(names)
+        SoftwareName.objects.using(db_alias).bulk_create(
+            [SoftwareName(name=name) for name in new_names],
+            batch_size=1000
+        )
+        names.update(
+            (obj.name, obj.id) for obj in SoftwareName.objects.using(
+                db_alias
+            ).filter(name__in=new_names)
+        )
+
+        new_versions = set(
+            item[1:] for _, items in inventories for item in items
+        ) - set(versions)
+        SoftwareVersion.objects.using(db_alias).bulk_create(
+            [
+                SoftwareVersion(version=version, architecture=architecture)
+                for version, architecture in new_versions
+            ],
+            batch_size=1000
+        )
+        for obj in SoftwareVersion.objects.using(db_alias).filter(
+            version__in=set(item[0] for item in new_versions)
+        ):
+            versions[(obj.version, obj.architecture)] = obj.id
+
+        SoftwareInventory.objects.using(db_alias).bulk_create([
+            SoftwareInventory(
+                computer_id=computer_id,
+                name_id=names[name],
+                version_id=versions[(version, architecture)]
+            )
+            for computer_id, items in inventories
+            for name, version, architecture in items
+        ], batch_size=1000)
+
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0044_4_20_computer_architecture'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SoftwareName',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='name')),
+            ],
+            options={
+                'verbose_name': 'Software Name',
+                'verbose_name_plural': 'Software Names',
+            },
+        ),
+        migrations.CreateModel(
+            name='SoftwareVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=255, verbose_name='version')),
+                ('architecture', models.CharField(blank=True, max_length=20, verbose_name='architecture')),
+            ],
+            options={
+                'verbose_name': 'Software Version',
+                'verbose_name_plural': 'Software Versions',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='softwareversion',
+            unique_together=set([('version', 'architecture')]),
+        ),
+        migrations.CreateModel(
+            name='SoftwareInventory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('computer', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='software',
+                    to='server.Computer',
+                    verbose_name='computer'
+                )),
+                ('name', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    to='server.SoftwareName',
+                    verbose_name='name'
+                )),
+                ('version', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    to='server.SoftwareVersion',
+                    verbose_name='version'
+                )),
+            ],
+            options={
+                'verbose_name': 'Software Inventory',
+                'verbose_name_plural': 'Software Inventory',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='softwareinventory',
+            unique_together=set([('computer', 'name', 'version')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='softwareinventory',
+            index_together=set([('name', 'version')]),
+        ),
+        migrations.RunPython(
+            populate_software_inventory,
+            migrations.RunPython.noop
+        ),
+    ]
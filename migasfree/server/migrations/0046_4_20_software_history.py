@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import zlib
+
+import django.db.models.deletion
+
+from django.db import migrations, models
+
+BATCH_SIZE = 200
+
+
+def move_software_history(apps, schema_editor):
+    """
+    Current history of each computer is saved as one chunk
+    dated when the computer was created (its oldest possible date)
+    """
+    db_alias = schema_editor.connection.alias
+
+    Computer = apps.get_model('server', 'Computer')
+    SoftwareHistory = apps.get_model('server', 'SoftwareHistory')
+
+    computers = Computer.objects.using(db_alias).exclude(
+        software_history__isnull=True
+    ).exclude(software_history='').values_list(
+        'id', 'created_at', 'software_history'
+    ).order_by('id')
+
+    last_id = 0
+    while True:
+        batch = list(computers.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+
+        objs = []
+        for computer_id, created_at, history in batch:
+            data = history.encode('utf-8')
+            objs.append(SoftwareHistory(
+                computer_id=computer_id,
+                created_at=created_at or datetime.datetime.now(),
+                content=zlib.compress(data),
+                size=len(data)
+            ))
+
+        SoftwareHistory.objects.using(db_alias).bulk_create(objs)
+        last_id = batch[-1][0]
+
+
+def restore_software_history(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+
+    Computer = apps.get_model('server', 'Computer')
+    SoftwareHistory = apps.get_model('server', 'SoftwareHistory')
+
+    computer_ids = SoftwareHistory.objects.using(db_alias).values_list(
+        'computer_id', flat=True
+    ).distinct().order_by('computer_id')
+
+    for computer_id in computer_ids.iterator():
+        history = '\n\n'.join(
+            zlib.decompress(bytes(content)).decode('utf-8')
+            for content in SoftwareHistory.objects.using(db_alias).filter(
+                computer_id=computer_id
+            ).order_by('created_at', 'id').values_list('content', flat=True)
+        )
+        Computer.objects.using(db_alias).filter(
+            id=computer_id
+        ).update(software_history=history)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0045_4_20_software_inventory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SoftwareHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=datetime.datetime.now, verbose_name='date')),
+                ('content', models.BinaryField(verbose_name='content')),
+                ('size', models.IntegerField(
+                    default=0,
+                    help_text='bytes (uncompressed)',
+                    verbose_name='size'
+                )),
+                ('computer', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='software_history_chunks',
+                    to='server.Computer',
+                    verbose_name='computer'
+                )),
+            ],
+            options={
+                'verbose_name': 'Software History',
+                'verbose_name_plural': 'Software History',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='softwarehistory',
+            index_together=set([('computer', 'created_at')]),
+        ),
+        migrations.RunPython(
+            move_software_history,
+            restore_software_history
+        ),
+        migrations.RemoveField(
+            model_name='computer',
+            name='software_history',
+        ),
+    ]
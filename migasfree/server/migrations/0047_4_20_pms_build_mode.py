@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0046_4_20_software_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pms',
+            name='build_mode',
+            field=models.CharField(
+                choices=[('script', 'Script (create repository)'), ('apt', 'APT indexer')],
+                default='script',
+                help_text='How the metadata of repositories is created. '
+                          'APT indexer writes the same files than the apt-get '
+                          'script without running it.',
+                max_length=10,
+                verbose_name='build mode'
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0047_4_20_pms_build_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackageDigest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, unique=True, verbose_name='path')),
+                ('size', models.BigIntegerField(verbose_name='size')),
+                ('mtime', models.FloatField(verbose_name='modification time')),
+                ('md5', models.CharField(max_length=32, verbose_name='MD5')),
+                ('sha1', models.CharField(max_length=40, verbose_name='SHA1')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA256')),
+                ('sha512', models.CharField(max_length=128, verbose_name='SHA512')),
+                ('headers', models.TextField(blank=True, null=True, verbose_name='headers')),
+            ],
+            options={
+                'verbose_name': 'Package Digest',
+                'verbose_name_plural': 'Package Digests',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0048_4_20_package_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepositoryBuild',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(
+                    choices=[('P', 'Pending'), ('R', 'Running'), ('D', 'Done'), ('F', 'Failed')],
+                    db_index=True,
+                    default='P',
+                    max_length=1,
+                    verbose_name='status'
+                )),
+                ('requests', models.IntegerField(default=0, verbose_name='requests')),
+                ('requested_at', models.DateTimeField(verbose_name='requested at')),
+                ('not_before', models.DateTimeField(verbose_name='not before')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('output', models.TextField(blank=True, null=True, verbose_name='output')),
+                ('deployment', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    to='server.Deployment',
+                    verbose_name='deployment'
+                )),
+            ],
+            options={
+                'verbose_name': 'Repository Build',
+                'verbose_name_plural': 'Repository Builds',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0049_4_20_repository_build'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=250, unique=True, verbose_name='name')),
+                ('version', models.BigIntegerField(verbose_name='version')),
+            ],
+            options={
+                'verbose_name': 'Cache Version',
+                'verbose_name_plural': 'Cache Versions',
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# the createrepo checksum cache is kept in the staging tree of the
+# deployment (outside the published repository) between builds
+OLD_SCRIPT = "_DIR=%PATH%/%REPONAME%\nrm -rf $_DIR/repodata\nrm -rf $_DIR/checksum\ncreaterepo -c checksum $_DIR\ngpg -u migasfree-repository --homedir %KEYS%/.gnupg --detach-sign --armor $_DIR/repodata/repomd.xml\n"
+NEW_SCRIPT = "_DIR=%PATH%/%REPONAME%\nrm -rf $_DIR/repodata\nrm -rf $_DIR/checksum\ncreaterepo -c %PATH%/.checksum $_DIR\ngpg -u migasfree-repository --homedir %KEYS%/.gnupg --detach-sign --armor $_DIR/repodata/repomd.xml\n"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0050_4_20_cache_version'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [(
+                "UPDATE server_pms SET createrepo=%s WHERE id=1 AND name='yum' AND createrepo=%s;",
+                [NEW_SCRIPT, OLD_SCRIPT]
+            )],
+            [(
+                "UPDATE server_pms SET createrepo=%s WHERE id=1 AND name='yum' AND createrepo=%s;",
+                [OLD_SCRIPT, NEW_SCRIPT]
+            )]
+        ),
+        migrations.RunSQL(
+            [(
+                "UPDATE server_pms SET createrepo=%s WHERE id=2 AND name='zypper' AND createrepo=%s;",
+                [NEW_SCRIPT, OLD_SCRIPT]
+            )],
+            [(
+                "UPDATE server_pms SET createrepo=%s WHERE id=2 AND name='zypper' AND createrepo=%s;",
+                [OLD_SCRIPT, NEW_SCRIPT]
+            )]
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0051_4_20_createrepo_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=250, unique=True, verbose_name='name')),
+                ('value', models.BigIntegerField(default=0, verbose_name='value')),
+            ],
+            options={
+                'verbose_name': 'Stats Counter',
+                'verbose_name_plural': 'Stats Counters',
+            },
+        ),
+    ]
@@ -33,6 +33,12 @@ from .device_logical import DeviceLogical
 
 from .user import User
 from .computer import Computer
+from .mac_address import MacAddress
+from .upload_job import UploadJob
+from .software_inventory import (
+    SoftwareName, SoftwareVersion, SoftwareInventory
+)
+from .software_history import SoftwareHistory
 
 from .synchronization import Synchronization
 from .hw_node import HwNode
@@ -54,4 +60,8 @@ from .schedule_delay import ScheduleDelay
 
 from .store import Store
 from .package import Package
+from .package_digest import PackageDigest
 from .deployment import Deployment, InternalSource, ExternalSource
+from .repository_build import RepositoryBuild
+from .cache_version import CacheVersion
+from .stats_counter import StatsCounter
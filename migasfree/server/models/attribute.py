@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.db.models import Q
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -20,22 +20,19 @@ class DomainAttributeManager(models.Manager):
                 Q(id__in=user.get_domain_tags())
             )
 
-        return qs.defer(
-            'computer__software_inventory',
-            'computer__software_history'
-        )
+        return qs.defer('computer__software_inventory')
 
 
 class AttributeManager(DomainAttributeManager):
-    def create(self, property_att, value, description=None):
+    @staticmethod
+    def _clean(value, description=None):
         """
         if value = "text~other", description = "other"
+        returns (value, description, original_value)
         """
 
         if value.count('~') == 1:
             value, description = value.split('~')
-        else:
-            description = description
 
         value = value.strip()  # clean field
         original_value = value
@@ -43,39 +40,109 @@ class AttributeManager(DomainAttributeManager):
         if len(value) > Attribute.VALUE_LEN:
             value = value[:Attribute.VALUE_LEN]
 
-        queryset = Attribute.objects.filter(
-            property_att=property_att, value=value
-        )
-        if queryset.exists():
-            return queryset[0]
+        return value, description, original_value
 
-        if property_att.auto_add is False:
-            raise ValidationError(
-                _('The attribute cannot be created because'
-                  ' property prevents it')
+    @staticmethod
+    def _notify_truncated(obj, original_value):
+        Notification.objects.create(
+            ugettext(
+                'The value of the attribute [%s] has more than %d characters. '
+                'The original value is truncated: %s') % (
+                '<a href="{}">{}</a>'.format(
+                    reverse('admin:server_attribute_change', args=(obj.id,)),
+                    obj
+                ),
+                Attribute.VALUE_LEN,
+                original_value
             )
+        )
 
-        obj = Attribute()
-        obj.property_att = property_att
-        obj.value = value
-        obj.description = description
-        obj.save()
-
-        if original_value != obj.value:
-            Notification.objects.create(
-                ugettext(
-                    'The value of the attribute [%s] has more than %d characters. '
-                    'The original value is truncated: %s') % (
-                    '<a href="{}">{}</a>'.format(
-                        reverse('admin:server_attribute_change', args=(obj.id,)),
-                        obj
-                    ),
-                    Attribute.VALUE_LEN,
-                    original_value
-                )
-            )
+    def create(self, property_att, value, description=None):
+        return self.resolve([(property_att, value, description)])[0]
+
+    def resolve(self, items, clean=True):
+        """
+        Batch version of create
+        items: [(property_att, value[, description]), ...]
+        returns the attributes in the same order (one query to select the
+        existing ones, one bulk insert for the missing ones)
+        clean=False uses values as they are (like get_or_create)
+        """
+        keys = []
+        pending = {}  # (property_id, value): (property_att, description, original_value)
+        for item in items:
+            property_att, value = item[0], item[1]
+            description = item[2] if len(item) > 2 else None
+            if clean:
+                value, description, original_value = self._clean(value, description)
+            else:
+                original_value = value
+
+            key = (property_att.id, value)
+            keys.append(key)
+            if key not in pending:
+                pending[key] = (property_att, description, original_value)
+
+        found = self._select(pending.keys())
+
+        missing = [key for key in pending if key not in found]
+        if clean:
+            for key in missing:
+                if pending[key][0].auto_add is False:
+                    raise ValidationError(
+                        _('The attribute cannot be created because'
+                          ' property prevents it')
+                    )
+
+        if missing:
+            objs = [
+                Attribute(
+                    property_att=pending[key][0],
+                    value=key[1],
+                    description=pending[key][1]
+                ) for key in missing
+            ]
+            try:
+                with transaction.atomic():
+                    self.bulk_create(objs)
+            except IntegrityError:  # concurrent sync has created some of them
+                for obj in objs:
+                    obj.pk = self.get_or_create(
+                        property_att=obj.property_att,
+                        value=obj.value,
+                        defaults={'description': obj.description}
+                    )[0].pk
+
+            if any(obj.pk is None for obj in objs):
+                created = self._select(missing)
+                for obj in objs:
+                    obj.pk = created[(obj.property_att_id, obj.value)].pk
+
+            for obj in objs:
+                found[(obj.property_att_id, obj.value)] = obj
+                if clean and pending[(obj.property_att_id, obj.value)][2] != obj.value:
+                    self._notify_truncated(
+                        obj, pending[(obj.property_att_id, obj.value)][2]
+                    )
+
+        return [found[key] for key in keys]
+
+    def _select(self, keys):
+        values = {}
+        for property_id, value in keys:
+            values.setdefault(property_id, []).append(value)
+
+        if not values:
+            return {}
+
+        condition = Q()
+        for property_id, lst in values.items():
+            condition |= Q(property_att_id=property_id, value__in=lst)
 
-        return obj
+        return {
+            (item.property_att_id, item.value): item
+            for item in self.get_queryset().filter(condition).order_by()
+        }
 
 
 class Attribute(models.Model, MigasLink):
@@ -145,44 +212,46 @@ class Attribute(models.Model, MigasLink):
             return super(Attribute, self).delete(using, keep_parents)
 
     @staticmethod
-    def process_kind_property(property_att, value):
-        attributes = []
+    def kind_property_values(property_att, value):
+        values = []
 
         if property_att.kind == "N":  # Normal
-            obj = Attribute.objects.create(property_att, value)
-            attributes.append(obj.id)
+            values.append(value)
 
         if property_att.kind == "-":  # List
             lst = value.split(",")
             for item in lst:
                 item = item.replace('\n', '')
                 if item:
-                    obj = Attribute.objects.create(property_att, item)
-                    attributes.append(obj.id)
+                    values.append(item)
 
         if property_att.kind == "R" or property_att.kind == "L":
             if property_att.sort == 'server':
-                obj = Attribute.objects.create(property_att, '')
-                attributes.append(obj.id)
+                values.append('')
 
             lst = value.split(".")
             pos = 0
 
             if property_att.kind == "R":  # Adds right
                 for item in lst:
-                    obj = Attribute.objects.create(property_att, value[pos:])
-                    attributes.append(obj.id)
+                    values.append(value[pos:])
                     pos += len(item) + 1
 
             if property_att.kind == "L":  # Adds left
                 for item in lst:
                     pos += len(item) + 1
-                    obj = Attribute.objects.create(
-                        property_att, value[0:pos - 1]
-                    )
-                    attributes.append(obj.id)
+                    values.append(value[0:pos - 1])
 
-        return attributes
+        return values
+
+    @staticmethod
+    def process_kind_property(property_att, value):
+        return [
+            obj.id for obj in Attribute.objects.resolve(
+                (property_att, item)
+                for item in Attribute.kind_property_values(property_att, value)
+            )
+        ]
 
     class Meta:
         app_label = 'server'
@@ -247,58 +316,41 @@ class BasicAttribute(Attribute):
 
     @staticmethod
     def process(**kwargs):
-        properties = dict(Property.objects.filter(
-            enabled=True, sort='basic'
-        ).values_list('prefix', 'id'))
+        properties = {
+            item.prefix: item for item in Property.objects.filter(
+                enabled=True, sort='basic'
+            )
+        }
 
-        basic_attributes = []
+        items = []
 
         if 'SET' in properties.keys():
-            obj, _ = Attribute.objects.get_or_create(
-                property_att=Property.objects.get(pk=properties['SET']),
-                value='ALL SYSTEMS'  # FIXME 'All Systems'
-            )
-            basic_attributes.append(obj.id)
+            items.append((properties['SET'], 'ALL SYSTEMS'))  # FIXME 'All Systems'
 
+        cid = None
         if 'CID' in properties.keys() and 'id' in kwargs:
-            description = kwargs['description']
-            obj, _ = Attribute.objects.get_or_create(
-                property_att=Property.objects.get(pk=properties['CID']),
-                value=str(kwargs['id']),
-                defaults={'description': description}
-            )
-            obj.update_description(description)
-            basic_attributes.append(obj.id)
-
-        if 'PLT' in properties.keys() and 'platform' in kwargs:
-            obj, _ = Attribute.objects.get_or_create(
-                property_att=Property.objects.get(pk=properties['PLT']),
-                value=kwargs['platform']
-            )
-            basic_attributes.append(obj.id)
-
-        if 'IP' in properties.keys() and 'ip_address' in kwargs:
-            obj, _ = Attribute.objects.get_or_create(
-                property_att=Property.objects.get(pk=properties['IP']),
-                value=kwargs['ip_address']
-            )
-            basic_attributes.append(obj.id)
-
-        if 'PRJ' in properties.keys() and 'project' in kwargs:
-            obj, _ = Attribute.objects.get_or_create(
-                property_att=Property.objects.get(pk=properties['PRJ']),
-                value=kwargs['project']
-            )
-            basic_attributes.append(obj.id)
-
-        if 'USR' in properties.keys() and 'user' in kwargs:
-            obj, _ = Attribute.objects.get_or_create(
-                property_att=Property.objects.get(pk=properties['USR']),
-                value=kwargs['user']
-            )
-            basic_attributes.append(obj.id)
-
-        return basic_attributes
+            cid = len(items)
+            items.append((
+                properties['CID'],
+                str(kwargs['id']),
+                kwargs['description']
+            ))
+
+        for prefix, key in [
+            ('PLT', 'platform'),
+            ('IP', 'ip_address'),
+            ('PRJ', 'project'),
+            ('USR', 'user'),
+        ]:
+            if prefix in properties.keys() and key in kwargs:
+                items.append((properties[prefix], kwargs[key]))
+
+        basic_attributes = Attribute.objects.resolve(items, clean=False)
+
+        if cid is not None:
+            basic_attributes[cid].update_description(kwargs['description'])
+
+        return [obj.id for obj in basic_attributes]
 
     class Meta:
         verbose_name = _("Basic Attribute")
@@ -4,10 +4,13 @@ from django.db import models
 from django.db.models import Q
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
-from django.db.models.signals import pre_delete, pre_save, m2m_changed
+from django.db.models.signals import (
+    pre_delete, pre_save, post_save, post_delete, m2m_changed,
+)
 from django.dispatch import receiver
 
 from . import Property, Attribute, MigasLink
+from ..cache import CompiledCache
 from ..utils import sort_depends
 
 
@@ -96,53 +99,69 @@ class AttributeSet(models.Model, MigasLink):
     @staticmethod
     def sets_dependencies():
         sets = {}
-        for item in AttributeSet.objects.filter(enabled=True):
-            sets[item.id] = []
-
-            for subset in item.included_attributes.filter(
-                ~Q(value='ALL SYSTEMS')
-            ).filter(
-                property_att__prefix='SET'
+        for item in AttributeSet.objects.filter(enabled=True).values_list('id', flat=True):
+            sets[item] = []
+
+        ids = dict(AttributeSet.objects.values_list('name', 'id'))
+
+        for relation in [
+            AttributeSet.included_attributes.through,
+            AttributeSet.excluded_attributes.through
+        ]:
+            for set_id, value in relation.objects.filter(
+                attributeset__enabled=True,
+                attribute__property_att__prefix='SET'
             ).filter(
-                ~Q(value=item.name)
-            ):
-                sets[item.id].append(AttributeSet.objects.get(name=subset.value).id)
-
-            for subset in item.excluded_attributes.filter(
-                ~Q(value='ALL SYSTEMS')
-            ).filter(
-                property_att__prefix='SET'
-            ).filter(
-                ~Q(value=item.name)
-            ):
-                sets[item.id].append(AttributeSet.objects.get(name=subset.value).id)
+                ~Q(attribute__value='ALL SYSTEMS')
+            ).values_list('attributeset_id', 'attribute__value'):
+                if value in ids and ids[value] != set_id:
+                    sets[set_id].append(ids[value])
 
         return sets
 
     @staticmethod
-    def process(attributes):
-        property_set = Property.objects.get(prefix='SET', sort='basic')
-
+    def compile(key=None):
         depends = AttributeSet.sets_dependencies()
-        sets = []
         try:
             sets = sort_depends(depends)
         except ValueError:
-            pass
+            sets = []
+
+        included = {}
+        excluded = {}
+        for relation, target in [
+            (AttributeSet.included_attributes.through, included),
+            (AttributeSet.excluded_attributes.through, excluded)
+        ]:
+            for set_id, attribute_id in relation.objects.filter(
+                attributeset_id__in=sets
+            ).values_list('attributeset_id', 'attribute_id'):
+                target.setdefault(set_id, set()).add(attribute_id)
+
+        names = dict(
+            AttributeSet.objects.filter(id__in=sets).values_list('id', 'name')
+        )
+        attributes = dict(Attribute.objects.filter(
+            property_att__prefix='SET',
+            property_att__sort='basic',
+            value__in=list(names.values())
+        ).values_list('value', 'id'))
+
+        return CompiledAttributeSets([
+            (
+                names[item],
+                attributes.get(names[item]),
+                frozenset(included.get(item, [])),
+                frozenset(excluded.get(item, []))
+            ) for item in sets
+        ])
 
-        att_id = []
-        for item in sets:
-            for att_set in AttributeSet.objects.filter(
-                id=item
-            ).filter(
-                Q(included_attributes__id__in=attributes)
-            ).filter(
-                ~Q(excluded_attributes__id__in=attributes)
-            ).distinct():
-                att = Attribute.objects.create(property_set, att_set.name)
-                att_id.append(att.id)
-                # IMPORTANT: appends attribute to attribute list
-                attributes.append(att.id)
+    @staticmethod
+    def process(attributes):
+        att_id = compiled_attribute_sets.get().process(set(attributes))
+
+        # IMPORTANT: appends attribute to attribute list
+        attributes.extend(att_id)
 
         return att_id
 
@@ -153,6 +172,46 @@ class AttributeSet(models.Model, MigasLink):
         permissions = (("can_save_attributeset", "Can save Attribute Sets"),)
 
 
+class CompiledAttributeSets(object):
+    def __init__(self, sets):
+        """
+        :param sets: [(name, attribute_id, included ids, excluded ids), ...]
+                     in dependency order
+        """
+        self.sets = sets
+
+    def process(self, attributes):
+        """
+        :param attributes: set of attribute ids (it is updated)
+        :return: [attribute id of each set the attributes belong to, ...]
+        """
+        att_id = []
+        for name, attribute_id, included, excluded in self.sets:
+            if included.isdisjoint(attributes) or not excluded.isdisjoint(attributes):
+                continue
+
+            if attribute_id is None:
+                attribute_id = Attribute.objects.create(
+                    Property.objects.get(prefix='SET', sort='basic'),
+                    name
+                ).id
+
+            att_id.append(attribute_id)
+            attributes.add(attribute_id)
+
+        return att_id
+
+
+compiled_attribute_sets = CompiledCache('attribute_sets', AttributeSet.compile)
+
+
+@receiver(post_save, sender=AttributeSet)
+@receiver(post_delete, sender=AttributeSet)
+@receiver(post_delete, sender=Attribute)
+def invalidate_attribute_sets(sender, **kwargs):
+    compiled_attribute_sets.invalidate()
+
+
 @receiver(pre_save, sender=AttributeSet)
 def pre_save_attribute_set(sender, instance, **kwargs):
     if instance.id:
@@ -176,6 +235,9 @@ def pre_delete_attribute_set(sender, instance, **kwargs):
 @receiver(m2m_changed, sender=AttributeSet.included_attributes.through)
 @receiver(m2m_changed, sender=AttributeSet.excluded_attributes.through)
 def prevent_circular_dependencies(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        compiled_attribute_sets.invalidate()
+
     if action != 'pre_add':
         return
 
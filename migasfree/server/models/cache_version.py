@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+
+class CacheVersion(models.Model):
+    """
+    Version counters of the structures compiled by each server process
+    (see server.cache)
+    """
+    name = models.CharField(
+        verbose_name=_("name"),
+        max_length=250,
+        unique=True
+    )
+
+    version = models.BigIntegerField(
+        verbose_name=_("version")
+    )
+
+    def __str__(self):
+        return '{}: {}'.format(self.name, self.version)
+
+    class Meta:
+        app_label = 'server'
+        verbose_name = _("Cache Version")
+        verbose_name_plural = _("Cache Versions")
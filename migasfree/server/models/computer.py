@@ -2,7 +2,8 @@
 
 from datetime import datetime, timedelta
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q, Exists, OuterRef
 from django.db.models.aggregates import Count
 from django.db.models.functions import ExtractMonth, ExtractYear
 from django.db.models.signals import pre_save, post_save, pre_delete
@@ -16,6 +17,7 @@ from django.conf import settings
 from ..utils import (
     swap_m2m, remove_empty_elements_from_dict,
     strfdelta, list_difference, html_label,
+    uuid_change_format,
 )
 
 from . import (
@@ -31,10 +33,7 @@ class DomainComputerManager(models.Manager):
         if not user.is_view_all():
             qs = qs.filter(id__in=user.get_computers())
 
-        return qs.defer(
-            'software_inventory',
-            'software_history'
-        )
+        return qs.defer('software_inventory')
 
 
 class ProductiveManager(DomainComputerManager):
@@ -120,6 +119,64 @@ class ComputerManager(DomainComputerManager):
 
         return obj
 
+    def resolve(self, name, uuid):
+        """
+        Returns the computer identified by name and uuid (or None)
+        All the fallbacks are resolved in one query, in this order:
+            uuid, uuid with endian format changed,
+            MAC address (uuid in format '00000000-0000-0000-0000-AABBCCDDEEFF'),
+            name (compatibility with clients <= 2)
+        """
+        from .mac_address import MacAddress, MAC_LENGTH
+
+        is_uuid = len(uuid.split('-')) == 5  # client >= 3
+        swapped_uuid = uuid_change_format(uuid)
+        by_mac = uuid[0:8] == '0' * 8
+
+        uuids = [uuid, swapped_uuid]
+        if is_uuid:
+            uuids.append(name)
+        condition = Q(uuid__in=uuids)
+
+        qs = self.get_queryset()
+        if by_mac:
+            qs = qs.annotate(
+                by_mac=Exists(MacAddress.objects.filter(
+                    computer=OuterRef('pk'),
+                    value=uuid[-MAC_LENGTH:].upper()
+                ))
+            )
+            condition |= Q(by_mac=True)
+        if not is_uuid:
+            condition |= Q(name=name)
+
+        candidates = list(qs.filter(condition))
+
+        def first(test):
+            return next((item for item in candidates if test(item)), None)
+
+        computer = first(lambda item: item.uuid == uuid) \
+            or first(lambda item: item.uuid == swapped_uuid)
+        if computer:
+            return computer
+
+        if by_mac:
+            found = [item for item in candidates if item.by_mac]
+            if len(found) == 1:
+                return found[0]
+
+        # DEPRECATED. Only for compatibility with client <= 2
+        if is_uuid:
+            return first(lambda item: item.uuid == name)
+
+        computer = first(lambda item: item.name == name and item.uuid == name)
+        if computer:
+            return computer
+
+        found = [item for item in candidates if item.name == name]
+
+        return found[0] if len(found) == 1 else None
+
 
 class Computer(models.Model, MigasLink):
     STATUS_CHOICES = (
@@ -162,7 +219,8 @@ class Computer(models.Model, MigasLink):
         max_length=50,
         null=True,
         blank=True,
-        unique=False
+        unique=False,
+        db_index=True
     )
 
     fqdn = models.CharField(
@@ -206,13 +264,6 @@ class Computer(models.Model, MigasLink):
         blank=True,
     )
 
-    software_history = models.TextField(
-        verbose_name=_("software history"),
-        default="",
-        null=True,
-        blank=True
-    )
-
     default_logical_device = models.ForeignKey(
         DeviceLogical,
         on_delete=models.SET_NULL,
@@ -227,6 +278,20 @@ class Computer(models.Model, MigasLink):
         blank=True,
     )
 
+    hardware_digest = models.CharField(
+        verbose_name=_("hardware digest"),
+        max_length=64,
+        null=True,
+        blank=True,
+        help_text=_("SHA-256 of the last accepted hardware capture")
+    )
+
+    last_hardware_change = models.DateTimeField(
+        verbose_name=_("last hardware change"),
+        null=True,
+        blank=True,
+    )
+
     tags = models.ManyToManyField(
         ServerAttribute,
         blank=True,
@@ -300,6 +365,13 @@ class Computer(models.Model, MigasLink):
         blank=True
     )
 
+    architecture = models.SmallIntegerField(
+        verbose_name=_("architecture"),
+        null=True,
+        blank=True,
+        help_text=_("bits")
+    )
+
     mac_address = models.CharField(
         verbose_name=_("MAC address"),
         max_length=60,  # size for 5
@@ -351,6 +423,34 @@ class Computer(models.Model, MigasLink):
         return list(self.tags.values_list('id', flat=True)) \
             + list(self.sync_attributes.values_list('id', flat=True))
 
+    def update_sync_attributes(self, attributes):
+        """
+        Saves only the differences with the current sync attributes
+        :param attributes: [id1, id2, id3, ...]
+        :return: (added ids, removed ids)
+        """
+        through = Computer.sync_attributes.through
+
+        target = set(attributes)
+        current = set(through.objects.filter(
+            computer_id=self.id
+        ).values_list('attribute_id', flat=True))
+
+        added = sorted(target - current)
+        removed = sorted(current - target)
+
+        if removed:
+            through.objects.filter(
+                computer_id=self.id, attribute_id__in=removed
+            ).delete()
+
+        if added:
+            through.objects.bulk_create([
+                through(computer_id=self.id, attribute_id=pk) for pk in added
+            ])
+
+        return added, removed
+
     def get_attribute_sets(self):
         return self.sync_attributes.filter(property_att__prefix='SET')
 
@@ -387,39 +487,71 @@ class Computer(models.Model, MigasLink):
         self.save()
 
     def update_software_history(self, history):
+        from . import SoftwareHistory
+
         if history:
-            if self.software_history:
-                self.software_history += '\n\n' + history
-            else:
-                self.software_history = history
-            self.save()
+            SoftwareHistory.objects.create(self, history)
+
+    def get_software_history(self):
+        from . import SoftwareHistory
+
+        return '\n\n'.join(
+            chunk.get_content()
+            for chunk in SoftwareHistory.objects.by_computer(self.id).iterator()
+        )
+
+    get_software_history.short_description = _('software history')
 
     def update_software_inventory(self, pkgs):
+        """
+        Saves the inventory (and its normalized rows) only if it has changed
+        """
+        from . import SoftwareInventory
+
         if pkgs:
-            self.software_inventory = pkgs
-            self.save()
+            with transaction.atomic():
+                changed = Computer.objects.filter(pk=self.id).exclude(
+                    software_inventory=pkgs
+                ).update(software_inventory=pkgs)
+                self.software_inventory = pkgs
+                if changed:
+                    SoftwareInventory.objects.update_computer(self.id, pkgs)
 
     def update_last_hardware_capture(self):
         self.last_hardware_capture = datetime.now()
-        self.save()
+        self.save(update_fields=['last_hardware_capture'])
 
-    def update_hardware_resume(self):
-        from . import HwNode as Node
+    def update_hardware_digest(self, digest):
+        self.hardware_digest = digest
+        self.last_hardware_change = datetime.now()
+        self.save(update_fields=['hardware_digest', 'last_hardware_change'])
 
-        try:
-            self.product = Node.objects.get(
-                computer=self.id, parent=None
-            ).get_product()
-        except ObjectDoesNotExist:
-            self.product = None
+    def update_hardware_resume(self, nodes=None):
+        """
+        :param nodes: hardware nodes of computer (loaded if None)
+        """
+        from . import HwNode as Node, MacAddress
 
-        self.machine = 'V' if Node.get_is_vm(self.id) else 'P'
-        self.cpu = Node.get_cpu(self.id)
-        self.ram = Node.get_ram(self.id)
-        self.disks, self.storage = Node.get_storage(self.id)
-        self.mac_address = Node.get_mac_address(self.id)
+        if nodes is None:
+            nodes = list(Node.objects.filter(computer=self.id).order_by('id'))
 
-        self.save()
+        summary = Node.summarize(nodes)
+
+        self.product = summary['product']
+        self.machine = summary['machine']
+        self.cpu = summary['cpu']
+        self.ram = summary['ram']
+        self.disks = summary['disks']
+        self.storage = summary['storage']
+        self.mac_address = summary['mac_address']
+        self.architecture = summary['architecture']
+
+        self.save(update_fields=[
+            'product', 'machine', 'cpu', 'ram', 'disks',
+            'storage', 'mac_address', 'architecture',
+        ])
+
+        MacAddress.objects.update_computer(self.id, self.mac_address)
 
     def update_logical_devices(self, devices):
         """
@@ -462,6 +594,9 @@ class Computer(models.Model, MigasLink):
     def get_architecture(self):
         from .hw_node import HwNode
 
+        if self.architecture:
+            return self.architecture
+
         query = HwNode.objects.filter(
             computer=self.id,
             class_name='processor',
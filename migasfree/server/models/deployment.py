@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
 import os
-import shutil
 import datetime
 
 from django.db import models
@@ -10,15 +9,19 @@ from django.template.defaultfilters import slugify
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.db.models import Q
-from django.db.models.signals import pre_save, pre_delete
+from django.db.models.signals import (
+    pre_save, pre_delete, post_save, post_delete, m2m_changed,
+)
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 
-from ..utils import time_horizon
+from ..cache import CompiledCache
+from ..utils import time_horizon, to_list
 
 from . import (
     Computer,
     Domain,
+    Pms,
     Project,
     Package,
     Attribute,
@@ -285,56 +288,21 @@ class Deployment(models.Model, MigasLink):
         super(Deployment, self).save(force_insert, force_update, using, update_fields)
 
     @staticmethod
-    def available_deployments(computer, attributes):
+    def available(computer, attributes):
         """
-        Return available deployments for a computer and attributes list
+        Return available deployments (index entries) for a computer
+        and attributes list (without queries, see DeploymentIndex)
         """
-        # 1.- all deployments by attribute
-        attributed = Deployment.objects.filter(
-            project__id=computer.project.id,
-            enabled=True,
-            included_attributes__id__in=attributes,
-            start_date__lte=datetime.datetime.now().date()
-        ).filter(
-            Q(domain__isnull=True) | (
-                Q(domain__included_attributes__id__in=attributes) &
-                ~Q(domain__excluded_attributes__id__in=attributes)
-            )
-        ).values_list('id', flat=True)
-        lst = list(attributed)
-
-        # 2.- all deployments by schedule
-        scheduled = Deployment.objects.filter(
-            project__id=computer.project.id,
-            enabled=True,
-            schedule__delays__attributes__id__in=attributes
-        ).filter(
-            Q(domain__isnull=True) | (
-                Q(domain__included_attributes__id__in=attributes) &
-                ~Q(domain__excluded_attributes__id__in=attributes)
-            )
-        ).extra(
-            select={
-                'delay': 'server_scheduledelay.delay',
-                'duration': 'server_scheduledelay.duration'
-            }
+        return deployment_index.get(computer.project_id).available(
+            computer.id, attributes
         )
 
-        for deploy in scheduled:
-            for duration in range(0, deploy.duration):
-                if computer.id % deploy.duration == duration:
-                    if time_horizon(
-                        deploy.start_date, deploy.delay + duration
-                    ) <= datetime.datetime.now().date():
-                        lst.append(deploy.id)
-                        break
-
-        # 3.- excluded attributes
-        deployments = Deployment.objects.filter(id__in=lst).filter(
-            ~Q(excluded_attributes__id__in=attributes)
-        ).order_by('name')
-
-        return deployments
+    @staticmethod
+    def available_deployments(computer, attributes):
+        """
+        Return available deployments for a computer and attributes list
+        """
+        return [item.deployment for item in Deployment.available(computer, attributes)]
 
     def related_objects(self, model, user):
         """
@@ -488,9 +456,9 @@ def pre_save_deployment(sender, instance, **kwargs):
 
 @receiver(pre_delete, sender=Deployment)
 def pre_delete_deployment(sender, instance, **kwargs):
-    path = instance.path()
-    if os.path.exists(path):
-        shutil.rmtree(path)
+    from ..tasks import remove_repository_metadata
+
+    remove_repository_metadata(None, instance)
 
 
 class InternalSourceManager(models.Manager):
@@ -553,3 +521,209 @@ class ExternalSource(Deployment):
         verbose_name_plural = _("Deployments (external source)")
         permissions = (("can_save_externalsource", "Can save External Source"),)
         proxy = True
+
+
+class IndexedDeployment(object):
+    """
+    Deployment with its rules precomputed for a day
+    """
+    def __init__(self, deployment, included, excluded, domain, delays, today):
+        """
+        :param domain: (included ids, excluded ids) or None
+        :param delays: [(attribute ids, delay, duration), ...]
+        """
+        self.deployment = deployment
+        self.included = frozenset(included)
+        self.excluded = frozenset(excluded)
+        self.domain = domain
+        self.attributed = deployment.start_date <= today
+
+        # for each delay, computers (by id % duration) already reached
+        self.delays = [
+            (
+                frozenset(attributes),
+                duration,
+                [
+                    time_horizon(deployment.start_date, delay + slot) <= today
+                    for slot in range(duration)
+                ]
+            ) for attributes, delay, duration in delays
+        ]
+
+        self.source_template = deployment.get_source_template()
+        self.packages_to_install = to_list(deployment.packages_to_install)
+        self.packages_to_remove = to_list(deployment.packages_to_remove)
+
+    def is_available(self, computer_id, attributes):
+        if self.domain is not None:
+            included, excluded = self.domain
+            if included.isdisjoint(attributes) or not excluded.isdisjoint(attributes):
+                return False
+
+        if not self.excluded.isdisjoint(attributes):
+            return False
+
+        if self.attributed and not self.included.isdisjoint(attributes):
+            return True
+
+        for delay_attributes, duration, reached in self.delays:
+            if reached[computer_id % duration] \
+                    and not delay_attributes.isdisjoint(attributes):
+                return True
+
+        return False
+
+
+class DeploymentIndex(object):
+    """
+    Enabled deployments of a project, valid for the day it is built
+    """
+    def __init__(self, project_id):
+        self.date = datetime.datetime.now().date()
+
+        deployments = list(Deployment.objects.filter(
+            project_id=project_id,
+            enabled=True
+        ).select_related('project', 'project__pms').order_by('name'))
+        ids = [item.id for item in deployments]
+
+        included = self._relation(
+            Deployment.included_attributes.through.objects.filter(deployment_id__in=ids),
+            'deployment_id'
+        )
+        excluded = self._relation(
+            Deployment.excluded_attributes.through.objects.filter(deployment_id__in=ids),
+            'deployment_id'
+        )
+
+        domain_ids = set(item.domain_id for item in deployments if item.domain_id)
+        domain_included = self._relation(
+            Domain.included_attributes.through.objects.filter(domain_id__in=domain_ids),
+            'domain_id'
+        )
+        domain_excluded = self._relation(
+            Domain.excluded_attributes.through.objects.filter(domain_id__in=domain_ids),
+            'domain_id'
+        )
+
+        schedule_ids = set(item.schedule_id for item in deployments if item.schedule_id)
+        delay_attributes = self._relation(
+            ScheduleDelay.attributes.through.objects.filter(
+                scheduledelay__schedule_id__in=schedule_ids
+            ),
+            'scheduledelay_id'
+        )
+        delays = {}
+        for pk, schedule_id, delay, duration in ScheduleDelay.objects.filter(
+            schedule_id__in=schedule_ids
+        ).values_list('id', 'schedule_id', 'delay', 'duration'):
+            delays.setdefault(schedule_id, []).append(
+                (delay_attributes.get(pk, []), delay, duration)
+            )
+
+        self.deployments = [
+            IndexedDeployment(
+                item,
+                included.get(item.id, []),
+                excluded.get(item.id, []),
+                (
+                    frozenset(domain_included.get(item.domain_id, [])),
+                    frozenset(domain_excluded.get(item.domain_id, []))
+                ) if item.domain_id else None,
+                delays.get(item.schedule_id, []),
+                self.date
+            ) for item in deployments
+        ]
+
+        # attributes of the rules (the rest do not change availability)
+        attributes = set()
+        for item in self.deployments:
+            attributes.update(item.included, item.excluded)
+            if item.domain is not None:
+                attributes.update(*item.domain)
+            for delay_attributes, _duration, _reached in item.delays:
+                attributes.update(delay_attributes)
+        self.attributes = frozenset(attributes)
+
+    @staticmethod
+    def _relation(queryset, field):
+        ret = {}
+        for pk, attribute_id in queryset.values_list(field, 'attribute_id'):
+            ret.setdefault(pk, []).append(attribute_id)
+
+        return ret
+
+    def available(self, computer_id, attributes):
+        """
+        :return: [IndexedDeployment, ...] ordered by name
+        """
+        attributes = set(attributes)
+
+        return [
+            item for item in self.deployments
+            if item.is_available(computer_id, attributes)
+        ]
+
+    def schedule_slots(self, computer_id, attributes):
+        """
+        :return: [[duration, computer_id % duration], ...] of the schedule
+                 delays that match attributes
+        """
+        attributes = set(attributes)
+
+        return sorted(set(
+            (duration, computer_id % duration)
+            for item in self.deployments
+            for delay_attributes, duration, _reached in item.delays
+            if not delay_attributes.isdisjoint(attributes)
+        ))
+
+
+deployment_index = CompiledCache(
+    'deployments',
+    DeploymentIndex,
+    expired=lambda index: index.date != datetime.datetime.now().date()
+)
+
+
+@receiver(post_save, sender=Deployment)
+@receiver(post_save, sender=InternalSource)
+@receiver(post_save, sender=ExternalSource)
+@receiver(post_delete, sender=Deployment)
+@receiver(post_delete, sender=InternalSource)
+@receiver(post_delete, sender=ExternalSource)
+def invalidate_deployment_index(sender, instance, **kwargs):
+    deployment_index.invalidate(instance.project_id)
+
+
+@receiver(m2m_changed, sender=Deployment.included_attributes.through)
+@receiver(m2m_changed, sender=Deployment.excluded_attributes.through)
+def invalidate_deployment_index_attributes(sender, instance, action, reverse, **kwargs):
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+
+    if reverse:
+        deployment_index.invalidate()
+    else:
+        deployment_index.invalidate(instance.project_id)
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+@receiver(post_save, sender=ScheduleDelay)
+@receiver(post_delete, sender=ScheduleDelay)
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Pms)
+@receiver(post_delete, sender=Attribute)
+def invalidate_deployment_indexes(sender, **kwargs):
+    deployment_index.invalidate()
+
+
+@receiver(m2m_changed, sender=ScheduleDelay.attributes.through)
+@receiver(m2m_changed, sender=Domain.included_attributes.through)
+@receiver(m2m_changed, sender=Domain.excluded_attributes.through)
+def invalidate_deployment_indexes_attributes(sender, action, **kwargs):
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        deployment_index.invalidate()
@@ -61,19 +61,17 @@ class Domain(models.Model, MigasLink):
             defaults={'name': 'DOMAIN', 'kind': 'L'}
         )
 
-        att_id = []
-        for item in Domain.objects.all():
-            for att_domain in Domain.objects.filter(
-                id=item.id
-            ).filter(
-                Q(included_attributes__id__in=attributes)
-            ).filter(
-                ~Q(excluded_attributes__id__in=attributes)
-            ).distinct():
-                att = Attribute.objects.create(property_set, att_domain.name)
-                att_id.append(att.id)
-
-        return att_id
+        domains = Domain.objects.filter(
+            Q(included_attributes__id__in=attributes)
+        ).filter(
+            ~Q(excluded_attributes__id__in=attributes)
+        ).distinct().values_list('name', flat=True)
+
+        return [
+            att.id for att in Attribute.objects.resolve(
+                (property_set, name) for name in domains
+            )
+        ]
 
     def get_tags(self):
         tags = [Attribute.objects.get(property_att__prefix="DMN", value=self.name)]
@@ -2,10 +2,13 @@
 
 from django.db import models
 from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 
 from . import Attribute, UserProfile, MigasLink
+from ..cache import CompiledCache, invalidate_version
 
 
 class DomainFaultDefinitionManager(models.Manager):
@@ -99,6 +102,22 @@ class FaultDefinition(models.Model, MigasLink):
 
         return fault_definitions
 
+    @staticmethod
+    def rule_attributes(key=None):
+        """
+        :return: frozenset of attribute ids included or excluded
+                 by enabled fault definitions
+        """
+        return frozenset(
+            FaultDefinition.included_attributes.through.objects.filter(
+                faultdefinition__enabled=True
+            ).values_list('attribute_id', flat=True)
+        ) | frozenset(
+            FaultDefinition.excluded_attributes.through.objects.filter(
+                faultdefinition__enabled=True
+            ).values_list('attribute_id', flat=True)
+        )
+
     def related_objects(self, model, user):
         """
         Return Queryset with the related computers based in attributes
@@ -127,3 +146,19 @@ class FaultDefinition(models.Model, MigasLink):
         verbose_name_plural = _("Fault Definitions")
         permissions = (("can_save_faultdefinition", "Can save Fault Definition"),)
         ordering = ['name']
+
+
+fault_definition_attributes = CompiledCache('fault_definitions', FaultDefinition.rule_attributes)
+
+
+@receiver(post_save, sender=FaultDefinition)
+@receiver(post_delete, sender=FaultDefinition)
+def invalidate_fault_definitions(sender, **kwargs):
+    invalidate_version('fault_definitions')
+
+
+@receiver(m2m_changed, sender=FaultDefinition.included_attributes.through)
+@receiver(m2m_changed, sender=FaultDefinition.excluded_attributes.through)
+def invalidate_fault_definitions_attributes(sender, action, **kwargs):
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        invalidate_version('fault_definitions')
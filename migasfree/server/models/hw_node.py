@@ -2,7 +2,7 @@
 
 import re
 
-from django.db import models
+from django.db import connection, models
 from django.db.models import Sum, Q
 from django.urls import reverse
 from django.utils.translation import ugettext_lazy as _
@@ -54,6 +54,29 @@ class HwNodeManager(DomainHwNodeManager):
 
         return obj
 
+    def delete_computer(self, computer_id):
+        """
+        Set-based delete of the hardware of a computer
+        (without loading nodes in the deletion collector)
+        """
+        from . import HwCapability, HwConfiguration, HwLogicalName
+
+        node_table = HwNode._meta.db_table
+        with connection.cursor() as cursor:
+            for model in [HwCapability, HwConfiguration, HwLogicalName]:
+                cursor.execute(
+                    'DELETE FROM {} WHERE node_id IN '
+                    '(SELECT id FROM {} WHERE computer_id = %s)'.format(
+                        model._meta.db_table, node_table
+                    ),
+                    [computer_id]
+                )
+
+            cursor.execute(
+                'DELETE FROM {} WHERE computer_id = %s'.format(node_table),
+                [computer_id]
+            )
+
 
 class HwNode(models.Model, MigasLink):
     # Detect Virtual Machine with lshw:
@@ -316,6 +339,103 @@ class HwNode(models.Model, MigasLink):
 
         return query.count(), sum(capacity)
 
+    @staticmethod
+    def summarize(nodes):
+        """
+        Hardware resume of a computer in one pass over its nodes
+        (same rules as get_product, get_is_vm, get_is_docker, get_cpu,
+        get_ram, get_storage, get_mac_address and Computer.get_architecture)
+        """
+        roots = []
+        ethernet = []
+        memory = []
+        banks = []
+        cpus = []
+        disks = []
+        macs = []
+        processor_width = None
+        system_width = None
+
+        for node in nodes:
+            name = node.name or ''
+            class_name = node.class_name
+
+            if node.parent_id is None:
+                roots.append(node)
+
+            if class_name == 'network' and name == 'network' \
+                    and node.description == 'Ethernet interface':
+                ethernet.append(node)
+
+            if class_name == 'memory':
+                if name == 'memory':
+                    memory.append(node)
+                elif name.startswith('bank:'):
+                    banks.append(node)
+
+            if class_name == 'processor':
+                if name in ['cpu', 'cpu:0']:
+                    cpus.append(node)
+                if processor_width is None and node.width and node.width > 0:
+                    processor_width = node.width
+
+            if class_name == 'system' and system_width is None \
+                    and node.width and node.width > 0:
+                system_width = node.width
+
+            if class_name == 'disk' and node.size and node.size > 0:
+                disks.append(node.size)
+
+            if (class_name == 'network' and 'network' in name.lower()) or \
+                    (class_name == 'bridge' and 'bridge' in name.lower()):
+                if validate_mac(node.serial):
+                    macs.append(node.serial.upper().replace(':', ''))
+
+        is_docker = len(ethernet) == 1 and \
+            (ethernet[0].serial or '').upper().startswith('02:42:AC')
+
+        product = None
+        if len(roots) == 1:
+            root = roots[0]
+            if root.vendor:
+                product = HwNode.VIRTUAL_MACHINES.get(root.vendor, root.product)
+            elif is_docker:
+                product = 'docker'
+            else:
+                product = root.product or root.description
+
+        is_vm = len(roots) == 1 and (
+            roots[0].vendor in list(HwNode.VIRTUAL_MACHINES.keys()) or is_docker
+        )
+
+        if len(memory) == 1:
+            ram = memory[0].size
+        else:
+            sizes = [item.size for item in banks if item.size is not None]
+            ram = sum(sizes) if sizes else None
+
+        if len(cpus) == 1:
+            cpu = cpus[0].product or ''
+            for item in ['(R)', '(TM)', '@', 'CPU']:
+                cpu = cpu.replace(item, '')
+            cpu = cpu.strip()
+        elif len(cpus) == 0:
+            cpu = ''
+        else:
+            cpu = str(_('error'))
+
+        return {
+            'product': product,
+            'machine': 'V' if is_vm else 'P',
+            'is_docker': is_docker,
+            'cpu': cpu,
+            'ram': ram,
+            'disks': len(disks),
+            'storage': sum(disks),
+            'mac_address': ''.join(macs),
+            'architecture': processor_width or system_width,
+        }
+
     class Meta:
         app_label = 'server'
         verbose_name = _("Hardware Node")
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+from . import Computer
+
+MAC_LENGTH = 12
+
+
+def mac_tokens(value):
+    """
+    Splits Computer.mac_address ('AABBCCDDEEFF112233445566') in tokens
+    """
+    if not value:
+        return []
+
+    value = value.upper().replace(':', '')
+
+    return [
+        value[i:i + MAC_LENGTH]
+        for i in range(0, len(value) - MAC_LENGTH + 1, MAC_LENGTH)
+    ]
+
+
+class MacAddressManager(models.Manager):
+    def create(self, computer, value):
+        obj = MacAddress()
+        obj.computer = computer
+        obj.value = value
+        obj.save()
+
+        return obj
+
+    def update_computer(self, computer_id, mac_address):
+        """
+        Keeps the MAC tokens table in sync with Computer.mac_address
+        """
+        tokens = set(mac_tokens(mac_address))
+        current = set(
+            self.filter(computer_id=computer_id).values_list('value', flat=True)
+        )
+
+        if current - tokens:
+            self.filter(computer_id=computer_id, value__in=current - tokens).delete()
+
+        if tokens - current:
+            self.bulk_create([
+                MacAddress(computer_id=computer_id, value=value)
+                for value in tokens - current
+            ])
+
+
+class MacAddress(models.Model):
+    computer = models.ForeignKey(
+        Computer,
+        on_delete=models.CASCADE,
+        related_name='mac_addresses',
+        verbose_name=_("computer")
+    )
+
+    value = models.CharField(
+        verbose_name=_("MAC address"),
+        max_length=MAC_LENGTH,
+        db_index=True
+    )
+
+    objects = MacAddressManager()
+
+    def __str__(self):
+        return self.value
+
+    class Meta:
+        app_label = 'server'
+        verbose_name = _("MAC Address")
+        verbose_name_plural = _("MAC Addresses")
+        unique_together = (('computer', 'value'),)
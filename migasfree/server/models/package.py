@@ -141,14 +141,19 @@ class Package(models.Model, MigasLink):
 
 @receiver(pre_delete, sender=Package)
 def pre_delete_package(sender, instance, **kwargs):
-    from ..tasks import create_repository_metadata
+    from ..tasks import request_repository_metadata
     from .deployment import Deployment
+    from .package_digest import PackageDigest
 
     path = Package.path(
         instance.project.name,
         instance.store.name,
         instance.name
     )
+    PackageDigest.objects.filter(
+        models.Q(path=os.path.realpath(path))
+        | models.Q(path__startswith=os.path.join(os.path.realpath(path), ''))
+    ).delete()
     Package.delete_from_store(path)
 
     queryset = Deployment.objects.filter(
@@ -157,4 +162,4 @@ def pre_delete_package(sender, instance, **kwargs):
     )
     for deploy in queryset:
         deploy.available_packages.remove(instance)
-        create_repository_metadata(deploy)
+        request_repository_metadata(deploy)
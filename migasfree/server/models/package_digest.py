@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+
+from django.db import models, transaction, IntegrityError
+from django.utils.translation import ugettext_lazy as _
+
+ALGORITHMS = ['md5', 'sha1', 'sha256', 'sha512']
+CHUNK_SIZE = 1024 * 1024
+BATCH_SIZE = 1000
+
+
+def data_digests(chunks):
+    """
+    Digests (ALGORITHMS) of data chunks in one pass
+    :return: {'md5': hexdigest, ...}
+    """
+    hashes = [(algorithm, hashlib.new(algorithm)) for algorithm in ALGORITHMS]
+    for chunk in chunks:
+        for algorithm, item in hashes:
+            item.update(chunk)
+
+    return {algorithm: item.hexdigest() for algorithm, item in hashes}
+
+
+def file_digests(filename):
+    with open(filename, 'rb') as f:
+        return data_digests(iter(lambda: f.read(CHUNK_SIZE), b''))
+
+
+def read_headers(filename):
+    """
+    Parsed headers of package file ([(field, value), ...] for .deb)
+    or None if they are not supported
+    """
+    from ..apt_index import PackageError, parse_control, read_control
+
+    if filename.endswith('.deb'):
+        try:
+            return parse_control(read_control(filename))
+        except (PackageError, IOError, OSError, ValueError):  # ValueError: corrupt header
+            pass
+
+    return None
+
+
+class PackageDigestManager(models.Manager):
+    def get_for(self, filename):
+        """
+        Digests of a package file (computed again if its size or mtime
+        have changed)
+        """
+        filename = os.path.realpath(filename)
+        stat = os.stat(filename)
+
+        obj = self.filter(path=filename).first()
+        if obj and obj.size == stat.st_size and obj.mtime == stat.st_mtime:
+            return obj
+
+        return self.store(filename, file_digests(filename), stat)
+
+    def get_many(self, filenames):
+        """
+        Digests of package files, read in one query per BATCH_SIZE files
+        (only missing or changed files are computed again)
+        :return: ({filename: PackageDigest}, [error messages])
+        """
+        paths = {filename: os.path.realpath(filename) for filename in filenames}
+
+        found = {}
+        values = sorted(set(paths.values()))
+        for i in range(0, len(values), BATCH_SIZE):
+            for obj in self.filter(path__in=values[i:i + BATCH_SIZE]):
+                found[obj.path] = obj
+
+        digests = {}
+        errors = []
+        for filename, path in paths.items():
+            try:
+                stat = os.stat(path)
+                obj = found.get(path)
+                if not (obj and obj.size == stat.st_size and obj.mtime == stat.st_mtime):
+                    obj = found[path] = self.store(path, file_digests(path), stat)
+            except (IOError, OSError) as e:
+                errors.append(str(e))
+                continue
+
+            digests[filename] = obj
+
+        return digests, errors
+
+    def store(self, filename, digests, stat=None):
+        """
+        Saves digests already computed (while uploading the file)
+        """
+        filename = os.path.realpath(filename)
+        if stat is None:
+            stat = os.stat(filename)
+
+        headers = read_headers(filename)
+        values = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'md5': digests['md5'],
+            'sha1': digests['sha1'],
+            'sha256': digests['sha256'],
+            'sha512': digests['sha512'],
+            'headers': json.dumps(headers) if headers is not None else None,
+        }
+
+        try:
+            with transaction.atomic():
+                obj = self.update_or_create(path=filename, defaults=values)[0]
+        except IntegrityError:  # created by a concurrent build
+            self.filter(path=filename).update(**values)
+            obj = self.get(path=filename)
+
+        return obj
+
+
+class PackageDigest(models.Model):
+    """
+    Digests and headers of package files (shared by all deployments)
+    Read by the APT indexer (Pms.BUILD_MODE_APT). The createrepo scripts
+    (yum, zypper) keep their own checksum cache in the staging tree of
+    the deployment (%PATH%/.checksum), so unchanged packages are not
+    hashed again either
+    """
+    path = models.CharField(
+        verbose_name=_("path"),
+        max_length=1024,
+        unique=True
+    )
+
+    size = models.BigIntegerField(
+        verbose_name=_("size")
+    )
+
+    mtime = models.FloatField(
+        verbose_name=_("modification time")
+    )
+
+    md5 = models.CharField(
+        verbose_name='MD5',
+        max_length=32
+    )
+
+    sha1 = models.CharField(
+        verbose_name='SHA1',
+        max_length=40
+    )
+
+    sha256 = models.CharField(
+        verbose_name='SHA256',
+        max_length=64
+    )
+
+    sha512 = models.CharField(
+        verbose_name='SHA512',
+        max_length=128
+    )
+
+    headers = models.TextField(
+        verbose_name=_("headers"),
+        null=True,
+        blank=True
+    )
+
+    objects = PackageDigestManager()
+
+    def get_headers(self):
+        return json.loads(self.headers) if self.headers else None
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        app_label = 'server'
+        verbose_name = _("Package Digest")
+        verbose_name_plural = _("Package Digests")
@@ -21,6 +21,14 @@ class Pms(models.Model, MigasLink):
       - get info of packages in the server for the view 'Packages Information'.
     """
 
+    BUILD_MODE_SCRIPT = 'script'
+    BUILD_MODE_APT = 'apt'
+
+    BUILD_MODE_CHOICES = (
+        (BUILD_MODE_SCRIPT, _('Script (create repository)')),
+        (BUILD_MODE_APT, _('APT indexer')),
+    )
+
     name = models.CharField(
         verbose_name=_("name"),
         max_length=50,
@@ -43,6 +51,16 @@ class Pms(models.Model, MigasLink):
                     "repositories in the migasfree server.")
     )
 
+    build_mode = models.CharField(
+        verbose_name=_("build mode"),
+        max_length=10,
+        choices=BUILD_MODE_CHOICES,
+        default=BUILD_MODE_SCRIPT,
+        help_text=_("How the metadata of repositories is created. "
+                    "APT indexer writes the same files than the apt-get "
+                    "script without running it.")
+    )
+
     info = models.TextField(
         verbose_name=_("package information"),
         null=True,
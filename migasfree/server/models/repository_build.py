@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count
+from django.utils.translation import ugettext_lazy as _
+
+from . import Deployment
+
+
+class RepositoryBuildManager(models.Manager):
+    def request(self, deploy, immediate=False):
+        """
+        Queues a build of the deployment repository
+        A pending build of the same deployment absorbs the request and
+        waits MIGASFREE_REPOSITORY_BUILD_QUIET_PERIOD seconds more (up to
+        MIGASFREE_REPOSITORY_BUILD_MAX_DELAY since its first request)
+        """
+        now = datetime.now()
+        quiet = timedelta(
+            seconds=0 if immediate else settings.MIGASFREE_REPOSITORY_BUILD_QUIET_PERIOD
+        )
+
+        with transaction.atomic():
+            # serializes requests of the deployment
+            Deployment.objects.select_for_update().filter(pk=deploy.pk).first()
+
+            build = self.select_for_update().filter(
+                deployment_id=deploy.pk,
+                status=RepositoryBuild.STATUS_PENDING
+            ).first()
+            if build is None:
+                build = RepositoryBuild(deployment_id=deploy.pk, requested_at=now)
+
+            build.requests += 1
+            build.not_before = min(
+                now + quiet,
+                build.requested_at + timedelta(
+                    seconds=settings.MIGASFREE_REPOSITORY_BUILD_MAX_DELAY
+                )
+            )
+            build.save()
+
+        return build
+
+    def start_now(self, deploy):
+        """
+        Running build of a synchronous build (it absorbs the pending one)
+        """
+        now = datetime.now()
+        self.filter(
+            deployment_id=deploy.pk,
+            status=RepositoryBuild.STATUS_PENDING
+        ).delete()
+
+        build = RepositoryBuild(
+            deployment=deploy,
+            status=RepositoryBuild.STATUS_RUNNING,
+            requests=1,
+            requested_at=now,
+            not_before=now,
+            started_at=now
+        )
+        build.save()
+
+        return build
+
+    def reset_stale(self):
+        """
+        Fails the running builds whose process has died: started more than
+        MIGASFREE_REPOSITORY_BUILD_TIMEOUT seconds ago or whose deployment
+        lock is free (after LOCK_GRACE seconds)
+        :return: number of failed builds
+        """
+        from ..tasks import is_repository_locked
+
+        now = datetime.now()
+        timeout = now - timedelta(seconds=settings.MIGASFREE_REPOSITORY_BUILD_TIMEOUT)
+        grace = now - timedelta(seconds=RepositoryBuild.LOCK_GRACE)
+
+        stale = [
+            build.id for build in self.get_queryset().filter(
+                status=RepositoryBuild.STATUS_RUNNING,
+                started_at__lt=grace
+            ).select_related('deployment', 'deployment__project')
+            if build.started_at < timeout or not is_repository_locked(build.deployment)
+        ]
+        if not stale:
+            return 0
+
+        return self.get_queryset().filter(
+            id__in=stale,
+            status=RepositoryBuild.STATUS_RUNNING
+        ).update(
+            status=RepositoryBuild.STATUS_FAILED,
+            finished_at=now,
+            output=str(_('Interrupted build'))
+        )
+
+    def ready(self):
+        """
+        Pending builds whose quiet period is over, oldest first
+        (deployments being built are skipped, stale builds are reset)
+        """
+        self.reset_stale()
+
+        return self.get_queryset().filter(
+            status=RepositoryBuild.STATUS_PENDING,
+            not_before__lte=datetime.now()
+        ).exclude(
+            deployment_id__in=self.get_queryset().filter(
+                status=RepositoryBuild.STATUS_RUNNING
+            ).values('deployment_id')
+        ).order_by('not_before', 'id')
+
+    def stats(self):
+        counts = dict(
+            self.get_queryset().filter(
+                status__in=[RepositoryBuild.STATUS_PENDING, RepositoryBuild.STATUS_RUNNING]
+            ).values_list('status').annotate(total=Count('id'))
+        )
+
+        return {
+            'pending': counts.get(RepositoryBuild.STATUS_PENDING, 0),
+            'running': counts.get(RepositoryBuild.STATUS_RUNNING, 0),
+        }
+
+
+class RepositoryBuild(models.Model):
+    """
+    Repository metadata builds of deployments (queue and history)
+    """
+    STATUS_PENDING = 'P'
+    STATUS_RUNNING = 'R'
+    STATUS_DONE = 'D'
+    STATUS_FAILED = 'F'
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+        (STATUS_FAILED, _('Failed')),
+    )
+
+    HISTORY = 20  # finished builds kept by deployment
+    LOCK_GRACE = 60  # seconds since started until a build holds its lock
+
+    deployment = models.ForeignKey(
+        Deployment,
+        on_delete=models.CASCADE,
+        verbose_name=_("deployment")
+    )
+
+    status = models.CharField(
+        verbose_name=_("status"),
+        max_length=1,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True
+    )
+
+    requests = models.IntegerField(
+        verbose_name=_("requests"),
+        default=0
+    )
+
+    requested_at = models.DateTimeField(
+        verbose_name=_("requested at")
+    )
+
+    not_before = models.DateTimeField(
+        verbose_name=_("not before")
+    )
+
+    started_at = models.DateTimeField(
+        verbose_name=_("started at"),
+        null=True,
+        blank=True
+    )
+
+    finished_at = models.DateTimeField(
+        verbose_name=_("finished at"),
+        null=True,
+        blank=True
+    )
+
+    output = models.TextField(
+        verbose_name=_("output"),
+        null=True,
+        blank=True
+    )
+
+    objects = RepositoryBuildManager()
+
+    def __str__(self):
+        return '{} ({})'.format(self.deployment, self.get_status_display())
+
+    def duration(self):
+        if self.started_at and self.finished_at:
+            return self.finished_at - self.started_at
+
+        return None
+
+    duration.short_description = _("duration")
+
+    def start(self):
+        """
+        Takes the build if it is still pending (False if another worker has it)
+        """
+        taken = RepositoryBuild.objects.filter(
+            pk=self.pk, status=self.STATUS_PENDING
+        ).update(status=self.STATUS_RUNNING, started_at=datetime.now())
+        if taken:
+            self.status = self.STATUS_RUNNING
+            self.refresh_from_db(fields=['started_at'])
+
+        return bool(taken)
+
+    def run(self, packages=None):
+        """
+        Builds the metadata of the running build
+        :return: (message level, message)
+        """
+        from django.contrib import messages
+        from ..tasks import build_repository_metadata
+
+        try:
+            level, self.output = build_repository_metadata(self.deployment, packages)
+        except Exception as e:
+            level, self.output = messages.ERROR, str(e)
+
+        self.status = self.STATUS_FAILED if level == messages.ERROR else self.STATUS_DONE
+        self.finished_at = datetime.now()
+        self.save(update_fields=['status', 'output', 'finished_at'])
+
+        old = RepositoryBuild.objects.filter(
+            deployment_id=self.deployment_id,
+            status__in=[self.STATUS_DONE, self.STATUS_FAILED]
+        ).order_by('-id').values_list('id', flat=True)[self.HISTORY:]
+        RepositoryBuild.objects.filter(id__in=list(old)).delete()
+
+        return level, self.output
+
+    class Meta:
+        app_label = 'server'
+        verbose_name = _("Repository Build")
+        verbose_name_plural = _("Repository Builds")
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import zlib
+
+from datetime import datetime
+
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+from . import Computer
+
+
+class SoftwareHistoryManager(models.Manager):
+    def create(self, computer, history, created_at=None):
+        obj = SoftwareHistory()
+        obj.computer = computer
+        obj.created_at = created_at or datetime.now()
+        obj.set_content(history)
+        obj.save()
+
+        return obj
+
+    def by_computer(self, computer_id, since=None, until=None):
+        """
+        Chunks of computer in [since, until), oldest first
+        """
+        qs = self.get_queryset().filter(computer_id=computer_id)
+        if since:
+            qs = qs.filter(created_at__gte=since)
+        if until:
+            qs = qs.filter(created_at__lt=until)
+
+        return qs.order_by('created_at', 'id')
+
+
+class SoftwareHistory(models.Model):
+    """
+    Append-only software history of computers (one compressed chunk
+    for each upload_computer_software_history)
+    """
+    computer = models.ForeignKey(
+        Computer,
+        on_delete=models.CASCADE,
+        related_name='software_history_chunks',
+        verbose_name=_("computer")
+    )
+
+    created_at = models.DateTimeField(
+        verbose_name=_("date"),
+        default=datetime.now
+    )
+
+    content = models.BinaryField(
+        verbose_name=_("content")
+    )
+
+    size = models.IntegerField(
+        verbose_name=_("size"),
+        default=0,
+        help_text=_("bytes (uncompressed)")
+    )
+
+    objects = SoftwareHistoryManager()
+
+    def set_content(self, text):
+        data = text.encode('utf-8')
+        self.size = len(data)
+        self.content = zlib.compress(data)
+
+    def get_content(self):
+        return zlib.decompress(bytes(self.content)).decode('utf-8')
+
+    def __str__(self):
+        return '{} ({})'.format(self.computer_id, self.created_at)
+
+    class Meta:
+        app_label = 'server'
+        verbose_name = _("Software History")
+        verbose_name_plural = _("Software History")
+        index_together = (('computer', 'created_at'),)
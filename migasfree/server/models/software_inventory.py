@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+import operator
+import re
+
+from django.db import models, transaction, IntegrityError
+from django.utils.translation import ugettext_lazy as _
+
+from . import Computer
+from ..utils import version_key
+
+BATCH_SIZE = 1000
+
+SEARCH_OPERATORS = {
+    '=': 'version',
+    '==': 'version',
+    '<': 'lt',
+    '<=': 'lte',
+    '>': 'gt',
+    '>=': 'gte',
+}
+
+
+def parse_inventory(pkgs):
+    """
+    Installed packages of Computer.software_inventory text
+    ('+name_version_architecture' lines, '-' lines are not installed)
+    :return: set([(name, version, architecture), ...])
+    """
+    ret = set()
+    for line in (pkgs or '').splitlines():
+        line = line.strip()
+        if line.startswith('+'):
+            line = line[1:]
+        elif line.startswith('-'):
+            continue
+
+        if not line:
+            continue
+
+        parts = line.rsplit('_', 2)
+        name = parts[0]
+        version = parts[1] if len(parts) > 1 else ''
+        architecture = parts[2] if len(parts) > 2 else ''
+
+        ret.add((
+            name[:SoftwareName.MAX_LENGTH],
+            version[:SoftwareVersion.MAX_LENGTH],
+            architecture[:SoftwareVersion.ARCHITECTURE_LENGTH]
+        ))
+
+    return ret
+
+
+def parse_search(text):
+    """
+    Package search expression: 'name', 'name=version' or
+    'name<version' ('<', '<=', '>', '>=')
+    :return: (name, {'version' | 'lt' | 'lte' | 'gt' | 'gte': version})
+    """
+    match = re.match(r'^\s*([^<>=\s]+)\s*(<=|>=|==|=|<|>)?\s*(\S*)\s*$', text or '')
+    if not match or bool(match.group(2)) != bool(match.group(3)):
+        raise ValueError(text)
+
+    name, operator, version = match.groups()
+    if not operator:
+        return name, {}
+
+    return name, {SEARCH_OPERATORS[operator]: version}
+
+
+class DictionaryManager(models.Manager):
+    def resolve(self, keys):
+        """
+        :param keys: [(value of each field in model.FIELDS), ...]
+        :return: {key: id, ...} (missing rows are bulk inserted)
+        """
+        keys = set(keys)
+        found = self._select(keys)
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            try:
+                with transaction.atomic():
+                    self.bulk_create(
+                        [self._new(key) for key in missing],
+                        batch_size=BATCH_SIZE
+                    )
+            except IntegrityError:  # concurrent upload has created some of them
+                for key in missing:
+                    self.get_or_create(**dict(zip(self.model.FIELDS, key)))
+
+            found.update(self._select(missing))
+
+        return found
+
+    def _new(self, key):
+        return self.model(**dict(zip(self.model.FIELDS, key)))
+
+    def _select(self, keys):
+        fields = self.model.FIELDS
+        keys = set(keys)
+        values = sorted(set(key[0] for key in keys))
+
+        ret = {}
+        for i in range(0, len(values), BATCH_SIZE):
+            for row in self.filter(
+                **{'{}__in'.format(fields[0]): values[i:i + BATCH_SIZE]}
+            ).values_list('id', *fields):
+                if row[1:] in keys:
+                    ret[row[1:]] = row[0]
+
+        return ret
+
+
+class SoftwareName(models.Model):
+    MAX_LENGTH = 255
+    FIELDS = ('name',)
+
+    name = models.CharField(
+        verbose_name=_("name"),
+        max_length=MAX_LENGTH,
+        unique=True
+    )
+
+    objects = DictionaryManager()
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        app_label = 'server'
+        verbose_name = _("Software Name")
+        verbose_name_plural = _("Software Names")
+
+
+class SoftwareVersion(models.Model):
+    MAX_LENGTH = 255
+    ARCHITECTURE_LENGTH = 20
+    FIELDS = ('version', 'architecture')
+
+    version = models.CharField(
+        verbose_name=_("version"),
+        max_length=MAX_LENGTH
+    )
+
+    architecture = models.CharField(
+        verbose_name=_("architecture"),
+        max_length=ARCHITECTURE_LENGTH,
+        blank=True
+    )
+
+    objects = DictionaryManager()
+
+    def __str__(self):
+        if self.architecture:
+            return '{}_{}'.format(self.version, self.architecture)
+
+        return self.version
+
+    class Meta:
+        app_label = 'server'
+        verbose_name = _("Software Version")
+        verbose_name_plural = _("Software Versions")
+        unique_together = (('version', 'architecture'),)
+
+
+class SoftwareInventoryManager(models.Manager):
+    def update_computer(self, computer_id, pkgs):
+        """
+        Saves only the differences with the current inventory of computer
+        :param pkgs: Computer.software_inventory text
+        :return: (added count, removed count)
+        """
+        items = parse_inventory(pkgs)
+        names = SoftwareName.objects.resolve(item[:1] for item in items)
+        versions = SoftwareVersion.objects.resolve(item[1:] for item in items)
+
+        target = set(
+            (names[(name,)], versions[(version, architecture)])
+            for name, version, architecture in items
+        )
+        current = {
+            (name_id, version_id): pk
+            for pk, name_id, version_id in self.filter(
+                computer_id=computer_id
+            ).values_list('id', 'name_id', 'version_id')
+        }
+
+        removed = [pk for key, pk in current.items() if key not in target]
+        added = [key for key in target if key not in current]
+
+        for i in range(0, len(removed), BATCH_SIZE):
+            self.filter(id__in=removed[i:i + BATCH_SIZE]).delete()
+
+        if added:
+            self.bulk_create([
+                SoftwareInventory(
+                    computer_id=computer_id,
+                    name_id=name_id,
+                    version_id=version_id
+                ) for name_id, version_id in added
+            ], batch_size=BATCH_SIZE)
+
+        return len(added), len(removed)
+
+    def by_package(self, name, version=None, architecture=None):
+        """
+        Computer ids with package installed
+        """
+        qs = self.filter(name__name=name)
+        if version is not None:
+            qs = qs.filter(version__version=version)
+        if architecture is not None:
+            qs = qs.filter(version__architecture=architecture)
+
+        return qs.values_list('computer_id', flat=True).distinct()
+
+    def by_version_range(self, name, min_version=None, max_version=None):
+        """
+        Computer ids with package installed in [min_version, max_version]
+        """
+        return self.search(name, gte=min_version, lte=max_version)
+
+    def search(self, name, version=None, lt=None, lte=None, gt=None, gte=None):
+        """
+        Computer ids with package installed (in the version range)
+        Versions are compared like package managers do (see version_key)
+        """
+        qs = self.filter(name__name=name)
+        if version is not None:
+            qs = qs.filter(version__version=version)
+
+        bounds = [
+            (compare, version_key(value)) for compare, value in [
+                (operator.lt, lt), (operator.le, lte),
+                (operator.gt, gt), (operator.ge, gte),
+            ] if value is not None
+        ]
+        if bounds:
+            ids = [
+                pk for pk, value in qs.values_list(
+                    'version_id', 'version__version'
+                ).distinct()
+                if all(compare(version_key(value), key) for compare, key in bounds)
+            ]
+            qs = qs.filter(version_id__in=ids)
+
+        return qs.values_list('computer_id', flat=True).distinct()
+
+    def by_computer(self, computer_id):
+        """
+        Packages of the software inventory of computer, as uploaded
+        (['name_version_architecture', ...] without '+' and '-' marks)
+        """
+        pkgs = Computer.objects.filter(pk=computer_id).values_list(
+            'software_inventory', flat=True
+        ).first()
+        if not pkgs:
+            return []
+
+        data = re.sub(r'^\+', '', pkgs, flags=re.MULTILINE)
+        data = re.sub(r'^-', '', data, flags=re.MULTILINE)
+
+        return data.rstrip().split('\n')
+
+
+class SoftwareInventory(models.Model):
+    """
+    Installed packages of computers (normalized Computer.software_inventory)
+    """
+    computer = models.ForeignKey(
+        Computer,
+        on_delete=models.CASCADE,
+        related_name='software',
+        verbose_name=_("computer")
+    )
+
+    name = models.ForeignKey(
+        SoftwareName,
+        on_delete=models.CASCADE,
+        verbose_name=_("name")
+    )
+
+    version = models.ForeignKey(
+        SoftwareVersion,
+        on_delete=models.CASCADE,
+        verbose_name=_("version")
+    )
+
+    objects = SoftwareInventoryManager()
+
+    def __str__(self):
+        return '{}_{}'.format(self.name, self.version)
+
+    class Meta:
+        app_label = 'server'
+        verbose_name = _("Software Inventory")
+        verbose_name_plural = _("Software Inventory")
+        unique_together = (('computer', 'name', 'version'),)
+        index_together = (('name', 'version'),)
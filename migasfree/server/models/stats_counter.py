@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+from django.db import models
+from django.db.models import F
+from django.utils.translation import ugettext_lazy as _
+
+
+class StatsCounterManager(models.Manager):
+    def incr(self, name, value=1):
+        if not self.filter(name=name).update(value=F('value') + value):
+            if not self.get_or_create(name=name, defaults={'value': value})[1]:
+                self.filter(name=name).update(value=F('value') + value)
+
+    def get_values(self, *names):
+        counters = dict(self.filter(name__in=names).values_list('name', 'value'))
+
+        return {name: counters.get(name, 0) for name in names}
+
+
+class StatsCounter(models.Model):
+    """
+    Counters shared by all server processes (and upload workers),
+    shown by the stats endpoint
+    """
+    name = models.CharField(
+        verbose_name=_("name"),
+        max_length=250,
+        unique=True
+    )
+
+    value = models.BigIntegerField(
+        verbose_name=_("value"),
+        default=0
+    )
+
+    objects = StatsCounterManager()
+
+    def __str__(self):
+        return '{}: {}'.format(self.name, self.value)
+
+    class Meta:
+        app_label = 'server'
+        verbose_name = _("Stats Counter")
+        verbose_name_plural = _("Stats Counters")
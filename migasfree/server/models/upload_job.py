@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import models
+from django.db.models import F, Min
+from django.utils.translation import ugettext_lazy as _
+
+from . import Computer
+
+
+class UploadJobManager(models.Manager):
+    def enqueue(self, computer, command, payload):
+        obj = UploadJob()
+        obj.computer = computer
+        obj.command = command
+        obj.payload = json.dumps(payload)
+        obj.save()
+
+        return obj
+
+    def pending(self, partition=0, partitions=1):
+        """
+        Pending jobs of a partition (computer_id % partitions), oldest first
+        """
+        qs = self.get_queryset().filter(status=UploadJob.STATUS_PENDING)
+        if partitions > 1:
+            qs = qs.annotate(
+                partition=F('computer_id') % partitions
+            ).filter(partition=partition)
+
+        return qs.order_by('id')
+
+    def ready(self, partition=0, partitions=1):
+        """
+        Pending jobs of a partition that can be applied now, oldest first
+        (computers whose first job is waiting to be retried are skipped:
+        their jobs are applied in order)
+        """
+        return self.pending(partition, partitions).exclude(
+            computer_id__in=self.get_queryset().filter(
+                status=UploadJob.STATUS_PENDING,
+                next_attempt_at__gt=datetime.now()
+            ).values('computer_id')
+        )
+
+    def stats(self):
+        """
+        Queue depth, lag (seconds of the oldest pending job) and failed jobs
+        """
+        pending = self.get_queryset().filter(status=UploadJob.STATUS_PENDING)
+        oldest = pending.aggregate(oldest=Min('created_at'))['oldest']
+
+        return {
+            'depth': pending.count(),
+            'lag': (datetime.now() - oldest).total_seconds() if oldest else 0,
+            'failed': self.get_queryset().filter(status=UploadJob.STATUS_FAILED).count(),
+        }
+
+
+class UploadJob(models.Model):
+    """
+    Client upload pending to be applied by the upload_worker command
+    (MIGASFREE_ASYNC_UPLOADS)
+    """
+    STATUS_PENDING = 'P'
+    STATUS_FAILED = 'F'
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_FAILED, _('Failed')),
+    )
+
+    computer = models.ForeignKey(
+        Computer,
+        on_delete=models.CASCADE,
+        verbose_name=_("computer")
+    )
+
+    command = models.CharField(
+        verbose_name=_("command"),
+        max_length=50
+    )
+
+    payload = models.TextField(
+        verbose_name=_("payload")
+    )
+
+    status = models.CharField(
+        verbose_name=_("status"),
+        max_length=1,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True
+    )
+
+    attempts = models.IntegerField(
+        verbose_name=_("attempts"),
+        default=0
+    )
+
+    next_attempt_at = models.DateTimeField(
+        verbose_name=_("next attempt"),
+        null=True,
+        blank=True
+    )
+
+    error = models.TextField(
+        verbose_name=_("error"),
+        null=True,
+        blank=True
+    )
+
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_("date")
+    )
+
+    objects = UploadJobManager()
+
+    def __str__(self):
+        return '{} ({})'.format(self.command, self.computer_id)
+
+    def get_payload(self):
+        return json.loads(self.payload)
+
+    def lag(self):
+        return datetime.now() - self.created_at
+
+    lag.short_description = _("lag")
+
+    def retry_later(self, error):
+        """
+        Exponential backoff, the job fails after MIGASFREE_UPLOAD_MAX_ATTEMPTS
+        """
+        self.attempts += 1
+        self.error = error
+        if self.attempts >= settings.MIGASFREE_UPLOAD_MAX_ATTEMPTS:
+            self.status = self.STATUS_FAILED
+            self.next_attempt_at = None
+        else:
+            self.next_attempt_at = datetime.now() + timedelta(
+                seconds=settings.MIGASFREE_UPLOAD_RETRY_DELAY * 2 ** (self.attempts - 1)
+            )
+
+        self.save(update_fields=['attempts', 'error', 'status', 'next_attempt_at'])
+
+    class Meta:
+        app_label = 'server'
+        verbose_name = _("Upload Job")
+        verbose_name_plural = _("Upload Jobs")
@@ -17,7 +17,6 @@ class ComputerResource(resources.ModelResource):
     class Meta:
         model = Computer
         exclude = (
-            'software_history',
             'software_inventory',
             'sync_attributes',
             'default_logical_device',
@@ -5,73 +5,142 @@ import json
 import gpgme
 
 from io import BytesIO
+from Crypto.Hash import SHA1
 from Crypto.PublicKey import RSA
+from Crypto.Signature import pkcs1_15
 from django.conf import settings
 
 from . import errmfs
 from .utils import read_file, write_file
 
 SIGN_LEN = 256
+CHUNK_SIZE = 64 * 1024
 
+_keys_cache = {}
 
-def sign(filename):
-    os.system("openssl dgst -sha1 -sign %s -out %s %s" % (
-        os.path.join(settings.MIGASFREE_KEYS_DIR, 'migasfree-server.pri'),
-        "%s.sign" % filename,
-        filename
-    ))
 
+def get_key(name):
+    """
+    Returns the parsed RSA key stored in MIGASFREE_KEYS_DIR
+    Keys are cached per name and reloaded only if the file changes
+    """
+    filename = os.path.join(settings.MIGASFREE_KEYS_DIR, name)
+    mtime = os.stat(filename).st_mtime
 
-def verify(filename, key):
-    return os.system(
-        "openssl dgst -sha1 -verify %s -signature %s %s 1>/dev/null" %
-        (
-            os.path.join(settings.MIGASFREE_KEYS_DIR, '%s.pub' % key),
-            "%s.sign" % filename,
-            filename
-        )
-    ) == 0  # returns True if OK, False otherwise
+    cached = _keys_cache.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
 
+    key = RSA.importKey(read_file(filename))
+    _keys_cache[filename] = (mtime, key)
 
-def wrap(filename, data):
+    return key
+
+
+def sign_data(content):
     """
-    Creates a signed wrapper file around data
+    Returns the SHA1 signature (PKCS#1 v1.5) of content with the server key
     """
-    data = json.dumps(data)
-    data = data.encode()
-    with open(filename, 'wb') as fp:
-        fp.write(data)
+    return pkcs1_15.new(
+        get_key(settings.MIGASFREE_PRIVATE_KEY)
+    ).sign(SHA1.new(content))
 
-    sign(filename)
 
-    with open(filename, 'ab') as fp:
-        with open("{}.sign".format(filename), "rb") as fpsign:
-            fp.write(fpsign.read())
+def verify_digest(digest, signature, key):
+    """
+    Returns True if signature of digest (SHA1) is valid for the "key" public key
+    """
+    try:
+        pkcs1_15.new(
+            get_key('{}.pub'.format(key))
+        ).verify(digest, signature)
+    except (ValueError, TypeError, IOError):
+        return False
 
-    os.remove("{}.sign".format(filename))
+    return True
 
 
-def unwrap(filename, key):
+def verify_data(content, signature, key):
     """
-    Returns data inside signed wrapper file
+    Returns True if signature of content is valid for the "key" public key
+    """
+    return verify_digest(SHA1.new(content), signature, key)
+
+
+def wrap_data(data):
+    """
+    Returns signed wrapper (bytes) around data
     """
-    with open(filename, 'rb') as fp:
-        content = fp.read()
+    content = json.dumps(data).encode()
 
+    return content + sign_data(content)
+
+
+def unwrap_data(content, key):
+    """
+    Returns data inside signed wrapper (bytes)
+    """
     n = len(content)
+    if verify_data(content[0:n - SIGN_LEN], content[n - SIGN_LEN:n], key):
+        return json.loads(content[0:n - SIGN_LEN].decode())
+
+    return errmfs.error(errmfs.INVALID_SIGNATURE)
 
-    write_file("{}.sign".format(filename), content[n - SIGN_LEN:n])
-    write_file(filename, content[0:n - SIGN_LEN])
 
-    if verify(filename, key):
-        with open(filename, "rb") as f:
-            data = json.load(f)
-    else:
-        data = errmfs.error(errmfs.INVALID_SIGNATURE)
+def unwrap_file(f, key):
+    """
+    Returns data inside signed wrapper of an uploaded file
+    (its signature is verified reading it by chunks)
+    """
+    size = f.size - SIGN_LEN
+    if size < 0:
+        return errmfs.error(errmfs.INVALID_SIGNATURE)
+
+    digest = SHA1.new()
+    f.seek(0)
+    remaining = size
+    while remaining > 0:
+        chunk = f.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        digest.update(chunk)
+        remaining -= len(chunk)
+
+    if not verify_digest(digest, f.read(SIGN_LEN), key):
+        return errmfs.error(errmfs.INVALID_SIGNATURE)
+
+    f.seek(0)
+
+    return json.loads(f.read(size).decode())
 
-    os.remove("{}.sign".format(filename))
 
-    return data
+def sign(filename):
+    write_file(
+        "{}.sign".format(filename),
+        sign_data(read_file(filename))
+    )
+
+
+def verify(filename, key):
+    return verify_data(
+        read_file(filename),
+        read_file("{}.sign".format(filename)),
+        key
+    )  # returns True if OK, False otherwise
+
+
+def wrap(filename, data):
+    """
+    Creates a signed wrapper file around data
+    """
+    write_file(filename, wrap_data(data))
+
+
+def unwrap(filename, key):
+    """
+    Returns data inside signed wrapper file
+    """
+    return unwrap_data(read_file(filename), key)
 
 
 def check_keys_path():
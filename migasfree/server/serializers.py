@@ -253,7 +253,7 @@ class PmsInfoSerializer(serializers.ModelSerializer):
 class PmsSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Pms
-        fields = ('id', 'name', 'slug', 'createrepo', 'info')
+        fields = ('id', 'name', 'slug', 'createrepo', 'build_mode', 'info')
 
 
 class PropertyWriteSerializer(serializers.ModelSerializer):
@@ -410,7 +410,7 @@ class DeploymentWriteSerializer(serializers.ModelSerializer):
 class InternalSourceWriteSerializer(DeploymentWriteSerializer):
     def create(self, validated_data):
         deploy = super(InternalSourceWriteSerializer, self).create(validated_data)
-        tasks.create_repository_metadata(deploy)
+        tasks.request_repository_metadata(deploy)
         return deploy
 
     def update(self, instance, validated_data):
@@ -429,7 +429,10 @@ class InternalSourceWriteSerializer(DeploymentWriteSerializer):
         )
 
         if cmp(old_pkgs, new_pkgs) != 0 or old_name != validated_data['name']:
-            tasks.create_repository_metadata(instance)
+            # renamed repositories are built now (old one is removed)
+            tasks.request_repository_metadata(
+                instance, wait=old_name != validated_data['name']
+            )
 
             if old_name != validated_data['name']:
                 tasks.remove_repository_metadata(
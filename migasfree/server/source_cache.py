@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache of the files of external sources (get_source_file)
+
+Only one process downloads each file (it holds an flock on
+<file>.lock and writes <file>.part, renamed to <file> when complete):
+concurrent requests of the same file in any WSGI worker stream the
+partial file as it grows instead of opening their own upstream
+connections.
+
+Validators of the upstream file (ETag and Last-Modified) are kept in
+<file>.meta: expired files are revalidated with a conditional request
+(only their mtime is touched if they have not changed) and interrupted
+downloads are resumed with Range requests.
+
+Upstream connections are kept alive in a pool by host (per process).
+"""
+
+import fcntl
+import http.client
+import json
+import os
+import ssl
+import threading
+import time
+
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin, urlsplit
+
+from django.conf import settings
+
+CHUNK_SIZE = 64 * 1024
+POLL_INTERVAL = 0.1  # seconds
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+USER_AGENT = 'migasfree'
+
+SSL_CONTEXT = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+
+_pool = {}  # (scheme, netloc): [idle connections]
+_pool_lock = threading.Lock()
+
+
+def part_path(local_file):
+    return '{}.part'.format(local_file)
+
+
+def lock_path(local_file):
+    return '{}.lock'.format(local_file)
+
+
+def meta_path(local_file):
+    return '{}.meta'.format(local_file)
+
+
+def read_meta(local_file):
+    try:
+        with open(meta_path(local_file)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def write_meta(local_file, remote):
+    meta = {
+        'etag': remote.getheader('ETag'),
+        'last_modified': remote.getheader('Last-Modified'),
+    }
+    if meta['etag'] or meta['last_modified']:
+        with open(meta_path(local_file), 'w') as f:
+            json.dump(meta, f)
+    elif os.path.exists(meta_path(local_file)):
+        os.remove(meta_path(local_file))
+
+
+def range_validator(meta):
+    """
+    Validator for If-Range (weak ETags are not allowed)
+    """
+    if meta.get('etag') and not meta['etag'].startswith('W/'):
+        return meta['etag']
+
+    return meta.get('last_modified')
+
+
+def is_fresh(local_file, max_age):
+    """
+    max_age: seconds (None = never expires, 0 = always revalidated)
+    """
+    if not os.path.isfile(local_file):
+        return False
+
+    if max_age is None:
+        return True
+
+    return time.time() - os.stat(local_file).st_mtime < max_age
+
+
+def get_connection(key):
+    """
+    :return: (connection, reused)
+    """
+    with _pool_lock:
+        if _pool.get(key):
+            return _pool[key].pop(), True
+
+    scheme, netloc = key
+    if scheme == 'https':
+        return http.client.HTTPSConnection(
+            netloc, timeout=settings.MIGASFREE_SOURCE_DOWNLOAD_TIMEOUT, context=SSL_CONTEXT
+        ), False
+
+    return http.client.HTTPConnection(
+        netloc, timeout=settings.MIGASFREE_SOURCE_DOWNLOAD_TIMEOUT
+    ), False
+
+
+def put_connection(key, connection):
+    with _pool_lock:
+        idle = _pool.setdefault(key, [])
+        if len(idle) < settings.MIGASFREE_SOURCE_POOL_SIZE:
+            idle.append(connection)
+            return
+
+    connection.close()
+
+
+class Remote(object):
+    """
+    Upstream response (its connection goes back to the pool when the
+    body has been read)
+    """
+    def __init__(self, key, connection, response):
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.status = response.status
+
+    def getheader(self, name):
+        return self.response.getheader(name)
+
+    def read(self, size):
+        data = self.response.read(size)
+        if not data and self.response.length:  # closed before Content-Length
+            raise http.client.IncompleteRead(b'', self.response.length)
+
+        return data
+
+    def close(self):
+        if self.connection is None:
+            return
+
+        if self.response.length == 0:  # without body (304)
+            self.response.read()
+
+        if self.response.isclosed() and not self.response.will_close:
+            put_connection(self.key, self.connection)
+        else:
+            self.connection.close()
+        self.connection = None
+
+
+def open_url(url, headers=None):
+    """
+    GET request through the pool of connections (following redirects)
+    Raises HTTPError (status >= 400) or URLError like urlopen
+    """
+    headers = dict(headers or {}, **{'User-Agent': USER_AGENT})
+
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path = '{}?{}'.format(path, parts.query)
+
+        while True:
+            connection, reused = get_connection(key)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                if not reused:  # idle connections may be closed by the server
+                    raise URLError(e)
+
+        remote = Remote(key, connection, response)
+        if response.status in REDIRECT_CODES and response.getheader('Location'):
+            response.read()
+            remote.close()
+            url = urljoin(url, response.getheader('Location'))
+            continue
+
+        if response.status >= 400:
+            response.read()
+            remote.close()
+            raise HTTPError(url, response.status, response.reason, response.msg, None)
+
+        return remote
+
+    raise URLError('{}: too many redirects'.format(url))
+
+
+def open_range(url, offset, validator):
+    """
+    Remote content from offset or None if it has changed (or the server
+    does not support ranges)
+    """
+    remote = open_url(url, {
+        'Range': 'bytes={}-'.format(offset),
+        'If-Range': validator,
+    })
+    if remote.status == 206 and (remote.getheader('Content-Range') or '').startswith(
+        'bytes {}-'.format(offset)
+    ):
+        return remote
+
+    remote.close()
+
+    return None
+
+
+def try_lock(lock, operation=fcntl.LOCK_EX):
+    try:
+        fcntl.flock(lock.fileno(), operation | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+
+    return True
+
+
+def is_downloading(lock):
+    """
+    True while another process holds the lock of the file
+    """
+    if try_lock(lock, fcntl.LOCK_SH):
+        fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+        return False
+
+    return True
+
+
+def fill(remote, url, local_file, offset, validator, chunk_size):
+    """
+    Writes the remote content to the partial file (after its first offset
+    bytes) and renames it when complete, yielding the whole content
+    Interrupted transfers are resumed (MIGASFREE_SOURCE_DOWNLOAD_RETRIES)
+    """
+    part = part_path(local_file)
+    retries = settings.MIGASFREE_SOURCE_DOWNLOAD_RETRIES
+
+    try:
+        if offset:
+            with open(part, 'rb') as f:
+                for data in iter(lambda: f.read(chunk_size), b''):
+                    yield data
+
+        with open(part, 'ab' if offset else 'wb') as f:
+            written = offset
+            while True:
+                try:
+                    data = remote.read(chunk_size)
+                except (http.client.HTTPException, OSError):
+                    remote.close()
+                    if not retries or not validator:
+                        raise
+
+                    retries -= 1
+                    remote = open_range(url, written, validator)
+                    if remote is None:
+                        raise URLError('{}: changed while downloading'.format(url))
+
+                    continue
+
+                if not data:
+                    break
+
+                f.write(data)
+                f.flush()
+                written += len(data)
+                yield data
+
+            os.fsync(f.fileno())
+
+        os.rename(part, local_file)
+    finally:
+        if remote is not None:
+            remote.close()
+
+
+def download(lock, chunks, local_file):
+    """
+    Streams the file while it is downloaded
+    If the client goes away, the download goes on (other requests are
+    waiting for it) and its partial file is kept to be resumed if it fails
+    """
+    client = True
+    try:
+        for data in chunks:
+            if client:
+                try:
+                    yield data
+                except GeneratorExit:
+                    client = False
+    except Exception:
+        if client:
+            raise
+    finally:
+        chunks.close()
+        fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+        lock.close()
+
+
+def tail(lock, f, local_file, chunk_size=CHUNK_SIZE):
+    """
+    Streams the partial file (f) written by another process until its
+    download ends
+    Raises URLError if the download fails (or the file does not grow in
+    MIGASFREE_SOURCE_DOWNLOAD_TIMEOUT seconds), so the response is not
+    ended as if the truncated file was complete
+    """
+    part = part_path(local_file)
+    sent = 0
+    idle_since = time.time()
+    try:
+        while True:
+            data = f.read(chunk_size)
+            if data:
+                sent += len(data)
+                idle_since = time.time()
+                yield data
+                continue
+
+            if not is_downloading(lock):
+                data = f.read()  # written before the lock was released
+                if data:
+                    yield data
+
+                if not os.path.isfile(local_file) \
+                        or os.stat(local_file).st_ino != os.fstat(f.fileno()).st_ino:
+                    # the partial file was not completed
+                    raise URLError('{}: download failed'.format(os.path.basename(local_file)))
+                break
+
+            if not sent and os.path.exists(part) \
+                    and os.stat(part).st_ino != os.fstat(f.fileno()).st_ino:
+                # it was a partial file of a changed upstream file
+                f.close()
+                f = open(part, 'rb')
+                continue
+
+            if time.time() - idle_since > settings.MIGASFREE_SOURCE_DOWNLOAD_TIMEOUT:
+                raise URLError('{}: download stalled'.format(os.path.basename(local_file)))
+
+            time.sleep(POLL_INTERVAL)
+    finally:
+        f.close()
+        lock.close()
+
+
+def refresh(lock, local_file, get_url, count, chunk_size):
+    """
+    Revalidates or downloads local_file (holding its lock)
+    :return: iterator of the file content or None if local_file is valid
+    """
+    url = get_url()
+    meta = read_meta(local_file)
+    validator = range_validator(meta)
+    part = part_path(local_file)
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+
+    remote = None
+    if offset and validator:
+        try:
+            remote = open_range(url, offset, validator)
+        except HTTPError:  # 416
+            remote = None
+        if remote is not None:
+            count('resumed')
+            return download(
+                lock, fill(remote, url, local_file, offset, validator, chunk_size), local_file
+            )
+
+    if offset:  # it can not be resumed
+        os.remove(part)  # (a new file for requests tailing the old one)
+
+    headers = {}
+    if os.path.isfile(local_file) and not offset:  # else meta is of the partial file
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    remote = open_url(url, headers)
+    if remote.status == 304:
+        remote.close()
+        os.utime(local_file, None)
+        count('revalidated')
+        return None
+
+    count('modified' if os.path.isfile(local_file) else 'miss')
+    write_meta(local_file, remote)
+    validator = range_validator(read_meta(local_file))
+
+    return download(
+        lock, fill(remote, url, local_file, 0, validator, chunk_size), local_file
+    )
+
+
+def no_count(event):
+    pass
+
+
+def fetch(local_file, get_url, max_age=None, count=no_count, chunk_size=CHUNK_SIZE):
+    """
+    Single-flight download of local_file (from get_url())
+    The first process downloads (or revalidates, if it is older than
+    max_age seconds) the file and the rest tail the partial file
+    count(event) is called with 'hit', 'miss', 'revalidated', 'modified',
+    'resumed' or 'shared'
+    :return: iterator of the file content or None if the local file is valid
+    Errors are raised as HTTPError or URLError
+    """
+    part = part_path(local_file)
+    deadline = time.time() + settings.MIGASFREE_SOURCE_DOWNLOAD_TIMEOUT
+
+    while True:
+        if is_fresh(local_file, max_age):
+            count('hit')
+            return None
+
+        lock = open(lock_path(local_file), 'a')
+        if try_lock(lock):
+            if is_fresh(local_file, max_age):  # refreshed while waiting
+                lock.close()
+                count('hit')
+                return None
+
+            try:
+                stream = refresh(lock, local_file, get_url, count, chunk_size)
+            except Exception:
+                lock.close()
+                raise
+
+            if stream is None:
+                lock.close()
+
+            return stream
+
+        try:
+            stream = tail(lock, open(part, 'rb'), local_file, chunk_size)
+            count('shared')
+            return stream
+        except FileNotFoundError:  # not started yet, finished or failed
+            pass
+
+        lock.close()
+        if time.time() > deadline:
+            raise URLError('{} is being downloaded'.format(os.path.basename(local_file)))
+
+        time.sleep(POLL_INTERVAL)
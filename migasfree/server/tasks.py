@@ -1,19 +1,217 @@
 # -*- coding: utf-8 -*-
 
+import fcntl
 import os
 import shutil
+import time
+
+from contextlib import contextmanager
+from datetime import datetime
+from multiprocessing import Pool
+
+import psutil
 
 from django.conf import settings
 from django.contrib import messages
+from django.db import connections
 from django.utils.translation import ugettext as _
 
+from . import apt_index
 from .utils import run_in_server
-from .models import Package, Store
+from .models import Package, Pms, RepositoryBuild, Store
+
+STAGING_DIR = '.staging'
+GENERATIONS_DIR = '.generations'
+PACKAGES_DIR = 'PKGS'  # FIXME hardcoded path!!!
+
+
+def repository_paths(deploy, name=None):
+    """
+    public: published repository (symlink to the current generation)
+    staging: persistent build tree (%PATH% is its slug path)
+    generations: published versions of the repository
+    """
+    name = name or deploy.name
+    slug_path = os.path.dirname(deploy.path(name))
+    staging = os.path.join(slug_path, STAGING_DIR, name)
+
+    return {
+        'public': deploy.path(name),
+        'staging': staging,
+        'slug': os.path.join(staging, deploy.project.pms.slug).rstrip('/'),
+        'generations': os.path.join(slug_path, GENERATIONS_DIR, name),
+    }
+
+
+def remove_path(path):
+    if os.path.islink(path) or os.path.isfile(path):
+        os.remove(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def repository_lock_path(deploy):
+    return os.path.join(
+        os.path.dirname(deploy.path()), STAGING_DIR, '{}.lock'.format(deploy.pk)
+    )
+
+
+@contextmanager
+def repository_lock(deploy):
+    """
+    Exclusive lock (flock) of the builds of a deployment
+    """
+    path = os.path.dirname(repository_lock_path(deploy))
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    with open(repository_lock_path(deploy), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def is_repository_locked(deploy):
+    """
+    True while a build of the deployment holds its lock
+    """
+    try:
+        with open(repository_lock_path(deploy), 'r') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+
+            fcntl.flock(f, fcntl.LOCK_UN)
+    except FileNotFoundError:
+        pass
+
+    return False
+
+
+def sync_staging(pkgs_path, packages, stores_path):
+    """
+    Applies to the symlinks of pkgs_path the differences with packages
+    :return: (added packages, removed names)
+    """
+    target = {
+        pkg.name: (pkg, os.path.join(stores_path, pkg.store.name, pkg.name))
+        for pkg in packages
+    }
+
+    removed = []
+    for name in os.listdir(pkgs_path):
+        path = os.path.join(pkgs_path, name)
+        if os.path.islink(path) and (
+            name not in target or os.readlink(path) != target[name][1]
+        ):
+            os.remove(path)
+            removed.append(name)
+
+    added = []
+    for name, (pkg, source) in sorted(target.items()):
+        path = os.path.join(pkgs_path, name)
+        if not os.path.lexists(path):
+            os.symlink(source, path)
+            added.append(pkg)
+
+    return added, removed
+
+
+def get_generations(paths):
+    if not os.path.exists(paths['generations']):
+        return []
+
+    return sorted(
+        item for item in os.listdir(paths['generations'])
+        if not item.endswith('.tmp')
+    )
+
+
+def current_generation(paths):
+    if os.path.islink(paths['public']):
+        return os.path.basename(os.readlink(paths['public']))
+
+    return None
+
+
+def switch_generation(paths, generation):
+    """
+    Points the public path to a generation (atomic rename of a symlink)
+    """
+    link = '{}.tmp'.format(paths['public'])
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(
+        os.path.relpath(
+            os.path.join(paths['generations'], generation),
+            os.path.dirname(paths['public'])
+        ),
+        link
+    )
+
+    if os.path.isdir(paths['public']) and not os.path.islink(paths['public']):
+        # repository published before generations: kept as the oldest one
+        os.rename(
+            paths['public'],
+            os.path.join(paths['generations'], '0' * len(generation))
+        )
+
+    os.rename(link, paths['public'])
+
+
+def publish_repository(paths, source):
+    """
+    Copies source to a new generation, publishes it and removes
+    the generations older than MIGASFREE_REPOSITORY_GENERATIONS
+    """
+    if not os.path.exists(paths['generations']):
+        os.makedirs(paths['generations'])
+
+    generation = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    tmp = os.path.join(paths['generations'], '{}.tmp'.format(generation))
+    shutil.copytree(source, tmp, symlinks=True)
+    os.rename(tmp, os.path.join(paths['generations'], generation))
+
+    switch_generation(paths, generation)
+
+    generations = get_generations(paths)
+    for item in generations[:-(settings.MIGASFREE_REPOSITORY_GENERATIONS + 1)]:
+        remove_path(os.path.join(paths['generations'], item))
+
+
+def rollback_repository_metadata(deploy, request=None):
+    """
+    Publishes the previous generation of the repository
+    """
+    paths = repository_paths(deploy)
+    generations = get_generations(paths)
+    current = current_generation(paths)
+
+    if current in generations and generations.index(current) > 0:
+        previous = generations[generations.index(current) - 1]
+        switch_generation(paths, previous)
+        _msg_level = messages.SUCCESS
+        _ret = _('Repository %(name)s rolled back to %(generation)s') % {
+            'name': deploy.name, 'generation': previous
+        }
+    else:
+        _msg_level = messages.ERROR
+        _ret = _('Repository %s has not previous generations') % deploy.name
+
+    if hasattr(request, 'META'):
+        return messages.add_message(request, _msg_level, _ret)
+
+    return _ret
 
 
 def remove_repository_metadata(request, deploy, old_name=""):
     name = old_name if old_name else deploy.name
-    shutil.rmtree(deploy.path(name), ignore_errors=True)
+    paths = repository_paths(deploy, name)
+    for path in [paths['public'], paths['generations'], paths['staging']]:
+        remove_path(path)
 
     _msg = ("Deleted repository: %s" % name)
     if hasattr(request, 'META'):
@@ -22,70 +220,149 @@ def remove_repository_metadata(request, deploy, old_name=""):
         return _msg
 
 
-def create_repository_metadata(deploy, packages=None, request=None):
+def build_repository_metadata(deploy, packages=None):
     """
     Creates the repository metadata.
     deploy = a Deployment object
     packages = a id's list of packages
+
+    The staging tree of the deployment is kept between builds (only the
+    symlinks of changed packages are added or removed) and each build is
+    published as a new generation (builds of the same deployment
+    never overlap, even in different processes)
+    :return: (message level, message)
     """
-    _tmp_path = deploy.path('TMP')
-    _stores_path = Store.path(deploy.project.name, '')[:-1]  # remove trailing slash
-    _slug_tmp_path = os.path.join(
-        _tmp_path,
-        deploy.project.pms.slug
-    )
+    with repository_lock(deploy):
+        _paths = repository_paths(deploy)
+        _stores_path = Store.path(deploy.project.name, '')[:-1]  # remove trailing slash
+        _slug_tmp_path = _paths['slug']  # without trailing slash for replacing in template
 
-    if _slug_tmp_path.endswith('/'):
-        # remove trailing slash for replacing in template
-        _slug_tmp_path = _slug_tmp_path[:-1]
+        _pkg_tmp_path = os.path.join(
+            _slug_tmp_path,
+            deploy.name,
+            PACKAGES_DIR
+        )
+        if not os.path.exists(_pkg_tmp_path):
+            os.makedirs(_pkg_tmp_path)
 
-    _pkg_tmp_path = os.path.join(
-        _slug_tmp_path,
-        deploy.name,
-        'PKGS'  # FIXME hardcoded path!!!
-    )
-    if not os.path.exists(_pkg_tmp_path):
-        os.makedirs(_pkg_tmp_path)
-
-    _ret = ''
-    if not packages and not isinstance(packages, list):
-        packages = deploy.available_packages.all()
-    for _pkg in packages:
-        if isinstance(_pkg, int):
-            _pkg = Package.objects.get(pk=_pkg)
-        _dst = os.path.join(_pkg_tmp_path, _pkg.name)
-        if not os.path.lexists(_dst):
-            os.symlink(
-                os.path.join(_stores_path, _pkg.store.name, _pkg.name),
-                _dst
-            )
-            _ret += _('%(package)s in store %(store)s') % \
-                {"package": _pkg.name, "store": _pkg.store.name} + '<br />'
-
-    # create metadata
-    _run_err = run_in_server(
-        deploy.project.pms.createrepo.replace(
-            '%REPONAME%', deploy.name
-        ).replace('%PATH%', _slug_tmp_path).replace(
-            '%KEYS%', settings.MIGASFREE_KEYS_DIR)
-    )["err"]
-
-    _source = os.path.join(_slug_tmp_path, deploy.name)
-
-    _target = deploy.path()
-    shutil.rmtree(_target, ignore_errors=True)
-
-    shutil.copytree(_source, _target, symlinks=True)
-    shutil.rmtree(_tmp_path)
-
-    if _run_err != '':
-        _msg_level = messages.ERROR
-        _ret = _run_err.decode("utf-8")
-    else:
-        _msg_level = messages.SUCCESS
-        _ret = _('Added packages:') + '<br />' + _ret
+        if not packages and not isinstance(packages, list):
+            packages = deploy.available_packages.all()
+        packages = [
+            Package.objects.get(pk=_pkg) if isinstance(_pkg, int) else _pkg
+            for _pkg in packages
+        ]
+
+        _added = sync_staging(_pkg_tmp_path, packages, _stores_path)[0]
+        _ret = ''.join(
+            _('%(package)s in store %(store)s') % {
+                "package": _pkg.name, "store": _pkg.store.name
+            } + '<br />' for _pkg in _added
+        )
+
+        # stale signatures of the previous build are never published
+        apt_index.remove_signatures(os.path.join(_slug_tmp_path, deploy.name))
+
+        # create metadata
+        if deploy.project.pms.build_mode == Pms.BUILD_MODE_APT:
+            _run_err = apt_index.build(_slug_tmp_path, deploy.name).encode('utf-8')
+        else:
+            _run_err = run_in_server(
+                deploy.project.pms.createrepo.replace(
+                    '%REPONAME%', deploy.name
+                ).replace('%PATH%', _slug_tmp_path).replace(
+                    '%KEYS%', settings.MIGASFREE_KEYS_DIR),
+                name='createrepo'
+            )["err"]
+
+        publish_repository(_paths, os.path.join(_slug_tmp_path, deploy.name))
+
+        if _run_err != b'':
+            return messages.ERROR, _run_err.decode("utf-8")
+
+        return messages.SUCCESS, _('Added packages:') + '<br />' + _ret
+
+
+def create_repository_metadata(deploy, packages=None, request=None):
+    """
+    Builds the repository metadata now (recorded as a RepositoryBuild)
+    """
+    _msg_level, _ret = RepositoryBuild.objects.start_now(deploy).run(packages)
 
     if hasattr(request, 'META'):
         return messages.add_message(request, _msg_level, _ret)
 
     return _ret
+
+
+def request_repository_metadata(deploy, packages=None, request=None, wait=False):
+    """
+    Queues the build of the repository metadata (MIGASFREE_ASYNC_REPOSITORY_BUILDS)
+    or builds it now (if wait or builds are synchronous)
+    """
+    if wait or not settings.MIGASFREE_ASYNC_REPOSITORY_BUILDS:
+        return create_repository_metadata(deploy, packages, request)
+
+    RepositoryBuild.objects.request(deploy)
+    _ret = _('Repository %s queued to be built') % deploy.name
+
+    if hasattr(request, 'META'):
+        return messages.add_message(request, messages.INFO, _ret)
+
+    return _ret
+
+
+def lower_priority():
+    """
+    CPU and I/O priority of build processes
+    (MIGASFREE_REPOSITORY_BUILD_NICE and MIGASFREE_REPOSITORY_BUILD_IONICE)
+    """
+    process = psutil.Process()
+    try:
+        process.nice(max(process.nice(), settings.MIGASFREE_REPOSITORY_BUILD_NICE))
+        process.ionice(settings.MIGASFREE_REPOSITORY_BUILD_IONICE)
+    except (AttributeError, psutil.Error):  # ionice is not supported
+        pass
+
+
+def run_repository_build(build_id):
+    """
+    Runs a queued build
+    :return: (build id, deployment name, status, seconds) or None if
+    another worker has taken it
+    """
+    build = RepositoryBuild.objects.select_related(
+        'deployment', 'deployment__project', 'deployment__project__pms'
+    ).get(pk=build_id)
+    if not build.start():
+        return None
+
+    start = time.time()
+    build.run()
+
+    return build.id, build.deployment.name, build.status, time.time() - start
+
+
+def run_repository_builds(build_ids, processes=1):
+    """
+    Runs queued builds of different deployments concurrently
+    (MIGASFREE_REPOSITORY_BUILD_PROCESSES) yielding the results of
+    run_repository_build as they finish
+    """
+    if processes <= 1:
+        lower_priority()
+        for build_id in build_ids:
+            result = run_repository_build(build_id)
+            if result:
+                yield result
+
+        return
+
+    connections.close_all()  # each process opens its own connection
+    pool = Pool(processes, initializer=lower_priority)
+    try:
+        for result in pool.imap_unordered(run_repository_build, build_ids):
+            if result:
+                yield result
+    finally:
+        pool.close()
+        pool.join()
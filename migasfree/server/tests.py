@@ -3,13 +3,37 @@
 # http://docs.djangoproject.com/en/dev/topics/testing/
 # http://okkum.wordpress.com/2009/02/16/testing-con-django-mas-alla-de-unittest/
 
-from datetime import datetime
+import gzip
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import unittest
 
-from django.test import TransactionTestCase
+from datetime import datetime, timedelta
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 
-from .models import InternalSource, Platform, Project, Pms
+from .models import (
+    InternalSource, Platform, Project, Pms, Computer, MacAddress,
+    Attribute, Property, Deployment, HwNode, HwCapability, HwLogicalName,
+    SoftwareInventory, SoftwareHistory, SoftwareName, SoftwareVersion,
+    PackageDigest, RepositoryBuild, Domain, UserProfile, UploadJob, StatsCounter,
+)
+from . import apt_index, source_cache
+from .api import sync_response_key
+from .cache import bump_version, get_version
 from .fixtures import create_initial_data, sequence_reset
+from .utils import run_in_server, sort_depends, version_key
+from .views import save_hw
 
 
 class InternalSourceTestCase(TransactionTestCase):
@@ -37,6 +61,68 @@ class InternalSourceTestCase(TransactionTestCase):
     def test_name(self):
         self.assertEqual(self.test1.name, 'test-1-2')
 
+    def test_available_deployments(self):
+        computer = Computer.objects.create(
+            'PC1', self.test1.project, '11223344-5566-7788-9900-AABBCCDDEEFF'
+        )
+        all_systems = Attribute.objects.get(pk=1)
+
+        self.assertEqual(Deployment.available_deployments(computer, [all_systems.id]), [])
+
+        self.test1.included_attributes.add(all_systems)
+        self.assertEqual(
+            Deployment.available_deployments(computer, [all_systems.id]),
+            [self.test1]
+        )
+
+        self.test1.excluded_attributes.add(all_systems)
+        self.assertEqual(Deployment.available_deployments(computer, [all_systems.id]), [])
+
+    def test_sync_response_key(self):
+        pc1 = Computer.objects.create('PC1', self.test1.project, '11223344-5566-7788-9900-AABBCCDDEEFF')
+        pc2 = Computer.objects.create('PC2', self.test1.project, '11223344-5566-7788-9900-AABBCCDDEE00')
+        cid = Property.objects.get(prefix='CID')
+        all_systems = Attribute.objects.get(pk=1)
+        self.test1.included_attributes.add(all_systems)
+
+        # attributes not used by rules do not change the key
+        self.assertEqual(
+            sync_response_key(pc1, [], [all_systems.id, Attribute.objects.create(cid, str(pc1.id)).id]),
+            sync_response_key(pc2, [], [all_systems.id, Attribute.objects.create(cid, str(pc2.id)).id])
+        )
+        self.assertNotEqual(
+            sync_response_key(pc1, [], [all_systems.id]),
+            sync_response_key(pc1, [], [])
+        )
+
+    def test_repository_build_queue(self):
+        first = RepositoryBuild.objects.request(self.test1)
+        second = RepositoryBuild.objects.request(self.test1)
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(second.requests, 2)
+        self.assertEqual(RepositoryBuild.objects.stats(), {'pending': 1, 'running': 0})
+        self.assertEqual(list(RepositoryBuild.objects.ready()), [])  # quiet period
+
+        RepositoryBuild.objects.filter(pk=first.pk).update(not_before=datetime.now())
+        self.assertEqual(list(RepositoryBuild.objects.ready()), [first])
+        self.assertTrue(first.start())
+        self.assertFalse(first.start())
+        self.assertEqual(list(RepositoryBuild.objects.ready()), [])
+
+    def test_stale_repository_build(self):
+        running = RepositoryBuild.objects.start_now(self.test1)
+        pending = RepositoryBuild.objects.request(self.test1, immediate=True)
+        self.assertEqual(list(RepositoryBuild.objects.ready()), [])  # being built
+
+        RepositoryBuild.objects.filter(pk=running.pk).update(
+            started_at=datetime.now() - timedelta(hours=2)
+        )
+        self.assertEqual(list(RepositoryBuild.objects.ready()), [pending])
+
+        running.refresh_from_db()
+        self.assertEqual(running.status, RepositoryBuild.STATUS_FAILED)
+
     def test_login(self):
         result = self.client.login(username='admin', password='admin')
         self.assertEqual(result, True)
@@ -48,3 +134,535 @@ class InternalSourceTestCase(TransactionTestCase):
             reverse('admin:server_internalsource_changelist')
         )
         self.assertEqual(response.status_code, 200)
+
+
+class ComputerTestCase(TransactionTestCase):
+    def setUp(self):  # pylint: disable-msg=C0103
+        create_initial_data()
+        sequence_reset()
+
+        project = Project.objects.create(
+            "UBUNTU",
+            Pms.objects.get(name="apt-get"),
+            Platform.objects.create("Linux")
+        )
+
+        self.computer = Computer.objects.create(
+            'PC1', project, '11223344-5566-7788-9900-AABBCCDDEEFF'
+        )
+        self.computer.mac_address = 'AABBCCDDEEFF001122334455'
+        self.computer.save()
+        MacAddress.objects.update_computer(
+            self.computer.id, self.computer.mac_address
+        )
+
+    def test_resolve(self):
+        self.assertEqual(
+            Computer.objects.resolve('PC1', '11223344-5566-7788-9900-AABBCCDDEEFF'),
+            self.computer
+        )
+        self.assertEqual(  # endian format changed
+            Computer.objects.resolve('PC1', '44332211-6655-8877-9900-AABBCCDDEEFF'),
+            self.computer
+        )
+        self.assertEqual(  # by MAC address
+            Computer.objects.resolve('PC2', '00000000-0000-0000-0000-001122334455'),
+            self.computer
+        )
+        self.assertIsNone(
+            Computer.objects.resolve('PC2', '00000000-0000-0000-0000-001122334466')
+        )
+
+    def test_save_hw(self):
+        hardware = {
+            'id': 'pc1', 'class': 'system', 'capabilities': {'smp': 'SMP'},
+            'children': [{
+                'id': 'core', 'class': 'bus',
+                'children': [
+                    {
+                        'id': 'cpu', 'class': 'processor', 'logicalname': 'cpu0',
+                        'children': [{'id': 'cache', 'class': 'memory'}]
+                    },
+                    {'id': 'memory', 'class': 'memory', 'size': 1024},
+                ]
+            }]
+        }
+
+        for _ in range(2):  # replaces previous hardware
+            nodes = save_hw(self.computer, hardware)
+
+        self.assertEqual([node.level for node in nodes], [1, 2, 3, 4, 3])
+        self.assertEqual(  # ids in depth-first order (as the tree is shown)
+            list(HwNode.objects.filter(computer=self.computer).order_by('id').values_list(
+                'name', flat=True
+            )),
+            ['pc1', 'core', 'cpu', 'cache', 'memory']
+        )
+        self.assertEqual(HwNode.objects.get(computer=self.computer, name='cpu').parent.name, 'core')
+        self.assertEqual(HwCapability.objects.filter(node__computer=self.computer).count(), 1)
+        self.assertEqual(HwLogicalName.objects.get(node__computer=self.computer).name, 'cpu0')
+
+        self.computer.update_hardware_resume(nodes)
+        self.assertEqual(self.computer.ram, 1024)
+        self.assertEqual(self.computer.machine, 'P')
+        self.assertEqual(
+            HwNode.summarize(nodes),
+            HwNode.summarize(HwNode.objects.filter(computer=self.computer).order_by('id'))
+        )
+
+    def test_update_sync_attributes(self):
+        self.assertEqual(self.computer.update_sync_attributes([1]), ([1], []))
+        self.assertEqual(self.computer.update_sync_attributes([1]), ([], []))
+        self.assertEqual(self.computer.update_sync_attributes([]), ([], [1]))
+        self.assertEqual(self.computer.sync_attributes.count(), 0)
+
+    def test_software_inventory(self):
+        self.computer.update_software_inventory(
+            '+bash_5.0-6_amd64\n+vim_2:8.1-1~rc1_amd64\n-nano_4.8-1_amd64'
+        )
+        self.assertEqual(
+            SoftwareInventory.objects.by_computer(self.computer.id),
+            ['bash_5.0-6_amd64', 'vim_2:8.1-1~rc1_amd64', 'nano_4.8-1_amd64']
+        )
+        self.assertEqual(SoftwareInventory.objects.filter(computer=self.computer).count(), 2)
+
+        with self.assertNumQueries(1):  # not changed: nothing is written
+            self.computer.update_software_inventory(
+                '+bash_5.0-6_amd64\n+vim_2:8.1-1~rc1_amd64\n-nano_4.8-1_amd64'
+            )
+
+        self.assertEqual(  # only differences are saved
+            SoftwareInventory.objects.update_computer(
+                self.computer.id, '+bash_5.1-2_amd64\n+vim_2:8.1-1~rc1_amd64'
+            ),
+            (1, 1)
+        )
+        self.assertEqual(
+            list(SoftwareInventory.objects.by_package('bash')), [self.computer.id]
+        )
+        self.assertEqual(
+            list(SoftwareInventory.objects.by_package('bash', '5.0-6')), []
+        )
+        self.assertEqual(
+            list(SoftwareInventory.objects.by_version_range('vim', '2:8.0', '2:8.1-1~beta')),
+            []
+        )
+        self.assertEqual(
+            list(SoftwareInventory.objects.by_version_range('vim', '2:8.0')),
+            [self.computer.id]
+        )
+
+    def test_upload_jobs_ready(self):
+        other = Computer.objects.create(
+            'PC2', self.computer.project, '11223344-5566-7788-9900-AABBCCDDEE00'
+        )
+        failing = [
+            UploadJob.objects.enqueue(self.computer, 'upload_computer_software', {})
+            for _ in range(3)
+        ]
+        UploadJob.objects.filter(pk=failing[0].pk).update(
+            attempts=1, next_attempt_at=datetime.now() + timedelta(hours=1)
+        )
+        job = UploadJob.objects.enqueue(other, 'upload_computer_software', {})
+
+        self.assertEqual(list(UploadJob.objects.ready()[:2]), [job])
+
+        UploadJob.objects.filter(pk=failing[0].pk).update(next_attempt_at=datetime.now())
+        self.assertEqual(list(UploadJob.objects.ready()[:2]), failing[:2])
+
+    def test_software_search_scope(self):
+        other = Computer.objects.create(
+            'PC2', self.computer.project, '11223344-5566-7788-9900-AABBCCDDEE00'
+        )
+        for computer in [self.computer, other]:
+            computer.update_software_inventory('+bash_5.0-6_amd64')
+
+        attribute = Attribute.objects.get(pk=1)
+        self.computer.sync_attributes.add(attribute)
+        domain = Domain.objects.create(name='TEST')
+        domain.included_attributes.add(attribute)
+        UserProfile.objects.filter(username='reader').update(domain_preference=domain)
+
+        url = reverse('computer-software_search')
+        self.client.login(username='admin', password='admin')
+        self.assertEqual(
+            sorted(item['id'] for item in self.client.get(url, {'package': 'bash'}).data['results']),
+            sorted([self.computer.id, other.id])
+        )
+
+        self.client.login(username='reader', password='reader')
+        self.assertEqual(
+            [item['id'] for item in self.client.get(url, {'package': 'bash'}).data['results']],
+            [self.computer.id]
+        )
+
+    def test_software_history(self):
+        self.computer.update_software_history('# 2020-01-01\n+bash_5.0-6_amd64')
+        self.computer.update_software_history('')
+        self.computer.update_software_history('# 2020-01-02\n-bash_5.0-6_amd64')
+
+        self.assertEqual(SoftwareHistory.objects.by_computer(self.computer.id).count(), 2)
+        self.assertEqual(
+            self.computer.get_software_history(),
+            '# 2020-01-01\n+bash_5.0-6_amd64\n\n# 2020-01-02\n-bash_5.0-6_amd64'
+        )
+
+        self.client.login(username='admin', password='admin')
+        url = reverse('computer-software_history', args=[self.computer.id])
+        response = self.client.get(url, {'offset': 1, 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Total-Count'], '2')
+        self.assertEqual(
+            b''.join(response.streaming_content),
+            b'"# 2020-01-02\\n-bash_5.0-6_amd64"'
+        )
+
+        for params in [{'offset': -1}, {'limit': -1}, {'limit': 'all'}]:
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class AttributeResolveTestCase(TransactionTestCase):
+    def setUp(self):  # pylint: disable-msg=C0103
+        create_initial_data()
+        sequence_reset()
+
+        self.property_att = Property.objects.create(
+            name='FQDN', prefix='FQD', kind='R', sort='client'
+        )
+
+    def test_resolve(self):
+        existing = Attribute.objects.create(self.property_att, 'example.org')
+        long_value = 'x' * (Attribute.VALUE_LEN + 10)
+
+        attributes = Attribute.objects.resolve([
+            (self.property_att, 'pc1.example.org~description'),
+            (self.property_att, ' example.org '),
+            (self.property_att, long_value),
+        ])
+
+        self.assertEqual(attributes[0].value, 'pc1.example.org')
+        self.assertEqual(attributes[0].description, 'description')
+        self.assertEqual(attributes[1].id, existing.id)
+        self.assertEqual(attributes[2].value, long_value[:Attribute.VALUE_LEN])
+        self.assertEqual(
+            Attribute.process_kind_property(self.property_att, 'pc1.example.org'),
+            [attributes[0].id, existing.id, Attribute.objects.get(value='org').id]
+        )
+
+    def test_auto_add(self):
+        self.property_att.auto_add = False
+        self.property_att.save()
+
+        with self.assertRaises(ValidationError):
+            Attribute.objects.resolve([(self.property_att, 'new value')])
+
+
+class SoftwareSearchTestCase(TransactionTestCase):
+    COMPUTERS = 100
+    PACKAGES = 20
+    VERSIONS = 10
+
+    def setUp(self):  # pylint: disable-msg=C0103
+        create_initial_data()
+        sequence_reset()
+
+        project = Project.objects.create(
+            'UBUNTU',
+            Pms.objects.get(name='apt-get'),
+            Platform.objects.create('Linux')
+        )
+        Computer.objects.bulk_create([
+            Computer(
+                name='PC{}'.format(i),
+                project=project,
+                uuid='00000000-0000-0000-0000-{:012d}'.format(i),
+                status='intended'
+            ) for i in range(self.COMPUTERS)
+        ], batch_size=5000)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {} (name) SELECT %s || i FROM generate_series(1, %s) i'.format(
+                    SoftwareName._meta.db_table
+                ), ['pkg', self.PACKAGES]
+            )
+            cursor.execute(
+                'INSERT INTO {} (version, architecture) '
+                'SELECT %s || i, %s FROM generate_series(0, %s) i'.format(
+                    SoftwareVersion._meta.db_table
+                ), ['1.1.', 'amd64', self.VERSIONS - 1]
+            )
+            cursor.execute(
+                'INSERT INTO {inventory} (computer_id, name_id, version_id) '
+                'SELECT c.id, n.id, v.id FROM {computer} c CROSS JOIN {name} n '
+                'JOIN {version} v ON v.version = %s || ((c.id + n.id) %% %s)'.format(
+                    inventory=SoftwareInventory._meta.db_table,
+                    computer=Computer._meta.db_table,
+                    name=SoftwareName._meta.db_table,
+                    version=SoftwareVersion._meta.db_table
+                ), ['1.1.', self.VERSIONS]
+            )
+            cursor.execute('ANALYZE')
+
+    def test_search(self):
+        name = SoftwareName.objects.get(name='pkg7')
+        expected = Computer.productive.extra(
+            where=['({}.id + %s) %% %s < 5'.format(Computer._meta.db_table)],
+            params=[name.id, self.VERSIONS]
+        ).count()
+        self.assertGreater(expected, 0)
+
+        with self.assertNumQueries(2):  # versions of the package, then computers
+            result = Computer.productive.filter(
+                id__in=SoftwareInventory.objects.search('pkg7', lt='1.1.5')
+            ).count()
+
+        self.assertEqual(result, expected)
+
+
+@unittest.skipUnless(
+    os.environ.get('MIGASFREE_BENCHMARK'),
+    'set MIGASFREE_BENCHMARK=1 to run benchmarks'
+)
+class SoftwareSearchBenchmarkTestCase(SoftwareSearchTestCase):
+    COMPUTERS = int(os.environ.get('MIGASFREE_BENCHMARK_COMPUTERS', 50000))
+    PACKAGES = int(os.environ.get('MIGASFREE_BENCHMARK_PACKAGES', 2000))
+
+    def test_benchmark(self):
+        start = time.time()
+        result = Computer.productive.filter(
+            id__in=SoftwareInventory.objects.search('pkg7', lt='1.1.5')
+        ).count()
+        elapsed = time.time() - start
+
+        self.assertGreater(result, 0)
+        print(
+            '\n{} computers x {} packages: search {:.4f}s'.format(
+                self.COMPUTERS, self.PACKAGES, elapsed
+            )
+        )
+
+
+class AptIndexTestCase(TransactionTestCase):
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.path = tempfile.mkdtemp()
+        self.pkgs = os.path.join(self.path, 'dists', 'TEST', 'PKGS')
+        os.makedirs(self.pkgs)
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        shutil.rmtree(self.path)
+
+    def create_deb(self, filename, control, path=None):
+        content = io.BytesIO()
+        with tarfile.open(fileobj=content, mode='w:gz') as tar:
+            data = control.encode()
+            info = tarfile.TarInfo('./control')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+        with open(os.path.join(path or self.pkgs, filename), 'wb') as f:
+            f.write(apt_index.AR_MAGIC)
+            for name, data in [('debian-binary', b'2.0\n'), ('control.tar.gz', content.getvalue())]:
+                f.write('{:<16}{:<12}{:<6}{:<6}{:<8}{:<10}`\n'.format(
+                    name, 0, 0, 0, 100644, len(data)
+                ).encode())
+                f.write(data + (b'\n' if len(data) % 2 else b''))
+
+    def test_build(self):
+        self.create_deb('foo_1.10_all.deb', 'Package: foo\nVersion: 1.10\nDescription: foo\n long\n')
+        self.create_deb('foo_1.9_all.deb', 'Package: foo\nVersion: 1.9\nDepends: bar\nDescription: foo\n')
+
+        apt_index.build(os.path.join(self.path, 'dists'), 'TEST')
+        self.assertEqual(PackageDigest.objects.count(), 2)
+
+        with self.assertNumQueries(1):  # digests of all the packages (not changed)
+            apt_index.packages_index(self.path, 'dists/TEST/PKGS')
+
+        with open(os.path.join(self.pkgs, 'binary-amd64', 'Packages'), 'rb') as f:
+            packages = f.read()
+        with gzip.open(os.path.join(self.pkgs, 'binary-i386', 'Packages.gz')) as f:
+            self.assertEqual(f.read(), packages)
+
+        stanzas = packages.decode().split('\n\n')
+        self.assertEqual(len(stanzas), 3)  # and final blank line
+        self.assertTrue(stanzas[0].startswith(
+            'Package: foo\nVersion: 1.9\nDepends: bar\n'
+            'Filename: dists/TEST/PKGS/foo_1.9_all.deb\n'
+        ))
+        self.assertTrue(stanzas[1].endswith('Description: foo\n long'))
+
+        with open(os.path.join(self.path, 'dists', 'TEST', 'Release')) as f:
+            release = f.read()
+        self.assertIn('Components: PKGS\n', release)
+        self.assertIn(' PKGS/binary-source/Packages.gz\n', release)
+
+    @unittest.skipUnless(shutil.which('gpg'), 'gpg is not installed')
+    def test_sign_twice(self):
+        keys = os.path.join(self.path, 'keys')
+        os.makedirs(os.path.join(keys, '.gnupg'), mode=0o700)
+        subprocess.check_call([
+            'gpg', '--batch', '--homedir', os.path.join(keys, '.gnupg'),
+            '--passphrase', '', '--quick-gen-key', 'migasfree-repository',
+            'default', 'default', 'never'
+        ], stderr=subprocess.DEVNULL)
+        dist = os.path.join(self.path, 'dists', 'TEST')
+
+        with override_settings(MIGASFREE_KEYS_DIR=keys):
+            self.create_deb('foo_1.0_all.deb', 'Package: foo\nVersion: 1.0\n')
+            self.assertEqual(apt_index.build(os.path.join(self.path, 'dists'), 'TEST'), '')
+
+            self.create_deb('bar_1.0_all.deb', 'Package: bar\nVersion: 1.0\n')
+            self.assertEqual(apt_index.build(os.path.join(self.path, 'dists'), 'TEST'), '')
+
+        with open(os.path.join(dist, 'Release')) as f:
+            release = f.read()
+        with open(os.path.join(dist, 'InRelease')) as f:
+            self.assertIn(release, f.read())
+
+        subprocess.check_call([
+            'gpg', '--batch', '--homedir', os.path.join(keys, '.gnupg'), '--verify',
+            os.path.join(dist, 'Release.gpg'), os.path.join(dist, 'Release')
+        ], stderr=subprocess.DEVNULL)
+
+    def test_package_set(self):
+        package_set = os.path.join(self.path, 'store', 'tools')
+        os.makedirs(package_set)
+        self.create_deb('bar_1.0_all.deb', 'Package: bar\nVersion: 1.0\n', package_set)
+        os.symlink(package_set, os.path.join(self.pkgs, 'tools'))
+        os.symlink(self.pkgs, os.path.join(package_set, 'loop'))
+
+        self.assertEqual(
+            list(apt_index.package_files(self.path, 'dists/TEST/PKGS')),
+            ['dists/TEST/PKGS/tools/bar_1.0_all.deb']
+        )
+
+        apt_index.build(os.path.join(self.path, 'dists'), 'TEST')
+        with open(os.path.join(self.pkgs, 'binary-amd64', 'Packages')) as f:
+            self.assertIn('Filename: dists/TEST/PKGS/tools/bar_1.0_all.deb\n', f.read())
+
+
+class CacheVersionTestCase(TransactionTestCase):
+    def test_bump_version(self):
+        version = get_version('deployments')
+        self.assertEqual(get_version('deployments'), version)
+
+        bump_version('deployments')
+        self.assertEqual(get_version('deployments'), version + 1)
+
+        bump_version('policies')  # created when not found
+        self.assertIsNotNone(get_version('policies'))
+
+
+class StatsCounterTestCase(TransactionTestCase):
+    def test_incr(self):
+        StatsCounter.objects.incr('hardware.digest.hit')  # created when not found
+        StatsCounter.objects.incr('hardware.digest.hit')
+
+        self.assertEqual(
+            StatsCounter.objects.get_values('hardware.digest.hit', 'hardware.digest.miss'),
+            {'hardware.digest.hit': 2, 'hardware.digest.miss': 0}
+        )
+
+
+class SortDependsTestCase(SimpleTestCase):
+    def test_sort(self):
+        self.assertEqual(sort_depends({1: [2, 3], 2: [3], 3: [], 4: []}), [3, 4, 2, 1])
+
+    def test_version_key(self):
+        self.assertLess(version_key('1.0~rc1'), version_key('1.0'))
+        self.assertLess(version_key('1.0'), version_key('1.0.1'))
+        self.assertLess(version_key('1.9'), version_key('1.10'))
+        self.assertLess(version_key('9.0'), version_key('1:1.0'))
+        self.assertLess(version_key('1.1.1-1ubuntu2.1~18.04.9'), version_key('1.1.1k'))
+        self.assertLess(version_key('1.2-10'), version_key('1.2.1-1'))
+        self.assertLess(version_key('1.0-1'), version_key('1.0.1'))
+        self.assertLess(version_key('1.0~'), version_key('1.0'))
+        self.assertLess(version_key('1.0-1'), version_key('1.0-1+b1'))
+        self.assertEqual(version_key('1.0'), version_key('1.0-0'))
+
+    def test_circular(self):
+        with self.assertRaises(ValueError) as context:
+            sort_depends({1: [2], 2: [1], 3: []})
+
+        self.assertEqual(context.exception.args[0], {1: [2], 2: [1]})
+
+    def test_deep_graph(self):
+        depends = {item: [item - 1] for item in range(1, 10000)}
+        depends[0] = []
+
+        self.assertEqual(sort_depends(depends), list(range(10000)))
+
+
+@override_settings(MIGASFREE_RUN_TIMEOUT=1, MIGASFREE_RUN_MAX_OUTPUT=10)
+class RunInServerTestCase(SimpleTestCase):
+    def test_output(self):
+        result = run_in_server('echo hello; echo error >&2; seq 100; exit 3')
+
+        self.assertEqual(result['out'], b'hello\n1\n2\n')  # truncated
+        self.assertEqual(result['err'], b'error\n')
+        self.assertEqual(result['returncode'], 3)
+
+    def test_timeout(self):
+        result = run_in_server('sleep 10 & sleep 10')
+
+        self.assertIsNone(result['returncode'])
+        self.assertLess(result['duration'], 5)
+
+
+class SourceCacheTestCase(SimpleTestCase):
+    def setUp(self):  # pylint: disable-msg=C0103
+        self.path = tempfile.mkdtemp()
+        self.upstream = os.path.join(self.path, 'upstream')
+        os.makedirs(self.upstream)
+        with open(os.path.join(self.upstream, 'foo_1.0_all.deb'), 'wb') as f:
+            f.write(b'x' * 100000)
+
+        self.local_file = os.path.join(self.path, 'foo_1.0_all.deb')
+        self.requests = []
+
+        test = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super(Handler, self).__init__(*args, directory=test.upstream, **kwargs)
+
+            def do_GET(self):
+                test.requests.append(self.headers.get('If-Modified-Since'))
+                super(Handler, self).do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/foo_1.0_all.deb'.format(self.server.server_port)
+
+    def tearDown(self):  # pylint: disable-msg=C0103
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.path)
+
+    def test_fetch(self):
+        events = []
+        stream = source_cache.fetch(self.local_file, lambda: self.url, count=events.append, chunk_size=1000)
+        first = next(stream)
+        self.assertTrue(os.path.exists(source_cache.part_path(self.local_file)))
+
+        # a concurrent request tails the partial file
+        waiting = source_cache.fetch(self.local_file, lambda: self.url, count=events.append, chunk_size=1000)
+
+        self.assertEqual(len(first + b''.join(stream)), 100000)
+        self.assertEqual(len(b''.join(waiting)), 100000)
+        self.assertEqual(os.path.getsize(self.local_file), 100000)
+        self.assertEqual(len(self.requests), 1)
+        self.assertIsNone(source_cache.fetch(self.local_file, lambda: self.url, count=events.append))
+        self.assertEqual(events, ['miss', 'shared', 'hit'])
+
+    def test_revalidate(self):
+        b''.join(source_cache.fetch(self.local_file, lambda: self.url))
+        os.utime(self.local_file, (0, 0))
+
+        # not modified: only mtime is updated
+        self.assertIsNone(source_cache.fetch(self.local_file, lambda: self.url, max_age=60))
+        self.assertIsNotNone(self.requests[-1])
+        self.assertGreater(os.stat(self.local_file).st_mtime, 0)
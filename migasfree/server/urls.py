@@ -89,6 +89,7 @@ urlpatterns = [
     ),
 
     url(r'^api/$', api, name='api'),
+    url(r'^admin/server/api/stats/$', api_stats, name='api_stats'),
 
     url(
         r'^get_projects/$',
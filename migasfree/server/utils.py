@@ -1,14 +1,31 @@
 # -*- coding: UTF-8 -*-
 
 import os
+import re
+import json
+import time
+import signal
+import hashlib
+import logging
 import tempfile
-import copy
+import selectors
+import threading
+import subprocess
 
+from collections import deque
 from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.utils.html import format_html
 
+from .metrics import metrics, DURATION_BUCKETS
+
+logger = logging.getLogger('migasfree')
+
+RUN_CHUNK_SIZE = 64 * 1024
+_run_semaphore = None
+_run_semaphore_lock = threading.Lock()
+
 
 def write_file(filename, content):
     """
@@ -66,22 +83,152 @@ def list_common(l1, l2):
     return list(set(l1).intersection(l2))
 
 
-def run_in_server(bash_code):
-    _, tmp_file = tempfile.mkstemp()
-    write_file(tmp_file, bash_code)
+def run_semaphore():
+    """
+    Caps the processes run at the same time by this server process
+    (MIGASFREE_RUN_MAX_PROCESSES)
+    """
+    global _run_semaphore
 
-    os.system("ionice -c 3 bash %(file)s 1> %(file)s.out 2> %(file)s.err" % {
-        'file': tmp_file
-    })
+    with _run_semaphore_lock:
+        if _run_semaphore is None:
+            _run_semaphore = threading.BoundedSemaphore(settings.MIGASFREE_RUN_MAX_PROCESSES)
 
-    out = read_file('{}.out'.format(tmp_file))
-    err = read_file('{}.err'.format(tmp_file))
+    return _run_semaphore
 
-    os.remove(tmp_file)
-    os.remove('{}.out'.format(tmp_file))
-    os.remove('{}.err'.format(tmp_file))
 
-    return {"out": out, "err": err}
+def kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:  # already finished
+        pass
+
+
+def read_process_output(process, name, deadline, max_output, on_output=None):
+    """
+    Reads stdout and stderr of process as they are written until both are
+    closed or deadline is reached (output beyond max_output bytes by
+    stream is discarded)
+    :return: (out, err, truncated, timed_out)
+    """
+    output = {'out': [], 'err': []}
+    sizes = {'out': 0, 'err': 0}
+    truncated = False
+    timed_out = False
+
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, 'out')
+    selector.register(process.stderr, selectors.EVENT_READ, 'err')
+
+    while selector.get_map():
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            timed_out = True
+            break
+
+        for key, event in selector.select(remaining):
+            data = os.read(key.fd, RUN_CHUNK_SIZE)
+            if not data:
+                selector.unregister(key.fileobj)
+                continue
+
+            stream = key.data
+            logger.debug('%s %s: %s', name, stream, data.decode('utf-8', 'replace').rstrip())
+            if on_output:
+                on_output(stream, data)
+
+            room = max_output - sizes[stream]
+            if len(data) > room:
+                truncated = True
+                data = data[:room]
+            if data:
+                output[stream].append(data)
+                sizes[stream] += len(data)
+
+    selector.close()
+
+    return b''.join(output['out']), b''.join(output['err']), truncated, timed_out
+
+
+def run_in_server(bash_code, name='run_in_server', timeout=None, max_output=None, on_output=None):
+    """
+    Runs bash code (idle I/O priority) streaming its output to the log
+    and on_output(stream, data), where stream is 'out' or 'err'
+    The process (and its children) is killed after timeout seconds
+    (MIGASFREE_RUN_TIMEOUT) and only the first max_output bytes of each
+    stream are kept (MIGASFREE_RUN_MAX_OUTPUT)
+    Metrics: run.<name>.calls, duration, failures, timeouts, truncated
+    and rejected (waiting for the semaphore)
+    :return: {'out': bytes, 'err': bytes, 'returncode': int or None, 'duration': seconds}
+    """
+    timeout = timeout or settings.MIGASFREE_RUN_TIMEOUT
+    max_output = max_output or settings.MIGASFREE_RUN_MAX_OUTPUT
+    metric = 'run.{}.'.format(name)
+
+    start = time.time()
+    deadline = start + timeout
+
+    semaphore = run_semaphore()
+    if not semaphore.acquire(timeout=timeout):
+        metrics.incr(metric + 'rejected')
+        return {
+            'out': b'',
+            'err': '{}: too many processes running\n'.format(name).encode('utf-8'),
+            'returncode': None,
+            'duration': time.time() - start,
+        }
+
+    _fd, tmp_file = tempfile.mkstemp()
+    os.close(_fd)
+    try:
+        write_file(tmp_file, bash_code)
+
+        process = subprocess.Popen(
+            ['ionice', '-c', '3', 'bash', tmp_file],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True  # own process group (killed on timeout)
+        )
+        try:
+            out, err, truncated, timed_out = read_process_output(
+                process, name, deadline, max_output, on_output
+            )
+            if not timed_out:
+                try:
+                    process.wait(max(deadline - time.time(), 0))
+                except subprocess.TimeoutExpired:
+                    timed_out = True
+        finally:
+            if process.returncode is None:
+                kill_process_group(process)
+                process.wait()
+            process.stdout.close()
+            process.stderr.close()
+    finally:
+        os.remove(tmp_file)
+        semaphore.release()
+
+    duration = time.time() - start
+    metrics.incr(metric + 'calls')
+    metrics.observe(metric + 'duration', duration, DURATION_BUCKETS)
+
+    if truncated:
+        metrics.incr(metric + 'truncated')
+        logger.warning('%s: output truncated to %d bytes', name, max_output)
+    if timed_out:
+        metrics.incr(metric + 'timeouts')
+        logger.error('%s: killed after %d seconds', name, timeout)
+        err += '\n{}: killed after {} seconds\n'.format(name, timeout).encode('utf-8')
+    elif process.returncode != 0:
+        metrics.incr(metric + 'failures')
+
+    return {
+        'out': out,
+        'err': err,
+        'returncode': None if timed_out else process.returncode,
+        'duration': duration,
+    }
 
 
 def get_client_ip(request):
@@ -132,6 +279,15 @@ def uuid_change_format(uuid):
     return uuid
 
 
+def digest_data(data):
+    """
+    SHA-256 of the canonical JSON representation of data
+    """
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, separators=(',', ':')).encode()
+    ).hexdigest()
+
+
 def time_horizon(date, delay):
     """
     No weekends
@@ -227,25 +383,83 @@ def html_label(count, title='', link='#', level='default'):
 
 
 def sort_depends(data):
-    # if something fails, ask @agacias
+    """
+    Topological sort (Kahn's algorithm)
+    :param data: {node: [dependencies], ...}
+    :return: [node, ...] (dependencies first)
+    raises ValueError({node: [pending dependencies], ...}) if there are
+    circular (or unknown) dependencies
+    """
+    pending = {node: set(depends) for node, depends in data.items()}
+    dependents = {}
+    for node, depends in pending.items():
+        for item in depends:
+            dependents.setdefault(item, []).append(node)
+
+    ready = deque(node for node in data if not pending[node])
     ret = []
-    data_copy = copy.deepcopy(data)
-
-    def sort():
-        for i, s in list(data_copy.items()):
-            if not s:
-                if data_copy:
-                    ret.append(i)
-                    del data_copy[i]
-                    for _, n in list(data_copy.items()):
-                        if i in n:
-                            n.remove(i)
-
-                    sort()
-
-        if data_copy:
-            raise ValueError(data_copy)
-        else:
-            return ret
-
-    return sort()
+    while ready:
+        node = ready.popleft()
+        ret.append(node)
+        for item in dependents.get(node, []):
+            pending[item].discard(node)
+            if not pending[item]:
+                ready.append(item)
+
+    if len(ret) < len(pending):
+        done = set(ret)
+        raise ValueError({
+            node: sorted(depends)
+            for node, depends in pending.items() if node not in done
+        })
+
+    return ret
+
+
+def version_order(char):
+    """
+    Weight of a non digit character of a version (dpkg order: '~' before
+    the end of the part, then letters, then the rest)
+    """
+    if char == '~':
+        return -1
+
+    if char.isalpha():
+        return ord(char)
+
+    return ord(char) + 256
+
+
+def version_part_key(part):
+    """
+    Sort key of an upstream version or revision (dpkg verrevcmp):
+    alternating runs of non digits (compared by version_order, the end of
+    a run is 0) and digits (compared as numbers)
+    """
+    key = []
+    for chars, digits in re.findall(r'(\D*)(\d*)', part)[:-1]:  # last match is empty
+        key.append(tuple(version_order(char) for char in chars) + (0,))
+        key.append(int(digits or 0))
+
+    while key[-2:] == [(0,), 0]:  # '0' is the same as ''
+        del key[-2:]
+    key.append((0,))  # end of part (before '~', after anything else)
+
+    return tuple(key)
+
+
+def version_key(version):
+    """
+    Sort key of package versions ([epoch:]upstream[-revision]) like
+    dpkg --compare-versions
+    """
+    version = (version or '').strip()
+    epoch, sep, rest = version.partition(':')
+    if not sep or not epoch.isdigit():
+        epoch, rest = '0', version
+
+    upstream, sep, revision = rest.rpartition('-')
+    if not sep:
+        upstream, revision = rest, ''
+
+    return int(epoch), version_part_key(upstream), version_part_key(revision)
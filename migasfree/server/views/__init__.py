@@ -3,8 +3,8 @@
 # import order is very important!!!
 
 from .queries import get_query, computer_messages
-from .hardware import hardware_resume, hardware_extract, load_hw, process_hw
-from .client_api import api
+from .hardware import hardware_resume, hardware_extract, load_hw, save_hw, process_hw
+from .client_api import api, api_stats
 from .public_api import (
     get_projects, get_computer_info, computer_label,
     get_key_repositories, RepositoriesUrlTemplateView,
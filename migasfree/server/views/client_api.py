@@ -2,48 +2,31 @@
 
 import os
 import json
+import time
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler, TemporaryFileUploadHandler,
+)
+from django.http import HttpResponse, JsonResponse
 from django.urls import reverse
 from django.utils.translation import ugettext as _
 from django.views.decorators.csrf import csrf_exempt
 
 from ..api import *
-from ..models import Error, Notification
-from ..secure import wrap, unwrap
-from ..utils import get_client_ip, uuid_validate, read_file
-from .. import errmfs
-
-# USING USERNAME AND PASSWORD ONLY (WITHOUT KEYS PAIR)
-API_REGISTER = (
-    "register_computer",
-    "get_key_packager",
-)
-
-# USING "PACKAGER" KEYS PAIR
-API_PACKAGER = (
-    "upload_server_package",
-    "upload_server_set",
-    "create_repositories_of_packageset",
+from ..commands import (
+    commands, AUTH_PROJECT_KEYS, AUTH_PACKAGER_KEYS, AUTH_CREDENTIALS,
 )
+from ..metrics import metrics
+from ..models import Error, Notification, StatsCounter, UploadJob
+from ..secure import wrap_data, unwrap_file
+from ..utils import get_client_ip, uuid_validate
+from .. import errmfs
 
-# USING "VERSION" KEYS
-API_VERSION = (
-    "upload_computer_message",
-    "get_properties",
-    "upload_computer_info",
-    "upload_computer_faults",
-    "upload_computer_hardware",
-    "upload_computer_software_base_diff",
-    "upload_computer_software_base",
-    "upload_computer_software_history",
-    "get_computer_software",
-    "upload_computer_errors",
-    "upload_devices_changes",
-    "set_computer_tags",
-    "get_computer_tags",
-)
+API_REGISTER = commands.names(AUTH_CREDENTIALS)
+API_PACKAGER = commands.names(AUTH_PACKAGER_KEYS)
+API_VERSION = commands.names(AUTH_PROJECT_KEYS)
 
 
 def check_tmp_path():
@@ -54,12 +37,36 @@ def check_tmp_path():
             pass  # FIXME
 
 
-def wrap_command_result(filename, result):
-    wrap(filename, result)
-    ret = read_file(filename)
-    os.remove(filename)
+check_tmp_path()  # FILE_UPLOAD_TEMP_DIR
+
+
+class MessageUploadHandler(MemoryFileUploadHandler):
+    """
+    Keeps client API requests in memory up to MIGASFREE_MESSAGE_MEMORY_SIZE
+    bytes (bigger ones are spilled to a temporary file)
+    """
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.activated = content_length <= settings.MIGASFREE_MESSAGE_MEMORY_SIZE
+
 
-    return ret
+def wrap_command_result(result):
+    return wrap_data(result)
+
+
+def read_request_message(msg, key):
+    """
+    Returns the data of the uploaded message (signed with key or plain JSON
+    if key is None)
+    The temporary file of spilled messages is removed when closed
+    """
+    try:
+        if key is None:
+            msg.seek(0)
+            return json.loads(msg.read().decode())
+
+        return unwrap_file(msg, key)
+    finally:
+        msg.close()
 
 
 def get_msg_info(text):
@@ -83,8 +90,6 @@ def api(request):
     #   filesize = len(file['content'])
     #   filetype = file['content-type']
 
-    check_tmp_path()
-
     if request.method != 'POST':
         return HttpResponse(
             return_message(
@@ -94,11 +99,25 @@ def api(request):
             content_type='text/plain'
         )
 
-    msg = request.FILES.get('message')
-    filename = os.path.join(settings.MIGASFREE_TMP_DIR, msg.name)
-    filename_return = "{}.return".format(filename)
+    start = time.time()
 
+    request.upload_handlers = [
+        MessageUploadHandler(request),
+        TemporaryFileUploadHandler(request),
+    ]
+    msg = request.FILES.get('message')
     command, uuid, name = get_msg_info(msg.name)
+    handler = commands.get(command)
+
+    response = dispatch(request, msg, handler, command, name, uuid)
+
+    if handler:
+        handler.record(time.time() - start, msg.size, len(response.content))
+
+    return response
+
+
+def dispatch(request, msg, handler, command, name, uuid):
     computer = get_computer(name, uuid)
 
     if computer and computer.status == 'unsubscribed':
@@ -116,7 +135,7 @@ def api(request):
             errmfs.error(errmfs.UNSUBSCRIBED_COMPUTER)
         )
         return HttpResponse(
-            wrap_command_result(filename_return, ret),
+            wrap_command_result(ret),
             content_type='text/plain'
         )
 
@@ -130,13 +149,17 @@ def api(request):
             )
         )
 
+    if handler is None:
+        return HttpResponse(
+            return_message(command, errmfs.error(errmfs.COMMAND_NOT_FOUND)),
+            content_type='text/plain'
+        )
+
     # COMPUTERS
-    if command in API_VERSION:  # IF COMMAND IS BY VERSION
+    if handler.auth == AUTH_PROJECT_KEYS:  # IF COMMAND IS BY VERSION
         if computer:
-            save_request_file(msg, filename)
-
             # UNWRAP AND EXECUTE COMMAND
-            data = unwrap(filename, computer.project.name)
+            data = read_request_message(msg, computer.project.name)
             if 'errmfs' in data:
                 ret = return_message(command, data)
 
@@ -151,9 +174,7 @@ def api(request):
                         )
                     )
             else:
-                ret = eval(command)(request, name, uuid, computer, data)
-
-            os.remove(filename)
+                ret = handler(request, name, uuid, computer, data)
         else:
             ret = return_message(
                 command,
@@ -161,47 +182,59 @@ def api(request):
             )
 
         return HttpResponse(
-            wrap_command_result(filename_return, ret),
+            wrap_command_result(ret),
             content_type='text/plain'
         )
 
     # REGISTERS
     # COMMAND NOT USE KEYS PAIR, ONLY USERNAME AND PASSWORD
-    elif command in API_REGISTER:
-        save_request_file(msg, filename)
-
-        with open(filename, 'rb') as f:
-            data = json.load(f)[command]
+    elif handler.auth == AUTH_CREDENTIALS:
+        data = read_request_message(msg, None)[command]
 
         try:
-            ret = eval(command)(request, name, uuid, computer, data)
+            ret = handler(request, name, uuid, computer, data)
         except:
             ret = return_message(command, errmfs.error(errmfs.GENERIC))
 
-        os.remove(filename)
-
         return HttpResponse(json.dumps(ret), content_type='text/plain')
 
     # PACKAGER
-    elif command in API_PACKAGER:
-        save_request_file(msg, filename)
-
+    elif handler.auth == AUTH_PACKAGER_KEYS:
         # UNWRAP AND EXECUTE COMMAND
-        data = unwrap(filename, "migasfree-packager")
+        data = read_request_message(msg, "migasfree-packager")
         if 'errmfs' in data:
             ret = data
         else:
-            ret = eval(command)(request, name, uuid, computer, data[command])
-
-        os.remove(filename)
+            ret = handler(request, name, uuid, computer, data[command])
 
         return HttpResponse(
-            wrap_command_result(filename_return, ret),
+            wrap_command_result(ret),
             content_type='text/plain'
         )
 
-    else:
-        return HttpResponse(
-            return_message(command, errmfs.error(errmfs.COMMAND_NOT_FOUND)),
-            content_type='text/plain'
-        )
+
+@staff_member_required
+def api_stats(request):
+    """
+    Returns calls, latency and payload sizes of client API commands
+    (and the rest of metrics) collected by this server process
+    and the state of the uploads queue, hardware digests and external
+    sources cache (shared by all processes)
+    """
+    counters = StatsCounter.objects.get_values('hardware.digest.hit', 'hardware.digest.miss')
+    hits = counters['hardware.digest.hit']
+    misses = counters['hardware.digest.miss']
+
+    return JsonResponse({
+        'commands': commands.stats(),
+        'metrics': metrics.snapshot(),
+        'uploads': UploadJob.objects.stats(),
+        'hardware_digest': {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': float(hits) / (hits + misses) if hits + misses else 0,
+        },
+        'sources': dict(
+            StatsCounter.objects.filter(name__startswith='source.').values_list('name', 'value')
+        ),
+    })
@@ -4,6 +4,7 @@ import json
 
 from django.contrib.auth.decorators import login_required
 from django.core import serializers
+from django.db import connection, transaction
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse
 from django.utils.translation import ugettext as _
@@ -18,6 +19,7 @@ from ..models import (
 )
 
 MAXINT = 9223372036854775807  # sys.maxint = (2**63) - 1
+BATCH_SIZE = 1000
 
 
 @login_required
@@ -72,57 +74,118 @@ def hardware_extract(request, pk):
     )
 
 
-def load_hw(computer, node, parent, level):
+def new_hw_node(computer, node, parent, level):
     size = int(node.get('size', 0))
 
-    n = HwNode.objects.create({
-        'parent': parent,
-        'computer': Computer.objects.get(id=computer.id),
-        'level': level,
-        'name': str(node.get('id')),
-        'class_name': node.get('class'),
-        'enabled': node.get('enabled', False),
-        'claimed': node.get('claimed', False),
-        'description': node.get('description'),
-        'vendor': node.get('vendor'),
-        'product': node.get('product'),
-        'version': node.get('version'),
-        'serial': node.get('serial'),
-        'bus_info': node.get('businfo'),
-        'physid': node.get('physid'),
-        'slot': node.get('slot'),
-        'size': size if (MAXINT >= size >= -MAXINT - 1) else 0,
-        'capacity': node.get('capacity'),
-        'clock': node.get('clock'),
-        'width': node.get('width'),
-        'dev': node.get('dev')
-    })
-
-    level += 1
-
-    for e in node:
-        if e == "children":
-            for x in node[e]:
-                if isinstance(x, dict):
-                    load_hw(computer, x, n, level)
-        elif e == "capabilities":
-            for x in node[e]:
-                HwCapability.objects.create(
-                    node=n, name=x, description=node[e][x]
-                )
-        elif e == "configuration":
-            for x in node[e]:
-                HwConfiguration.objects.create(node=n, name=x, value=node[e][x])
-        elif e == "logicalname":
-            if isinstance(node[e], str):
-                HwLogicalName.objects.create(node=n, name=node[e])
-            else:
-                for x in node[e]:
-                    HwLogicalName.objects.create(node=n, name=x)
-        elif e == "resource":
-            print(e, node[e])
+    return HwNode(
+        parent=parent,
+        computer=computer,
+        level=level,
+        name=str(node.get('id')),
+        class_name=node.get('class'),
+        enabled=node.get('enabled', False),
+        claimed=node.get('claimed', False),
+        description=node.get('description'),
+        vendor=node.get('vendor'),
+        product=node.get('product'),
+        version=node.get('version'),
+        serial=node.get('serial'),
+        bus_info=node.get('businfo'),
+        physid=node.get('physid'),
+        slot=node.get('slot'),
+        size=size if (MAXINT >= size >= -MAXINT - 1) else 0,
+        capacity=node.get('capacity'),
+        clock=node.get('clock'),
+        width=node.get('width'),
+        dev=node.get('dev')
+    )
+
+
+def reserve_ids(model, count):
+    """
+    Next count ids of the sequence of model (PostgreSQL), in one query
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [model._meta.db_table, count]
+        )
+
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def load_hw(computer, node, parent=None, level=1):
+    """
+    Saves the lshw tree (one bulk insert per table), without recursion
+    Ids of nodes follow a depth-first pre-order (each node before its
+    children, siblings in lshw order): the order hardware is shown in
+    Returns the list of created nodes (in that order)
+    """
+    items = []  # (data, index of parent item, level)
+    stack = [(node, None, level)]
+    while stack:
+        data, parent_index, data_level = stack.pop()
+        items.append((data, parent_index, data_level))
+        stack.extend(
+            (x, len(items) - 1, data_level + 1)
+            for x in reversed(data.get('children', [])) if isinstance(x, dict)
+        )
+
+    ids = reserve_ids(HwNode, len(items)) if connection.vendor == 'postgresql' else None
+
+    nodes = []
+    capabilities = []
+    configurations = []
+    logical_names = []
+
+    for i, (data, parent_index, data_level) in enumerate(items):
+        obj = new_hw_node(
+            computer, data,
+            nodes[parent_index] if parent_index is not None else parent,
+            data_level
+        )
+        if ids:
+            obj.id = ids[i]
         else:
-            pass
+            obj.save()
+        nodes.append(obj)
+
+        for x in data.get('capabilities', {}):
+            capabilities.append(
+                HwCapability(node=obj, name=x, description=data['capabilities'][x])
+            )
+
+        for x in data.get('configuration', {}):
+            configurations.append(
+                HwConfiguration(node=obj, name=x, value=data['configuration'][x])
+            )
+
+        if 'logicalname' in data:
+            if isinstance(data['logicalname'], str):
+                logical_names.append(HwLogicalName(node=obj, name=data['logicalname']))
+            else:
+                for x in data['logicalname']:
+                    logical_names.append(HwLogicalName(node=obj, name=x))
+
+    if ids:
+        HwNode.objects.bulk_create(nodes, batch_size=BATCH_SIZE)
+
+    HwCapability.objects.bulk_create(capabilities, batch_size=BATCH_SIZE)
+    HwConfiguration.objects.bulk_create(configurations, batch_size=BATCH_SIZE)
+    HwLogicalName.objects.bulk_create(logical_names, batch_size=BATCH_SIZE)
+
+    return nodes
+
+
+def save_hw(computer, data):
+    """
+    Replaces the hardware of a computer in one transaction
+    Returns the list of created nodes
+    """
+    with transaction.atomic():
+        HwNode.objects.delete_computer(computer.id)
+
+        return load_hw(computer, data)
 
 
 def process_hw(computer, jsonfile):
@@ -140,5 +203,4 @@ def process_hw(computer, jsonfile):
             )
             return
 
-    HwNode.objects.filter(computer=computer).delete()
-    load_hw(computer, data, None, 1)
+    save_hw(computer, data)
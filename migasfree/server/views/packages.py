@@ -13,6 +13,15 @@ from ..utils import run_in_server
 import logging
 logger = logging.getLogger('migasfree')
 
+INFO_TIMEOUT = 60  # seconds
+
+
+def is_hidden(path):
+    """
+    Hidden files and folders (build trees like .staging and .generations)
+    """
+    return any(item.startswith('.') and item != '..' for item in path.split('/'))
+
 
 @login_required
 def info(request, path=None):
@@ -30,13 +39,16 @@ def info(request, path=None):
     absolute_path = os.path.join(settings.MIGASFREE_PUBLIC_DIR, path)
     logger.debug('absolute path:' + absolute_path)
 
+    if is_hidden(path or ''):
+        absolute_path = ''
+
     if os.path.isfile(absolute_path):
         project = get_object_or_404(Project, name=project_name)
         logger.debug('project: ' + project_name)
 
         cmd = 'PACKAGE={}\n'.format(absolute_path)
         cmd += project.pms.info
-        package_info = run_in_server(cmd)["out"]
+        package_info = run_in_server(cmd, name='package_info', timeout=INFO_TIMEOUT)["out"]
 
         return render(
             request,
@@ -57,6 +69,9 @@ def info(request, path=None):
         elements = os.listdir(absolute_path)
         elements.sort()
         for item in elements:
+            if is_hidden(item):
+                continue
+
             icon = 'archive'
             relative_path = os.path.join(path, item)
 
@@ -1,19 +1,14 @@
 # -*- coding: utf-8 -*-
 
 import os
-import time
 import json
-import ssl
-import tempfile
-import shutil
 
 from django.conf import settings
-from django.http import HttpResponse, JsonResponse, Http404
+from django.http import HttpResponse, JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
 from django.utils.translation import ugettext as _
 
-from urllib.request import urlopen
 from urllib.error import URLError, HTTPError
 from wsgiref.util import FileWrapper
 from rest_framework.decorators import permission_classes
@@ -21,7 +16,8 @@ from rest_framework import permissions, views
 from rest_framework.response import Response
 from rest_framework import status
 
-from ..models import Platform, Project, Deployment, ExternalSource, Notification
+from .. import source_cache
+from ..models import Platform, Project, Deployment, ExternalSource, Notification, StatsCounter
 from ..api import get_computer
 from ..utils import uuid_validate
 from ..secure import gpg_get_key
@@ -122,23 +118,6 @@ def add_notification_get_source_file(error, deployment, resource, remote):
     )
 
 
-def read_remote_chunks(local_file, remote, chunk_size=8192):
-    _, tmp = tempfile.mkstemp()
-    with open(tmp, 'wb') as tmp_file:
-        while True:
-            data = remote.read(chunk_size)
-            if not data:
-                break
-
-            yield data
-            tmp_file.write(data)
-            tmp_file.flush()
-
-        os.fsync(tmp_file.fileno())
-
-    shutil.move(tmp, local_file)
-
-
 def get_source_file(request):
     source = None
 
@@ -149,60 +128,64 @@ def get_source_file(request):
 
     _file_local = os.path.join(settings.MIGASFREE_PUBLIC_DIR, _path.split('/src/')[1])
 
+    if os.path.isdir(_file_local):
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+    max_age = None  # packages never expire
     # FIXME PMS dependency
     if not (_file_local.endswith('.deb') or _file_local.endswith('.rpm')):  # is a metadata file
         source = ExternalSource.objects.get(project__name=project_name, name=source_name)
 
         if not source.frozen:
-            # expired metadata
-            if os.path.exists(_file_local) and (
-                source.expire <= 0 or
-                (time.time() - os.stat(_file_local).st_mtime) / (60 * source.expire) > 1
-            ):
-                os.remove(_file_local)
+            # expired metadata is revalidated
+            max_age = max(source.expire, 0) * 60
 
-    if not os.path.exists(_file_local):
-        if not os.path.exists(os.path.dirname(_file_local)):
-            os.makedirs(os.path.dirname(_file_local))
+    def get_url():
+        nonlocal source
 
         if not source:
             source = ExternalSource.objects.get(project__name=project_name, name=source_name)
 
-        url = '{}/{}'.format(source.base_url, resource)
-
-        try:
-            ctx = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
-            remote_file = urlopen(url, context=ctx)
-
-            stream = read_remote_chunks(_file_local, remote_file)
-            response = HttpResponse(
-                stream,
-                status=status.HTTP_206_PARTIAL_CONTENT,
-                content_type='application/octet-stream'
-            )
-            response['Cache-Control'] = 'no-cache'
-
-            return response
-        except HTTPError as e:
-            add_notification_get_source_file("HTTP Error: {}".format(e.code), source, _path, url)
-            return HttpResponse(
-                'HTTP Error: {} {}'.format(e.code, url),
-                status=e.code
-            )
-        except URLError as e:
-            add_notification_get_source_file("URL error: {}".format(e.reason), source, _path, url)
-            return HttpResponse(
-                'URL Error: {} {}'.format(e.reason, url),
-                status=status.HTTP_404_NOT_FOUND
-            )
-    else:
-        if not os.path.isfile(_file_local):
-            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
-        else:
-            response = HttpResponse(FileWrapper(open(_file_local, 'rb')), content_type='application/octet-stream')
-            response['Content-Disposition'] = 'attachment; filename={}'.format(os.path.basename(_file_local))
-            response['Content-Length'] = os.path.getsize(_file_local)
-            return response
+        return '{}/{}'.format(source.base_url, resource)
+
+    def count(event):
+        StatsCounter.objects.incr('source.{}.{}.{}'.format(project_name, source_name, event))
+
+    if not os.path.exists(os.path.dirname(_file_local)):
+        os.makedirs(os.path.dirname(_file_local), exist_ok=True)
+
+    try:
+        # only one request downloads the file (the rest wait for it)
+        stream = source_cache.fetch(_file_local, get_url, max_age, count)
+    except HTTPError as e:
+        get_url()  # source of the notification
+        add_notification_get_source_file("HTTP Error: {}".format(e.code), source, _path, e.filename)
+        return HttpResponse(
+            'HTTP Error: {} {}'.format(e.code, e.filename),
+            status=e.code
+        )
+    except URLError as e:
+        url = get_url()  # source may not be loaded if the download was not started here
+        add_notification_get_source_file("URL error: {}".format(e.reason), source, _path, url)
+        return HttpResponse(
+            'URL Error: {} {}'.format(e.reason, url),
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if stream is not None:
+        response = StreamingHttpResponse(
+            stream,
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type='application/octet-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+
+        return response
+
+    response = HttpResponse(FileWrapper(open(_file_local, 'rb')), content_type='application/octet-stream')
+    response['Content-Disposition'] = 'attachment; filename={}'.format(os.path.basename(_file_local))
+    response['Content-Length'] = os.path.getsize(_file_local)
+    return response
 
 
 @permission_classes((permissions.AllowAny,))
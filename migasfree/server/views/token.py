@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import re
+import json
 
 from datetime import datetime
 
@@ -8,9 +8,10 @@ from django.apps import apps
 from django.db.models import Q
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import QueryDict
+from django.http import QueryDict, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import viewsets, exceptions, status, mixins, filters
 from rest_framework.decorators import action
@@ -18,6 +19,7 @@ from rest_framework.response import Response
 from rest_framework_filters import backends
 
 from .. import models, serializers
+from ..models.software_inventory import parse_search
 from ..filters import (
     ComputerFilter, StoreFilter, PropertyFilter,
     ProjectFilter, AttributeSetFilter, AttributeFilter, PackageFilter,
@@ -26,7 +28,7 @@ from ..filters import (
     NodeFilter, SynchronizationFilter, StatusLogFilter,
     DeviceFilter, DriverFilter, ScheduleDelayFilter,
 )
-from ..tasks import create_repository_metadata
+from ..tasks import request_repository_metadata
 
 
 class MigasViewSet(viewsets.ViewSet):
@@ -244,28 +246,92 @@ class ComputerViewSet(viewsets.ModelViewSet, MigasViewSet):
         Returns installed packages in a computer
         """
         computer = get_object_or_404(models.Computer, pk=pk)
-        data = []
-        if computer.software_inventory:
-            data = re.sub(r'^\+', '', computer.software_inventory, flags=re.MULTILINE)
-            data = re.sub(r'^-', '', data, flags=re.MULTILINE)
-            data = data.rstrip().split('\n')
 
         return Response(
-            data,
+            models.SoftwareInventory.objects.by_computer(computer.id),
             status=status.HTTP_200_OK
         )
 
+    @action(methods=['get'], detail=False, url_path='software/search', url_name='software_search')
+    def software_search(self, request):
+        """
+        Returns computers with a package installed
+        Params:
+            package: 'name', 'name=version' or 'name<version'
+                ('<', '<=', '>', '>=')
+            (and the rest of computer filters)
+        """
+        try:
+            name, versions = parse_search(request.query_params.get('package'))
+        except ValueError:
+            raise exceptions.ParseError(
+                _('package must be name[(=|<|<=|>|>=)version]')
+            )
+
+        queryset = self.filter_queryset(
+            models.Computer.objects.scope(request.user.userprofile)
+        ).filter(
+            id__in=models.SoftwareInventory.objects.search(name, **versions)
+        )
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
     @action(methods=['get'], detail=True, url_path='software/history', url_name='software_history')
     def software_history(self, request, pk=None):
         """
-        Returns software history of a computer
+        Returns software history of a computer (streamed as a JSON string)
+        Optional params:
+            since, until: dates (YYYY-MM-DD) or datetimes (ISO 8601)
+            offset, limit: chunks (uploads) to skip and to return
         """
         computer = get_object_or_404(models.Computer, pk=pk)
 
-        return Response(
-            computer.software_history,
+        dates = {}
+        for param in ['since', 'until']:
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    dates[param] = parse_datetime(value) or parse_date(value)
+                except ValueError:
+                    dates[param] = None
+                if dates[param] is None:
+                    raise exceptions.ParseError(_('Invalid date: %s') % value)
+
+        try:
+            offset = int(request.query_params.get('offset', 0))
+            limit = request.query_params.get('limit')
+            limit = int(limit) if limit is not None else None
+            if offset < 0 or (limit is not None and limit < 0):
+                raise ValueError
+        except ValueError:
+            raise exceptions.ParseError(_('offset and limit must be non-negative integers'))
+
+        chunks = models.SoftwareHistory.objects.by_computer(computer.id, **dates)
+        total = chunks.count()
+        chunks = chunks[offset:offset + limit] if limit is not None else chunks[offset:]
+
+        def content():
+            yield '"'
+            for i, chunk in enumerate(chunks.iterator()):
+                if i:
+                    yield '\\n\\n'
+                yield json.dumps(chunk.get_content())[1:-1]
+            yield '"'
+
+        response = StreamingHttpResponse(
+            content(),
+            content_type='application/json',
             status=status.HTTP_200_OK
         )
+        response['X-Total-Count'] = total
+
+        return response
 
     @action(methods=['post'], detail=True)
     def status(self, request, pk=None):
@@ -649,8 +715,8 @@ class InternalSourceViewSet(viewsets.ModelViewSet, MigasViewSet):
         """
         Creates repository metadata
         """
-        get_object_or_404(models.InternalSource, pk=pk)
-        ret = create_repository_metadata(pk)
+        deploy = get_object_or_404(models.InternalSource, pk=pk)
+        ret = request_repository_metadata(deploy)
 
         return Response(
             {'detail': ret},
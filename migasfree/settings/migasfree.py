@@ -22,6 +22,11 @@ MIGASFREE_APP_DIR = BASE_DIR
 MIGASFREE_PROJECT_DIR = os.path.dirname(MIGASFREE_APP_DIR)
 MIGASFREE_TMP_DIR = '/tmp'
 
+# Client API requests bigger than this size (bytes) are spilled to
+# MIGASFREE_TMP_DIR, smaller ones are kept in memory (other uploads use
+# FILE_UPLOAD_MAX_MEMORY_SIZE)
+MIGASFREE_MESSAGE_MEMORY_SIZE = 5 * 1024 * 1024  # 5 MB
+
 """
 MIGASFREE_EXTERNAL_ACTIONS
 Sample:
@@ -82,3 +87,63 @@ MIGASFREE_PACKAGER_PRI_KEY = 'migasfree-packager.pri'
 # Default Computer Status
 # Values: 'intended', 'reserved', 'unknown', 'in repair', 'available' or 'unsubscribed'
 MIGASFREE_DEFAULT_COMPUTER_STATUS = 'intended'
+
+# Seconds that compiled structures (attribute sets, deployments, ...)
+# are kept in memory by each server process without checking their
+# version in the database (changes are notified by signals)
+MIGASFREE_COMPILED_CACHE_TIMEOUT = 60
+
+# Cache (alias in CACHES) and seconds to keep the deterministic parts of
+# upload_computer_info responses (faults, repositories and packages),
+# shared by computers of the same project with the same attributes in
+# deployments, policies and fault definitions rules and the same
+# schedule slots (0 = disabled). A cache backend shared by all the
+# server processes (memcached, redis, database) is recommended: the
+# default LocMem cache keeps a copy in each process.
+MIGASFREE_RESPONSE_CACHE = 'default'
+MIGASFREE_RESPONSE_CACHE_TIMEOUT = 3600
+
+# Hardware, software and errors uploads are queued and applied by the
+# upload_worker command ("python manage.py upload_worker --processes N")
+MIGASFREE_ASYNC_UPLOADS = False
+MIGASFREE_UPLOAD_MAX_ATTEMPTS = 5
+MIGASFREE_UPLOAD_RETRY_DELAY = 30  # seconds (doubled in each attempt)
+
+# Published versions of each repository kept (besides the current one)
+# to roll back metadata instantly
+MIGASFREE_REPOSITORY_GENERATIONS = 2
+
+# Repository metadata is built by the repository_worker command
+# ("python manage.py repository_worker"): requests of a deployment are
+# coalesced until no new one arrives in QUIET_PERIOD seconds (waiting
+# at most MAX_DELAY seconds since the first one)
+MIGASFREE_ASYNC_REPOSITORY_BUILDS = False
+MIGASFREE_REPOSITORY_BUILD_QUIET_PERIOD = 10
+MIGASFREE_REPOSITORY_BUILD_MAX_DELAY = 300
+
+# Seconds after which a running build is considered interrupted (its
+# process died) and marked as failed, so its deployment is built again
+# (builds whose deployment lock is free are failed before)
+MIGASFREE_REPOSITORY_BUILD_TIMEOUT = 3600
+
+# Builds of different deployments run concurrently by repository_worker
+# and rebuild_repositories, in processes with lower CPU (nice) and I/O
+# (ionice class: 1 realtime, 2 best-effort, 3 idle) priority
+MIGASFREE_REPOSITORY_BUILD_PROCESSES = 2
+MIGASFREE_REPOSITORY_BUILD_NICE = 10
+MIGASFREE_REPOSITORY_BUILD_IONICE = 3
+
+# Shell code run by the server (PMS createrepo and info, gpg): seconds
+# before killing it, bytes of output kept by stream and processes run
+# at the same time by each server process
+MIGASFREE_RUN_TIMEOUT = 1800
+MIGASFREE_RUN_MAX_OUTPUT = 10 * 1024 * 1024
+MIGASFREE_RUN_MAX_PROCESSES = 4
+
+# External sources: seconds that requests of a file being downloaded by
+# another request wait for it to grow before giving up (and timeout of
+# upstream connections), attempts to resume interrupted downloads and
+# idle keep-alive connections by upstream host (in each server process)
+MIGASFREE_SOURCE_DOWNLOAD_TIMEOUT = 60
+MIGASFREE_SOURCE_DOWNLOAD_RETRIES = 3
+MIGASFREE_SOURCE_POOL_SIZE = 4
@@ -1,7 +1,5 @@
 # -*- coding: UTF-8 -*-
 
-import os
-
 from datetime import datetime, timedelta
 
 from django.conf import settings
@@ -10,7 +8,7 @@ from django.utils.translation import ugettext_lazy as _
 
 from ..server.models import (
     Error, Fault, Message, Deployment,
-    Notification, Package, Project,
+    Notification, Package, Project, RepositoryBuild,
 )
 
 
@@ -104,33 +102,24 @@ def delayed_computers(user):
 
 
 def generating_repositories(user):
-    result = 0
-    msg = ''
-    if os.path.exists(settings.MIGASFREE_PUBLIC_DIR):
-        for item in os.listdir(settings.MIGASFREE_PUBLIC_DIR):
-            project = Project.objects.scope(user).filter(name=item)
-            if project:
-                project = project[0]
-                repos = os.path.join(
-                    settings.MIGASFREE_PUBLIC_DIR,
-                    project.name,
-                    project.pms.slug,  # FIXME duplicated path
-                    'TMP',  # FIXME hardcoded string!!!
-                    project.pms.slug
-                )
-                if os.path.exists(repos):
-                    for repo in os.listdir(repos):
-                        result += 1
-                        msg += _('%s at %s.') % (repo, project.name)
-
-    msg = _('Generating %s repositories: %s') % (result, msg)
+    """
+    Repository builds running or waiting in the queue
+    """
+    builds = RepositoryBuild.objects.filter(
+        status__in=[RepositoryBuild.STATUS_PENDING, RepositoryBuild.STATUS_RUNNING],
+        deployment__project__in=Project.objects.scope(user)
+    )
 
     return {
-        'msg': msg,
+        'msg': _('Generating repositories'),
         'target': 'server',
         'level': 'info',
-        'result': result,
-        'url': '#',
+        'result': builds.count(),
+        'url': '{}?status__in={},{}'.format(
+            reverse('admin:server_repositorybuild_changelist'),
+            RepositoryBuild.STATUS_PENDING,
+            RepositoryBuild.STATUS_RUNNING
+        ),
     }
 
 